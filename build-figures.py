@@ -1,747 +1,551 @@
 # Usage:
 #   cat network.tsv | python build-figures.py NetworkName OutputDirectory
+#   python build-figures.py NetworkName OutputDirectory --input network.tsv.bz2
+#   python build-figures.py NetworkName OutputDirectory --nquads --input prov.nq.bz2
+#   python build-figures.py NetworkName OutputDirectory --merge-shards --input 2019-09.tsv --input 2019-10.tsv
+#   python build-figures.py --batch iDigBio=idigbio.tsv.bz2 --batch GBIF=gbif.tsv.bz2
 #
 # where "network.tsv" has columns
 #   dataset_url dataset_version crawl_date
 #
+# Inputs may be bz2, gzip, xz or zstd compressed. The compression is detected from the
+# file's magic bytes.
+#
+# With --nquads, the input is a Preston provenance log and the rows are extracted as the
+# network's sparql-queries/select-*-by-activity.rq query would select them.
+#
+# With --merge-shards, each input is a query output sorted by URL then crawl time, and the
+# inputs are merged in one pass. A (URL, crawl) pair in several of them keeps its content
+# over a failed query, and differing contents are listed in shard-conflicts.tsv.
+#
+# With --batch, several networks are analyzed in one run over shared string tables, each
+# into its own NetworkName-analysis directory, and network-overlap.tsv/.txt are written.
+#
+# With --approximate, URL and content counts are estimated with HyperLogLog sketches and
+# percentages and rates from a uniform sample of URLs, in memory independent of the number
+# of distinct contents. Only approximate-report.txt, crawl-totals-approximate-df.tsv and
+# the running total and reliability figures (with their error bounds shaded) are written.
+#
+# Each stage's wall and CPU time, peak memory and throughput is printed at the end and
+# written to profile.json. With --sample-stage, that stage's Python stacks are sampled and
+# written to profile-STAGE.collapsed, which flamegraph.pl or speedscope can draw.
+#
+# With --export parquet (or arrow), the per-URL lifetimes, their runs and the per-crawl
+# totals are also written as url-lifetimes, url-runs, crawl-status-totals and crawl-totals
+# tables, which need pyarrow.
+#
+# With --report-only, no data frames or figures are built, and neither pandas nor
+# matplotlib is imported. Only the text and TSV reports are written: "totals", report.txt,
+# revert-distance-freq-dist.tsv, host-totals.tsv, content-migrations.tsv,
+# duplicate-clusters.tsv, content-cooccurrence.txt, window-report.txt and profile.json
+# (with --merge-shards, also shard-merge.txt and shard-conflicts.tsv, and with --export,
+# its tables).
+#
 # Expects "Computer Modern" font to be installed. If not installed, probably a default (ugly) font will be used instead
 #
+# The analysis itself lives in the linkrot package, which can be imported on its own.
 
 #%%
 
-import sys
 import os
-import io
+import glob
+import argparse
 
-import numpy as np
-import pandas as pd
-from enum import Enum
+import linkrot
 
 INCLUDE_LEGEND = False
 INCLUDE_TITLE = False
 FIGURE_DPI = 300
 
-# Set start/end times to None to use the timestamps of the first and last crawls
-START_TIME = "\"2019-03-01T00:00:00.000Z\"^^<http://www.w3.org/2001/XMLSchema#dateTime>"
-END_TIME = "\"2020-05-01T00:00:00.000Z\"^^<http://www.w3.org/2001/XMLSchema#dateTime>"
+# Typeset figure text with LaTeX
+USE_LATEX = True
 
-MAKE_URL_UNAVAILABLE_HISTOGRAM = False
-MAKE_URL_UNSTABLE_HISTOGRAM = False
+# Number of processes figures are drawn in (--figure-workers)
+FIGURE_WORKERS = 1
 
-MAKE_CRAWL_STATUS_COUNTS_PER_CRAWL_BAR_GRAPH = False
-MAKE_CRAWL_STATUS_COUNTS_OVER_TIME_BAR_GRAPH = False
+# Only redraw figures whose data or style changed since the last run into the output
+# directory
+CACHE_FIGURES = True
 
-# TODO: pretty command line interface
-#  - turn on/off annotations
-#  - choose which results/figures to save
-#  - use non-LaTeX fonts
-#  - set figure dpi
-#  - set figure time frames
+# Where matplotlib keeps the LaTeX output of figure text between runs. None leaves it in
+# matplotlib's cache directory (~/.cache/matplotlib/tex.cache)
+LATEX_CACHE_DIRECTORY = None
 
-try:
-    INTERACTIVE = (get_ipython().__class__.__name__ == "ZMQInteractiveShell")
-except NameError:
-    INTERACTIVE = False
+# Only write the text and TSV reports, skipping the data frames and figures (--report-only)
+REPORT_ONLY = False
 
+# Write host-totals.tsv, with report.txt's counts for each host, and the worst-hosts
+# figure. URLs are grouped by host and their first GROUP_PATH_DEPTH path segments
+# (--group-path-depth), e.g. 1 to tell apart IPT instances of a shared host
+GROUP_BY_HOST = True
+GROUP_PATH_DEPTH = 0
 
-output_directory = None
-data_path = None
+# Number of hosts in the worst-hosts figure (--worst-hosts); 0 leaves it out
+NUM_WORST_HOSTS = 20
 
-if not INTERACTIVE:
-    network_name = sys.argv[1] if len(sys.argv) > 1 else "Network"
-    output_directory = sys.argv[2] if len(sys.argv) > 2 else None
-else:
-    network_name = "BHL"
-    data_path = "./bhl.tsv" #"./idigbio.tsv"
+# Index which URLs returned each content, and write content-migrations.tsv (content whose
+# URL died and that another URL later returned), duplicate-clusters.tsv (URLs linked by
+# content they share), content-cooccurrence.txt and the content-migrations figure. Not
+# available with --max-memory or --append, which keep no content IDs (--no-content-index)
+INDEX_CONTENTS = True
 
-if output_directory == None:
-    output_directory = "./" + network_name.lower().replace(" ", "-") + "-analysis/"
+# Write window-report.txt for the crawls from START_TIME to END_TIME (--no-window-report).
+# Any other window, or rolling windows, can be reported with rolling-windows.py
+WINDOW_REPORT = True
 
-try:
-    os.mkdir(output_directory)
-except OSError:
-    # Hopefully the directory was already created
-    pass
+# Also write the analysis as tables for other tools: "parquet", "arrow" (uncompressed
+# Arrow IPC files, which can be memory-mapped) or None (--export)
+EXPORT_FORMAT = None
 
-print("Saving output in %s" % str(output_directory))
+# Estimate the totals from sketches and a sample of URLs rather than every lifetime
+# (--approximate)
+APPROXIMATE = False
 
-#%%
+# Each approximate URL or content count uses 2 ** SKETCH_PRECISION one-byte registers per
+# crawl; its standard error is 1.04 / sqrt(2 ** SKETCH_PRECISION)
+SKETCH_PRECISION = 14
 
-SKIP_HEADER = True
-if SKIP_HEADER:
-    sys.stdin.readline()
+# Number of URLs whose lifetimes the approximate percentages and rates are estimated from
+SAMPLE_SIZE = 10000
 
-all_url_queries = dict()
-crawl_times = list()
-crawl_times_set = set()
+# Time each stage of the run, print a summary and write profile.json into the output
+# directory (or the --batch-directory)
+PROFILE_STAGES = True
 
-if data_path:
-    file = open(data_path, "r")
-    sys.stdin = io.StringIO(file.read())
+# Sample the Python stack through this stage (e.g. "ingest", "lifetimes", "rendering") and
+# write its stacks to profile-STAGE.collapsed, for flame graph tools (--sample-stage)
+SAMPLE_STAGE = None
 
-for line in sys.stdin:
-    # Remove \n and get tsv column values
-    parts = line[:-1].split("\t")
-    url = parts[0]
-    content = parts[1]
-    crawl_time = parts[2]
+# Seconds of CPU time between stack samples (--sample-interval)
+SAMPLE_INTERVAL = 0.005
 
-    crawl_times_set.add(crawl_time)
+# The time frame of the figures over time, and of window-report.txt (report.txt's numbers
+# over only the crawls in it). Set start/end times to None to use the timestamps of the
+# first and last crawls
+START_TIME = "\"2019-03-01T00:00:00.000Z\"^^<http://www.w3.org/2001/XMLSchema#dateTime>"
+END_TIME = "\"2020-05-01T00:00:00.000Z\"^^<http://www.w3.org/2001/XMLSchema#dateTime>"
 
-    if url not in all_url_queries:
-        all_url_queries[url] = dict()
-    all_url_queries[url][crawl_time] = content
+MAKE_URL_UNAVAILABLE_HISTOGRAM = False
+MAKE_URL_UNSTABLE_HISTOGRAM = False
 
-crawl_times = list(crawl_times_set)
-crawl_times.sort()
-num_crawls = len(crawl_times)
+MAKE_CRAWL_STATUS_COUNTS_PER_CRAWL_BAR_GRAPH = False
+MAKE_CRAWL_STATUS_COUNTS_OVER_TIME_BAR_GRAPH = False
 
-if data_path:
-    file.close()
+# "tsv" reads (url, content, crawl time) rows of query output. The header line of each
+#   input file is skipped
+# "nquads" extracts those rows from a Preston provenance log, without tdbloader/tdbquery
+INPUT_FORMAT = "tsv"
 
-#%%
+# With "nquads" input, which sparql-queries/select-*-by-activity.rq to follow: "idigbio",
+# "gbif", "bhl" or "dataone". None picks it from the network name
+QUERY_SHAPE = None
 
-class Status(Enum):
-    UNKNOWN             = 0    # Did not check for content
-    FIRST_CONTENT       = 1    # Returned content for the first time
-    SAME_CONTENT        = 2    # Returned the same content as the last successful query
-    CHANGED_CONTENT     = 3    # Returned new content
-    OLD_CONTENT         = 4    # Returned previously seen content that is different from the previous successful data
-    BECAME_UNRESPONSIVE = 5    # Failed to return content after a successful query
-    STILL_UNRESPONSIVE  = 6    # Failed to return content again
-    ERROR               = 7    # Returned malformed content
-
-class UrlLifetime:
-    def __init__(self):
-        self.statuses = []
-        self.contents = []
-
-        self.first_crawl_position = None
-        self.last_crawl_position = None
-        self.last_known_status = Status.UNKNOWN
-        self.first_response_position = None
-        self.first_change_position = None
-        self.first_break_position = None
-
-        self.num_resolves = 0
-        self.num_breaks = 0
-        self.num_contents = 0
-        self.num_content_changes = 0
+# "dict" reads every (url, crawl) -> content string into nested dicts
+# "stream" interns URLs, contents and crawl times into integer IDs as rows are read
+# "external" sorts rows by URL on disk and builds one URL's lifetime at a time (--max-memory)
+# None picks "stream" for --input files, so that their parsed rows are cached (see
+# CACHE_OBSERVATIONS), and "dict" for stdin (--ingest-mode)
+INGEST_MODE = None
 
+# Bytes of rows the "external" mode buffers in memory before spilling them to disk
+MAX_MEMORY = 1 << 30
 
-#%%
+# Merge the --input files as shards sorted by URL then crawl time, resolving (URL, crawl)
+# pairs found in several of them rather than keeping whichever was read last
+# (--merge-shards). Sort a query output with: LC_ALL=C sort -t$'\t' -k1,1 -k3,3
+MERGE_SHARDS = False
 
-### Collect the contents seen over the course of each URL's lifetime
+# In "stream" mode (the default for --input files), save the interned rows of --input files
+# in the output directory and memory-map them on later runs over the same inputs
+CACHE_OBSERVATIONS = True
+
+# With the "matrix" engine, save every URL's lifetime summary in the output directory so
+# that later crawls can be added with --append
+SAVE_ANALYSIS_STATE = True
+
+# Number of processes the "matrix" engine splits URLs across
+NUM_WORKERS = 1
+
+# "loop" builds one UrlLifetime per URL in pure Python, and packs its runs of unchanged
+#   status and content into arrays, so memory grows with status changes, not crawls
+# "matrix" builds every lifetime at once from a dense URL x crawl array of content IDs
+LIFETIME_ENGINE = "loop"
+
+# TODO: pretty command line interface
+#  - turn on/off annotations
+#  - choose which results/figures to save
+#  - use non-LaTeX fonts
+#  - set figure dpi
+#  - set figure time frames
 
-def content_is_missing(content):
-    return str(content).startswith("<http")
+MEMORY_SIZE_UNITS = { "" : 1, "K" : 1 << 10, "M" : 1 << 20, "G" : 1 << 30, "T" : 1 << 40 }
 
-def build_url_lifetime(queries, crawl_times):
-    lifetime = UrlLifetime()
+def parse_memory_size(text):
+    # "4G", "512M", "1.5GB" or a number of bytes
+    text = text.strip().upper()
+    if text.endswith("B"):
+        text = text[:-1]
+    unit = text[-1:] if text[-1:] in MEMORY_SIZE_UNITS else ""
+    return int(float(text[:len(text) - len(unit)]) * MEMORY_SIZE_UNITS[unit])
 
-    statuses = [Status.UNKNOWN] * len(crawl_times)
-    contents = [None] * len(crawl_times)
+try:
+    INTERACTIVE = (get_ipython().__class__.__name__ == "ZMQInteractiveShell")
+except NameError:
+    INTERACTIVE = False
 
-    for (crawl, content) in queries.items():
-        i = crawl_times.index(crawl)
-        contents[i] = content
 
-    # Fill statuses and stuff
-    was_alive = True
-    most_recent_content = None
-    for i, content in enumerate(contents):
+output_directory = None
+input_paths = []
+append_paths = []
+batch_inputs = dict()
+batch_directory = "./"
 
-        if content is not None:
-        # Became unresponsive
-            if content_is_missing(content):
-                if was_alive:
-                    status = Status.BECAME_UNRESPONSIVE
-                    lifetime.num_breaks += 1
+if not INTERACTIVE:
+    parser = argparse.ArgumentParser(description="Build URL/content reliability figures and reports for a network.")
+    parser.add_argument("network_name", nargs="?", default=None)
+    parser.add_argument("output_directory", nargs="?", default=None)
+    parser.add_argument("-i", "--input", dest="input_paths", action="append", default=[], metavar="PATH",
+        help="read rows from PATH instead of stdin; repeat to read several files in order")
+    parser.add_argument("--nquads", action="store_true",
+        help="read Preston provenance logs (e.g. prov.nq.bz2) and extract rows as the network's by-activity query would")
+    parser.add_argument("--query-shape", choices=["idigbio", "gbif", "bhl", "dataone"],
+        help="by-activity query to follow with --nquads (default: from the network name)")
+    parser.add_argument("--merge-shards", action="store_true",
+        help="merge the --input files, each sorted by URL then crawl time, keeping content over failed queries and listing disagreements")
+    parser.add_argument("--ingest-mode", choices=["dict", "stream"],
+        help="how rows are read: \"stream\" interns them into integer IDs and caches the parsed --input files (default: stream for --input files, dict for stdin)")
+    parser.add_argument("--no-cache", action="store_true",
+        help="neither read nor write the parsed-input cache (kept in stream mode only) and the figure cache")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, metavar="N",
+        help="compute lifetimes with the matrix engine in N processes, each handling a shard of the URLs")
+    parser.add_argument("--figure-workers", type=int, default=FIGURE_WORKERS, metavar="N",
+        help="draw figures in N processes")
+    parser.add_argument("--max-memory", metavar="SIZE",
+        help="sort rows on disk, buffering about SIZE (e.g. 4G) of them in memory, for inputs larger than RAM")
+    parser.add_argument("--batch", dest="batch_inputs", action="append", default=[], metavar="NETWORK=PATH",
+        help="analyze several networks in one run, sharing parsed strings; repeat for each network (or file of a network)")
+    parser.add_argument("--batch-directory", default=batch_directory, metavar="DIR",
+        help="with --batch, where the NetworkName-analysis directories and network-overlap report are written")
+    parser.add_argument("--report-only", action="store_true",
+        help="only write the text and TSV reports (totals, report.txt, host-totals.tsv, content-migrations.tsv, duplicate-clusters.tsv, content-cooccurrence.txt, window-report.txt and the like); do not build data frames or figures")
+    parser.add_argument("--group-path-depth", type=int, default=GROUP_PATH_DEPTH, metavar="N",
+        help="group URLs in host-totals.tsv by host and their first N path segments (default: %d)" % GROUP_PATH_DEPTH)
+    parser.add_argument("--worst-hosts", type=int, default=NUM_WORST_HOSTS, metavar="N",
+        help="number of hosts in the worst-hosts figure, 0 for none (default: %d)" % NUM_WORST_HOSTS)
+    parser.add_argument("--no-content-index", action="store_true",
+        help="do not index which URLs returned each content, or write the content migration and duplicate cluster reports")
+    parser.add_argument("--no-window-report", action="store_true",
+        help="do not write window-report.txt for the crawls from START_TIME to END_TIME")
+    parser.add_argument("--export", choices=linkrot.EXPORT_FORMATS, metavar="FORMAT",
+        help="also write the lifetimes and per-crawl totals as parquet or arrow tables (needs pyarrow)")
+    parser.add_argument("--approximate", action="store_true",
+        help="estimate totals from sketches and a sample of URLs, in memory independent of the number of contents")
+    parser.add_argument("--sketch-precision", type=int, default=SKETCH_PRECISION, metavar="P",
+        help="with --approximate, use 2^P registers per count (default: %d)" % SKETCH_PRECISION)
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE, metavar="N",
+        help="with --approximate, number of URLs to estimate percentages and rates from (default: %d)" % SAMPLE_SIZE)
+    parser.add_argument("--no-profile", action="store_true",
+        help="do not time the stages of the run or write profile.json")
+    parser.add_argument("--sample-stage", metavar="STAGE",
+        help="sample the Python stack through this stage (e.g. ingest, lifetimes, rendering) into profile-STAGE.collapsed")
+    parser.add_argument("--sample-interval", type=float, default=SAMPLE_INTERVAL, metavar="SECONDS",
+        help="CPU seconds between stack samples with --sample-stage (default: %g)" % SAMPLE_INTERVAL)
+    parser.add_argument("--append", dest="append_paths", action="append", default=[], metavar="PATH",
+        help="add the crawls in PATH, which must be newer than every analyzed crawl, to the analysis a matrix-engine run saved in the output directory")
+    args = parser.parse_args()
+
+    network_name = args.network_name or "Network"
+    output_directory = args.output_directory
+    input_paths = args.input_paths
+    append_paths = args.append_paths
+    NUM_WORKERS = args.workers
+    GROUP_PATH_DEPTH = args.group_path_depth
+    NUM_WORST_HOSTS = args.worst_hosts
+    FIGURE_WORKERS = args.figure_workers
+    if args.nquads:
+        INPUT_FORMAT = "nquads"
+        QUERY_SHAPE = args.query_shape
+    if NUM_WORKERS > 1:
+        LIFETIME_ENGINE = "matrix"
+    if args.ingest_mode:
+        INGEST_MODE = args.ingest_mode
+    if args.max_memory:
+        if NUM_WORKERS > 1 or append_paths or args.ingest_mode:
+            parser.error("--max-memory cannot be combined with --workers, --append or --ingest-mode")
+        INGEST_MODE = "external"
+        LIFETIME_ENGINE = "loop"
+        MAX_MEMORY = parse_memory_size(args.max_memory)
+    if args.merge_shards:
+        if args.nquads or not (input_paths or append_paths):
+            parser.error("--merge-shards needs query output --input or --append files, not --nquads or stdin")
+        MERGE_SHARDS = True
+    if args.no_cache:
+        CACHE_OBSERVATIONS = False
+        CACHE_FIGURES = False
+    if args.report_only:
+        REPORT_ONLY = True
+    if args.no_content_index:
+        INDEX_CONTENTS = False
+    if args.no_window_report:
+        WINDOW_REPORT = False
+    EXPORT_FORMAT = args.export
+    if args.approximate:
+        if NUM_WORKERS > 1 or append_paths or args.max_memory or args.merge_shards or args.export:
+            parser.error("--approximate cannot be combined with --workers, --append, --max-memory, --merge-shards or --export")
+        APPROXIMATE = True
+        SKETCH_PRECISION = args.sketch_precision
+        SAMPLE_SIZE = args.sample_size
+    if args.no_profile:
+        if args.sample_stage:
+            parser.error("--sample-stage cannot be combined with --no-profile")
+        PROFILE_STAGES = False
+    SAMPLE_STAGE = args.sample_stage
+    SAMPLE_INTERVAL = args.sample_interval
+    if args.batch_inputs:
+        if args.network_name or args.output_directory or input_paths or append_paths or args.max_memory or args.query_shape or args.merge_shards:
+            parser.error("--batch takes no network name, output directory, --input, --append, --max-memory, --query-shape or --merge-shards")
+        for batch_input in args.batch_inputs:
+            (batch_network, _, batch_path) = batch_input.partition("=")
+            if not batch_path:
+                parser.error("--batch expects NETWORK=PATH, not %s" % batch_input)
+            batch_inputs.setdefault(batch_network, []).append(batch_path)
+        batch_directory = os.path.join(args.batch_directory, "")
+else:
+    network_name = "BHL"
+    input_paths = ["./bhl.tsv"] #"./idigbio.tsv"
 
-        # Still unresponsive
-                else:
-                    status = Status.STILL_UNRESPONSIVE
+if append_paths:
+    # Appending folds new rows into saved LifetimeColumns
+    input_paths = append_paths
+    INGEST_MODE = "stream"
+    LIFETIME_ENGINE = "matrix"
+    CACHE_OBSERVATIONS = False
 
-                was_alive = False
-            
-                if lifetime.first_break_position is None:
-                    lifetime.first_break_position = i
+if INGEST_MODE is None:
+    INGEST_MODE = "stream" if input_paths else "dict"
 
-        # First content
-            else:
-                if most_recent_content == None:
-                    status = Status.FIRST_CONTENT
-                    most_recent_content = content
-                    lifetime.num_contents += 1
-                    lifetime.first_response_position = i
+if INPUT_FORMAT == "nquads" and QUERY_SHAPE is None:
+    QUERY_SHAPE = network_name.lower()
 
-        # Same content
-                elif content == most_recent_content:
-                    status = Status.SAME_CONTENT
+def network_output_directory(network_name, parent_directory="./"):
+    return parent_directory + network_name.lower().replace(" ", "-") + "-analysis/"
 
-                else:
-        # Old content
-                    if content in lifetime.contents[0:i]:
-                        status = Status.OLD_CONTENT
+if batch_inputs:
+    output_directories = { network : network_output_directory(network, batch_directory) for network in batch_inputs }
+    os.makedirs(batch_directory, exist_ok=True)
+else:
+    if output_directory == None:
+        output_directory = network_output_directory(network_name)
+    output_directories = { network_name : os.path.join(output_directory, "") }
 
-        # Changed content
-                    else:
-                        status = Status.CHANGED_CONTENT
-                        if lifetime.first_change_position is None:
-                            lifetime.first_change_position = i
-                        lifetime.num_contents += 1
+if append_paths:
+    # Only the "matrix" engine saves the state --append folds crawls into
+    state_directory = output_directories[network_name] + "analysis-state/"
+    if not all(os.path.exists(state_directory + name) for name in ["urls.txt", "contents.txt", "lifetimes.npz"]):
+        parser.error("--append needs the analysis state an earlier run saved in %s, and there is none; run once over the "
+            "full history with the matrix engine (--workers 2 or more, or LIFETIME_ENGINE = \"matrix\") to save it" % state_directory)
 
-                    most_recent_content = content
-                    lifetime.num_content_changes += 1
+for output_directory in output_directories.values():
+    try:
+        os.mkdir(output_directory)
+    except OSError:
+        # Hopefully the directory was already created
+        pass
 
-                was_alive = True
-                lifetime.num_resolves += 1
+    print("Saving output in %s" % str(output_directory))
 
-            lifetime.last_known_status = status
+analysis_state_directories = { network : output_directories[network] + "analysis-state/" for network in output_directories }
+profile_directory = batch_directory if batch_inputs else output_directories[network_name]
 
-            if lifetime.first_crawl_position is None:
-                lifetime.first_crawl_position = i
-            lifetime.last_crawl_position = i
+profile = linkrot.RunProfile(SAMPLE_STAGE, SAMPLE_INTERVAL) if PROFILE_STAGES else None
 
-        # Unknown
-        else:
-            status = Status.UNKNOWN
+#%%
 
-        statuses[i] = status
+if APPROXIMATE:
+    analyses = {
+        network : linkrot.analyze_approximately(
+            paths,
+            input_format=INPUT_FORMAT,
+            query_shape=network.lower() if batch_inputs else QUERY_SHAPE,
+            precision=SKETCH_PRECISION,
+            sample_size=SAMPLE_SIZE,
+            profile=profile,
+        )
+        for (network, paths) in (batch_inputs or { network_name : input_paths }).items()
+    }
+elif batch_inputs:
+    batch = linkrot.analyze_networks(
+        batch_inputs,
+        lifetime_engine=LIFETIME_ENGINE,
+        input_format=INPUT_FORMAT,
+        query_shapes={ network : network.lower() for network in batch_inputs },
+        num_workers=NUM_WORKERS,
+        state_directories=analysis_state_directories if SAVE_ANALYSIS_STATE else None,
+        index_contents=INDEX_CONTENTS,
+        profile=profile,
+    )
+    analyses = batch.analyses
+    print(linkrot.write_overlap_report(batch, batch_directory))
+else:
+    analysis = linkrot.analyze(
+        input_paths,
+        ingest_mode=INGEST_MODE,
+        lifetime_engine=LIFETIME_ENGINE,
+        input_format=INPUT_FORMAT,
+        query_shape=QUERY_SHAPE,
+        num_workers=NUM_WORKERS,
+        max_memory=MAX_MEMORY,
+        cache_directory=(output_directory + "observations-cache/") if CACHE_OBSERVATIONS else None,
+        state_directory=analysis_state_directories[network_name] if SAVE_ANALYSIS_STATE or append_paths else None,
+        append=len(append_paths) > 0,
+        index_contents=INDEX_CONTENTS,
+        merge_shards=MERGE_SHARDS,
+        profile=profile,
+    )
+    analyses = { network_name : analysis }
 
-    lifetime.contents = contents
-    lifetime.statuses = statuses
-    return lifetime
+    crawl_times = analysis.crawl_times
+    num_crawls = analysis.num_crawls
+    lifetime_totals = analysis.totals
 
 # url = '<http://65.52.215.125/ipt/eml.do?r=eggs>'
-# lifetime = build_url_lifetime(all_url_queries[url], crawl_times)
+# lifetime = analysis.url_lifetimes[url]
 # print("Lifetime for %s\n" % url)
 # print("\n".join(["%d:\t%s\t%s" % (i, lifetime.statuses[i], lifetime.contents[i]) for i in range(num_crawls)]))
 
 #%%
 
-all_url_lifetimes = { url : build_url_lifetime(all_url_queries[url], crawl_times) for url in all_url_queries }
+# What --append cannot rebuild, as it keeps neither content IDs nor runs. Copies from an
+# earlier run would describe the history before the appended crawls, so they are removed
+APPEND_STALE_FILES = [
+    "content-cooccurrence.txt", "content-migrations.tsv", "duplicate-clusters.tsv", "content-migrations-df.tsv",
+    "content-migrations*.pdf", "content-migrations*.png", "window-report.txt", "url-runs.parquet", "url-runs.arrow",
+]
+
+host_totals = dict()
+content_migrations = dict()
+with linkrot.profile_stage(profile, "report"):
+    for (network_name, analysis) in analyses.items():
+        if append_paths:
+            stale_paths = [path for pattern in APPEND_STALE_FILES for path in sorted(glob.glob(output_directories[network_name] + pattern))]
+            for path in stale_paths:
+                os.remove(path)
+            print("Appending keeps no content IDs or runs, so the content co-occurrence reports, window-report.txt and url-runs are not written%s"
+                % ("; removed the out of date %s" % ", ".join(os.path.basename(path) for path in stale_paths) if stale_paths else ""))
+        if APPROXIMATE:
+            text_report = linkrot.write_approximate_report(analysis, output_directories[network_name])
+        else:
+            text_report = linkrot.write_report(analysis.totals, output_directories[network_name])
+
+        # Loaded from the observations cache, the shards were not merged again
+        if not APPROXIMATE and analysis.shard_conflicts is not None:
+            text_report += "\n" + linkrot.write_merge_report(analysis.shard_conflicts, output_directories[network_name])
+
+        # The "external" mode keeps no per-URL arrays to group
+        if GROUP_BY_HOST and not APPROXIMATE and analysis.lifetimes is not None:
+            host_totals[network_name] = linkrot.group_totals(analysis.lifetimes, analysis.num_crawls, GROUP_PATH_DEPTH)
+            linkrot.write_group_totals(host_totals[network_name], output_directories[network_name], "host" if GROUP_PATH_DEPTH == 0 else "host_path")
+
+        # Only the "loop" and "matrix" engines (without --append) keep content IDs to index
+        if not APPROXIMATE and analysis.content_index is not None:
+            lifetimes = analysis.lifetimes
+            content_migrations[network_name] = linkrot.content_migrations(analysis.content_index, lifetimes, analysis.num_crawls)
+            url_clusters, content_clusters = linkrot.duplicate_clusters(analysis.content_index, len(lifetimes.urls))
+            text_report += "\n" + linkrot.write_cooccurrence_report(
+                analysis.content_index, content_migrations[network_name], linkrot.cluster_summary(url_clusters, content_clusters, lifetimes.urls),
+                lifetimes.urls, lifetimes.content_strings, analysis.crawl_times, output_directories[network_name])
+
+        # The same engines keep the runs windows are counted from
+        if WINDOW_REPORT and not APPROXIMATE and analysis.url_lifetimes is not None:
+            with linkrot.profile_stage(profile, "windows"):
+                window_index = linkrot.build_window_index(analysis.lifetimes, analysis.totals, analysis.crawl_times)
+            try:
+                window = window_index.crawl_range(START_TIME, END_TIME)
+            except ValueError as error:
+                print("%s; window-report.txt not written" % error)
+            else:
+                text_report += "\n" + linkrot.write_window_report(window_index, *window, output_directories[network_name])
+        if len(analyses) > 1:
+            print(network_name)
+        print(text_report)
 
 #%%
 
-content_first_crawl_positions = dict()
-for lifetime in all_url_lifetimes.values():
-    for i, content in enumerate(lifetime.contents):
-        if not content_is_missing(content):
-            current_first = content_first_crawl_positions[content] if content in content_first_crawl_positions else num_crawls
-            content_first_crawl_positions[content] = min(i, current_first)
+if EXPORT_FORMAT is not None and not APPROXIMATE:
+    with linkrot.profile_stage(profile, "export"):
+        for (network_name, analysis) in analyses.items():
+            for path in linkrot.write_export(analysis, output_directories[network_name], EXPORT_FORMAT):
+                print("Exported %s" % path)
 
 #%%
 
 ### Build figures
 
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import rc
-import datetime
-from itertools import cycle, islice
+for (network_name, analysis) in analyses.items():
+    if REPORT_ONLY:
+        break
+    output_directory = output_directories[network_name]
+
+    if APPROXIMATE:
+        with linkrot.profile_stage(profile, "aggregation"):
+            crawl_totals_df = analysis.crawl_totals_frame()
+            crawl_totals_df.to_csv(output_directory + "crawl-totals-approximate-df.tsv", sep='\t')
+
+        linkrot.build_approximate_figures(
+            analysis,
+            network_name + " (approximate)",
+            output_directory,
+            start_time=START_TIME,
+            end_time=END_TIME,
+            dpi=FIGURE_DPI,
+            usetex=USE_LATEX,
+            num_workers=FIGURE_WORKERS,
+            cache_directory=(output_directory + "figure-cache/") if CACHE_FIGURES else None,
+            tex_cache_directory=LATEX_CACHE_DIRECTORY,
+            profile=profile,
+            crawl_totals_df=crawl_totals_df,
+        )
+        continue
+
+    with linkrot.profile_stage(profile, "aggregation"):
+        crawl_status_totals_df, crawl_totals_df = linkrot.crawl_frames(analysis.totals, analysis.crawl_times)
+        crawl_status_totals_df.to_csv(output_directory + "crawl-status-totals-df.tsv", sep='\t')
+
+        worst_hosts_df = None
+        if network_name in host_totals and NUM_WORST_HOSTS > 0:
+            worst_hosts_df = linkrot.worst_groups_frame(host_totals[network_name], NUM_WORST_HOSTS)
+
+        migrations_df = None
+        if network_name in content_migrations:
+            migrations_df = linkrot.migrations_frame(content_migrations[network_name], analysis.crawl_times)
+            migrations_df.to_csv(output_directory + "content-migrations-df.tsv", sep='\t')
+
+    linkrot.build_figures(
+        analysis.totals,
+        analysis.crawl_times,
+        network_name,
+        output_directory,
+        start_time=START_TIME,
+        end_time=END_TIME,
+        dpi=FIGURE_DPI,
+        usetex=USE_LATEX,
+        status_counts_per_crawl=MAKE_CRAWL_STATUS_COUNTS_PER_CRAWL_BAR_GRAPH,
+        status_counts_over_time=MAKE_CRAWL_STATUS_COUNTS_OVER_TIME_BAR_GRAPH,
+        unstable_histogram=MAKE_URL_UNSTABLE_HISTOGRAM,
+        unavailable_histogram=MAKE_URL_UNAVAILABLE_HISTOGRAM,
+        num_workers=FIGURE_WORKERS,
+        cache_directory=(output_directory + "figure-cache/") if CACHE_FIGURES else None,
+        tex_cache_directory=LATEX_CACHE_DIRECTORY,
+        profile=profile,
+        frames=(crawl_status_totals_df, crawl_totals_df),
+        worst_groups_df=worst_hosts_df,
+        migrations_df=migrations_df,
+    )
 
-rc("text", usetex=False)
-rc("savefig", format="png", dpi=FIGURE_DPI)
-rc("font", size=14, family="DejaVu Sans")
+if profile is not None:
+    print(profile.summary())
+    profile.write(profile_directory)
 
 # Only do this in Jupyter Notebook
 # if INTERACTIVE:
 #     %matplotlib inline
-
-#%%
-
-crawl_status_totals = [(dict([(status, 0) for status in Status])) for crawl_times in crawl_times]
-
-for _, lifetime in all_url_lifetimes.items():
-    for i, status in enumerate(lifetime.statuses):
-        crawl_status_totals[i][status] += 1
-
-crawl_status_totals_df = pd.DataFrame(
-    index = [datetime.datetime.strptime(x, "\"%Y-%m-%dT%H:%M:%S.%fZ\"^^<http://www.w3.org/2001/XMLSchema#dateTime>") for x in crawl_times],
-    data = crawl_status_totals
-)
-
-crawl_status_totals_df.to_csv(output_directory + "crawl-status-totals-df.tsv", sep='\t')
-crawl_status_totals_df.transpose()
-
-# %%
-
-col_hex = {
-    "blue"      : "#1f77b4",
-    "orange"    : "#ff7f0e",
-    "green"     : "#2ca02c",
-    "red"       : "#d62728",
-    "purple"    : "#9467bd",
-    "brown"     : "#8c564b",
-    "pink"      : "#e377c2",
-    "gray"      : "#7f7f7f",
-    "yellow"    : "#bcbd22",
-    "teal"      : "#17becf",
-    
-    "bright green"  : "#00ff00",
-    "bright red"    : "#ff0000",
-    "green yellow"  : "#9ACD32",
-    "olive"         : "#808000"
-}
-
-fig_df = crawl_status_totals_df[[
-    Status.SAME_CONTENT,
-    Status.FIRST_CONTENT,
-    Status.OLD_CONTENT,
-    Status.CHANGED_CONTENT,
-    Status.STILL_UNRESPONSIVE,
-    Status.BECAME_UNRESPONSIVE,
-    Status.UNKNOWN,
-    Status.ERROR
-]]
-
-status_colors = {
-    Status.UNKNOWN             : "gray",
-    Status.FIRST_CONTENT       : "bright green",
-    Status.SAME_CONTENT        : "green",
-    Status.CHANGED_CONTENT     : "yellow",
-    Status.OLD_CONTENT         : "olive",
-    Status.BECAME_UNRESPONSIVE : "bright red",
-    Status.STILL_UNRESPONSIVE  : "red",
-    Status.ERROR               : "purple",
-}
-
-status_color_map = list(islice(cycle([col_hex[status_colors[x]] for x in fig_df.columns]), None, 256))
-
-#%%
-
-if MAKE_CRAWL_STATUS_COUNTS_PER_CRAWL_BAR_GRAPH:
-    figure_title = network_name + ": Stacked URL status counts per crawl"
-    output_file = output_directory + "stacked-query-status-counts-per-crawl"
-
-    ax = fig_df.plot(
-        kind="bar",
-        stacked=True,
-        width=.95,
-        color=status_color_map,
-        figsize=(15, 5),
-        legend=False
-    );
-
-    # Bare
-    plt.savefig(output_file, dpi=FIGURE_DPI);
-
-    # Annotated
-    plt.title(figure_title)
-    plt.legend()
-    plt.savefig(output_file[:-4] + "-annotated.png", dpi=FIGURE_DPI);
-
-# %%
-
-if MAKE_CRAWL_STATUS_COUNTS_OVER_TIME_BAR_GRAPH:
-    figure_title = network_name + ": Stacked URL Status Counts Over Time (Stepped)"
-    output_path = output_directory + "stacked-query-status-counts-over-time"
-
-    fig = plt.figure(figsize=(16, 5))
-    ax = fig.add_subplot(111)
-
-    # Fill in space between lines
-    x = fig_df.index.append(pd.Index([datetime.datetime.now()]))
-    y1 = pd.Series({ q : 0 for q in x })
-
-    columns = fig_df.columns
-    n = len(columns)
-    for i in range(0, n):
-        y2 = y1 + fig_df[columns[i]] + 0
-        ax.fill_between(x, y1, y2, step="post", color=status_color_map[i])
-        y1 = y2
-
-    # Bare
-    plt.savefig(output_path, dpi=FIGURE_DPI);
-
-    # Annotated
-    plt.title(figure_title)
-    plt.savefig(output_path[:-4] + "-annotated.png", dpi=FIGURE_DPI);
-
-# %%
-
-crawl_url_totals = [0] * num_crawls
-crawl_content_totals = [0] * num_crawls
-crawl_abandoned_totals = [0] * num_crawls
-crawl_first_response_totals = [0] * num_crawls
-crawl_first_break_totals = [0] * num_crawls
-crawl_first_change_totals = [0] * num_crawls
-crawl_first_unreliable_totals = [0] * num_crawls
-
-num_unresponsive = 0
-num_responsive = 0
-num_stable = 0
-num_reliable = 0
-num_abandoned = 0
-
-total_num_resolves = 0
-total_num_breaks = 0
-total_num_contents = 0
-total_num_content_changes = 0
-max_num_content_changes = 0
-
-total_num_urls = len(all_url_lifetimes)
-max_num_breaks   = total_num_urls * (np.ceil(num_crawls / 2)) # Round up; if the responsiveness is [0, 1, 0] across three crawls, there are at most two breaks
-max_num_contents = total_num_urls * (num_crawls)
-
-breakCounts = []
-content_change_counts = []
-
-for _, lifetime in all_url_lifetimes.items():
-    #if lifetime.first_crawl_position:
-    crawl_url_totals[lifetime.first_crawl_position] += 1
-
-    total_num_resolves += lifetime.num_resolves
-    total_num_breaks += lifetime.num_breaks
-    total_num_contents += lifetime.num_contents
-    total_num_content_changes += lifetime.num_content_changes
-    max_num_content_changes += lifetime.num_resolves - 1
-
-    breakCounts.append(lifetime.num_breaks)
-    content_change_counts.append(lifetime.num_content_changes)
-
-    if lifetime.num_breaks == 0:
-        num_responsive += 1
-
-    if lifetime.num_contents == 1:
-        num_stable += 1
-
-    if lifetime.num_breaks == 0 and lifetime.num_contents == 1:
-        num_reliable += 1
-
-    if lifetime.last_known_status in (Status.BECAME_UNRESPONSIVE, Status.STILL_UNRESPONSIVE):
-        num_unresponsive += 1
-
-    first_unreliable = num_crawls
-    if lifetime.first_response_position is not None:
-        crawl_first_response_totals[lifetime.first_response_position] += 1
-    
-    if lifetime.first_break_position is not None:
-        crawl_first_break_totals[lifetime.first_break_position] += 1
-        first_unreliable = lifetime.first_break_position
-
-    if lifetime.first_change_position is not None:
-        crawl_first_change_totals[lifetime.first_change_position] += 1
-        first_unreliable = min(lifetime.first_change_position, first_unreliable)
-    
-    if first_unreliable < num_crawls:
-        crawl_first_unreliable_totals[first_unreliable] += 1
-
-    # If the URL stopped being queried, find out when
-    for i, status in enumerate(lifetime.statuses[::-1]):
-        if status != Status.UNKNOWN:
-            break
-
-    if i > 0:
-        crawl_abandoned_totals[num_crawls - i] += 1
-        num_abandoned += 1
-
-for i in content_first_crawl_positions.values():
-    #if lifetime.first_crawl_position:
-    crawl_content_totals[i] += 1
-
-really_bads = list()
-for url, lifetime in all_url_lifetimes.items():
-    skip = False
-    for status in lifetime.statuses:
-        if status not in (Status.BECAME_UNRESPONSIVE, Status.STILL_UNRESPONSIVE, Status.UNKNOWN):
-            skip = True
-            break
-    if not skip:
-        really_bads.append((url, lifetime))
-
-num_never_responded = len(really_bads)
-num_responded = total_num_urls - num_never_responded
-
-num_unreliable = total_num_urls - num_reliable
-num_unstable = total_num_urls - num_stable
-num_unresponsive = total_num_urls - num_responsive
-
-
-# %%
-
-with open(output_directory + "totals", 'w') as file:
-    file.write("\n".join([ "%s\t%d" % (label, value) for (label, value) in {
-        "total_num_urls" : total_num_urls,
-        "total_num_resolves" : total_num_resolves,
-        "total_num_breaks" : total_num_breaks,
-        "total_num_contents" : total_num_contents,
-        "total_num_content_changes" : total_num_content_changes,
-        "maxnum_content_changes" : max_num_content_changes,
-        "num_never_responded" : num_never_responded,
-        "num_unreliable" : num_unreliable,
-        "num_unstable" : num_unstable,
-        "num_unresponsive" : num_unresponsive
-    }.items()]))
-
-# %%
-
-text_report = ""
-
-# Totals
-text_report += ("Of all %s observed URLs,\n"
-    % ("{0:,}".format(total_num_urls)))
-text_report += ("\t%s of URLs (%s total) were responsive\n"
-    % ("{0:.2%}".format(num_responsive / total_num_urls), "{0:,}".format(num_responsive)))
-text_report += ("\t%s of URLs (%s total) were stable\n"
-    % ("{0:.2%}".format(num_stable / num_responded), "{0:,}".format(num_stable)))
-text_report += ("\t%s of URLs (%s total) were reliable (both responsive and stable)\n"
-    % ("{0:.2%}".format(num_reliable / total_num_urls), "{0:,}".format(num_reliable)))
-text_report += ("\t%s of URLs (%s total) were responsive in the last crawl\n"
-    % ("{0:.2%}".format(num_unresponsive / total_num_urls), "{0:,}".format(num_unresponsive)))
-text_report += ("\t%s of URLs (%s total) never responded in any crawl\n"
-    % ("{0:.2%}".format(num_never_responded / total_num_urls), "{0:,}".format(num_never_responded)))
-text_report += ("\t%s of URLs (%s total) were abandoned\n"
-    % ("{0:.2%}".format(num_abandoned / total_num_urls), "{0:,}".format(num_abandoned)))
-
-# Unreliable URLs
-text_report += "\n"
-text_report += ("Of the %s unreliable URLs,\n"
-    % ("{0:,}".format(num_unreliable)))
-text_report += ("\t%s of unreliable URLs (%s total) were not always responsive\n"
-    % ("{0:.2%}".format(num_unresponsive / num_unreliable), "{0:,}".format(num_unresponsive)))
-text_report += ("\t%s of unreliable URLs (%s total) were not always stable\n"
-    % ("{0:.2%}".format(num_unstable / num_unreliable), "{0:,}".format(num_unstable)))
-
-# Behavior
-text_report += "\n"
-text_report += ("URLs break %s of the time between queries\n"
-    % ("{0:.2%}".format(total_num_breaks / (total_num_resolves + total_num_breaks))))
-text_report += ("URLs contents change %s of the time between queries\n"
-    % ("{0:.2%}".format(total_num_content_changes / max_num_content_changes)))
-
-with open(output_directory + "report.txt", "w+") as file:
-    file.write(text_report)
-
-print(text_report)
-
-#%%
-
-rc("text", usetex=True)
-rc("savefig", format="pdf", dpi=FIGURE_DPI)
-rc("font", size=14, family="serif", serif="Computer Modern")
-
-#%%
-
-breakCountFrequencies = np.unique(breakCounts, return_counts=True)
-figure_title = network_name + ": Frequency Distribution of Total Losses of Responsiveness Per URL"
-output_path = output_directory + "url-break-freq-dist"
-
-plt.plot(
-    breakCountFrequencies[0],
-    breakCountFrequencies[1],
-    "-o",
-    color="black"
-);
-ax = plt.gca()
-
-plt.xlabel("Number of losses of responsiveness");
-plt.ylabel("Number of URLs");
-
-ax.set_yticklabels(["{:,}k".format(int(y / 1000)) for y in plt.yticks()[0]]);
-
-# Bare
-plt.savefig(output_path, dpi=FIGURE_DPI);
-
-# Annotated
-plt.title(figure_title)
-plt.savefig(output_path + "-annotated", dpi=FIGURE_DPI);
-
-#%%
-
-content_change_counts = None # Unimplemented
-
-if MAKE_URL_UNAVAILABLE_HISTOGRAM or MAKE_URL_UNSTABLE_HISTOGRAM:
-    content_change_count_frequencies = np.unique(content_change_counts, return_counts=True)
-
-    maxCount = max(len(breakCountFrequencies[0]), len(content_change_count_frequencies[0]))
-
-    frequencies_df = pd.DataFrame(
-        columns=["Unresolvable", "Changed Content"],
-        index=range(maxCount),
-        data=0
-    )
-
-    for i, numBreaks in enumerate(breakCountFrequencies[0]):
-        numUrls = breakCountFrequencies[1][i]
-        frequencies_df["Unresolvable"][numBreaks] = numUrls
-
-    for i, numChanges in enumerate(content_change_count_frequencies[0]):
-        numUrls = content_change_count_frequencies[1][i]
-        frequencies_df["Changed Content"][numChanges] = numUrls
-
-#%%
-
-if MAKE_URL_UNSTABLE_HISTOGRAM:
-    figure_title = network_name + ": Frequency Distribution of Total Content Changes Per URL"
-    output_path = output_directory + "url-unstable-histogram"
-
-    plt.plot(
-        content_change_count_frequencies[0],
-        content_change_count_frequencies[1],
-        "-o",
-        color="black"
-    );
-    ax = plt.gca()
-
-    plt.xlabel("Number of content changes");
-    plt.ylabel("Number of URLs");
-
-    ax.set_yticklabels(["{:,}k".format(int(y / 1000)) for y in plt.yticks()[0]]);
-
-    # Bare
-    plt.savefig(output_path, dpi=FIGURE_DPI);
-
-    # Annotated
-    plt.title(figure_title)
-    plt.savefig(output_path + "-annotated", dpi=FIGURE_DPI);
-
-#%%
-
-if MAKE_URL_UNAVAILABLE_HISTOGRAM:
-    figure_title = network_name + ": Frequency Distribution of Breaks and Changes"
-    output_path = output_directory + "url-unavailable-histogram"
-
-    ax = frequencies_df.plot(
-        color="black",
-        style=["-+", "--o"],
-        legend=False
-    );
-
-    plt.ylabel("Number of URLs");
-    plt.xlabel("Number of queries");
-
-    ax.set_yticklabels(["{:,}k".format(int(y / 1000)) for y in plt.yticks()[0]]);
-
-    # Bare
-    plt.savefig(output_path, dpi=FIGURE_DPI);
-
-    # Annotated
-    plt.title(figure_title)
-    plt.legend()
-    plt.savefig(output_path + "-annotated", dpi=FIGURE_DPI);
-
-#%%
-
-crawl_totals_df = pd.DataFrame(
-    index   = [datetime.datetime.strptime(x, "\"%Y-%m-%dT%H:%M:%S.%fZ\"^^<http://www.w3.org/2001/XMLSchema#dateTime>") for x in crawl_times],
-)
-
-crawl_totals_df["New URLs"] = crawl_url_totals
-crawl_totals_df["New Contents"] = crawl_content_totals
-crawl_totals_df["Abandoned"] = crawl_abandoned_totals
-crawl_totals_df["First Response"] = crawl_first_response_totals
-crawl_totals_df["First Break"] = crawl_first_break_totals
-crawl_totals_df["First Change"] = crawl_first_change_totals
-crawl_totals_df["First Unreliable"] = crawl_first_unreliable_totals
-crawl_totals_df["Total URLs"] = crawl_totals_df["New URLs"].cumsum()
-crawl_totals_df["Total Contents"] = crawl_totals_df["New Contents"].cumsum()
-crawl_totals_df["Total Abandoned"] = crawl_totals_df["Abandoned"].cumsum()
-crawl_totals_df["Total Responded"] = crawl_totals_df["First Response"].cumsum()
-crawl_totals_df["Total Intermittent"] = crawl_totals_df["First Break"].cumsum()
-crawl_totals_df["Total Unstable"] = crawl_totals_df["First Change"].cumsum()
-crawl_totals_df["Total Unreliable"] = crawl_totals_df["First Unreliable"].cumsum()
-crawl_totals_df["Percent Responsive"] = 1 - crawl_totals_df["Total Intermittent"] / crawl_totals_df["Total URLs"]
-crawl_totals_df["Percent Stable"] = 1 - crawl_totals_df["Total Unstable"] / crawl_totals_df["Total Responded"]
-crawl_totals_df["Percent Reliable"] = 1 - crawl_totals_df["Total Unreliable"] / crawl_totals_df["Total URLs"]
-
-crawl_totals_df
-
-#%%
-
-start_time = START_TIME if START_TIME else crawl_times[0]
-end_time = END_TIME if END_TIME else crawl_times[-1]
-time_frame = (
-    datetime.datetime.strptime(start_time, "\"%Y-%m-%dT%H:%M:%S.%fZ\"^^<http://www.w3.org/2001/XMLSchema#dateTime>"),
-    datetime.datetime.strptime(end_time, "\"%Y-%m-%dT%H:%M:%S.%fZ\"^^<http://www.w3.org/2001/XMLSchema#dateTime>"),
-)
-
-#%%
-
-figure_title = network_name + ": Running Total of Unique URLs and Contents"
-output_path = output_directory + "running-total-urls-and-contents"
-
-df = crawl_totals_df[[
-    "Total URLs",
-    "Total Contents",
-#     "Total Abandoned"
-]]
-
-ax = df.plot(
-    color="black",
-    style=["--", ":", "-"],
-    legend=False,
-    fillstyle="none",
-    markersize=7
-);
-for i, line in enumerate(ax.get_lines()):
-    line.set_marker(["s", "D"][i])
-
-plt.xlim(time_frame);
-plt.ylim([0, max(df.max()) * 1.05])
-
-ax.set_yticklabels(["{:,}k".format(int(y / 1000)) for y in plt.yticks()[0]]);
-
-# Bare
-plt.savefig(output_path, dpi=FIGURE_DPI);
-
-# Annotated
-plt.title(figure_title)
-plt.legend()
-plt.savefig(output_path + "-annotated", dpi=FIGURE_DPI);
-
-# Export legend (https://stackoverflow.com/a/50279532)
-figsize = (2.2, .75)
-fig_leg = plt.figure(figsize=figsize)
-ax_leg = fig_leg.add_subplot(111)
-# add the legend from the previous axes
-ax_leg.legend(*ax.get_legend_handles_labels(), loc='center')
-# hide the axes frame and the x/y labels
-ax_leg.axis('off')
-fig_leg.savefig(output_path + "-legend")
-
-#%%
-
-figure_title = network_name + ": Responsiveness, Stability, Reliability Over Time"
-output_path = output_directory + "reliability-over-time"
-
-ax = crawl_totals_df[[
-    "Percent Responsive",
-    "Percent Stable",
-    "Percent Reliable"
-]].plot(
-    color="black",
-    style=["--", ":", "-"],
-    legend=False,
-    fillstyle="none",
-    markersize=8
-);
-for i, line in enumerate(ax.get_lines()):
-    line.set_marker(["x", "+", "o"][i])
-
-plt.xlim(time_frame);
-plt.ylim([0.0, 1.05]);
-ax.set_yticklabels(["{:.0%}".format(float(y)) for y in plt.yticks()[0]]);
-
-# Bare
-plt.savefig(output_path, dpi=FIGURE_DPI);
-
-# Annotated
-plt.title(figure_title)
-leg = plt.legend()
-plt.savefig(output_path + "-annotated");
-
-# Export legend (https://stackoverflow.com/a/50279532)
-figsize = (2.5, 1)
-fig_leg = plt.figure(figsize=figsize)
-ax_leg = fig_leg.add_subplot(111)
-# add the legend from the previous axes
-ax_leg.legend(*ax.get_legend_handles_labels(), loc='center')
-# hide the axes frame and the x/y labels
-ax_leg.axis('off')
-fig_leg.savefig(output_path + "-legend")
-
-
-# %%
@@ -0,0 +1,36 @@
+# Usage:
+#   python generate-crawl-history.py --urls 100000 --crawls 24 > synthetic.tsv
+#   python generate-crawl-history.py --urls 100000 | python build-figures.py Synthetic
+#
+# Writes a synthetic crawl history as (url, content, crawl time) query output, with the
+# header line, for benchmarking build-figures.py without real Preston exports.
+
+import sys
+import argparse
+
+from linkrot.synthetic import CrawlHistoryParameters, generate_crawl_history
+
+defaults = CrawlHistoryParameters()
+
+parser = argparse.ArgumentParser(description="Write a synthetic crawl history in the input format of build-figures.py.")
+parser.add_argument("--urls", dest="num_urls", type=int, default=defaults.num_urls, metavar="N")
+parser.add_argument("--crawls", dest="num_crawls", type=int, default=defaults.num_crawls, metavar="N")
+parser.add_argument("--break-probability", type=float, default=defaults.break_probability, metavar="P",
+    help="chance a responsive URL fails to respond at a crawl")
+parser.add_argument("--recover-probability", type=float, default=defaults.recover_probability, metavar="P",
+    help="chance an unresponsive URL responds again at a crawl")
+parser.add_argument("--change-probability", type=float, default=defaults.change_probability, metavar="P",
+    help="chance a responding URL returns different content")
+parser.add_argument("--revert-probability", type=float, default=defaults.revert_probability, metavar="P",
+    help="chance a content change goes back to the URL's previous content")
+parser.add_argument("--abandon-rate", type=float, default=defaults.abandon_rate, metavar="P",
+    help="chance a URL stops being queried at a crawl")
+parser.add_argument("--initial-fraction", type=float, default=defaults.initial_fraction, metavar="F",
+    help="fraction of URLs first queried in the first crawl; the rest appear uniformly later")
+parser.add_argument("--start-time", default=defaults.start_time)
+parser.add_argument("--crawl-interval-days", type=float, default=defaults.crawl_interval_days, metavar="DAYS")
+parser.add_argument("--seed", type=int, default=defaults.seed)
+args = parser.parse_args()
+
+parameters = CrawlHistoryParameters(**vars(args))
+sys.stdout.writelines(generate_crawl_history(parameters))
@@ -0,0 +1,44 @@
+# URL reliability (link rot) and content drift analysis of Preston crawl histories.
+#
+#   import linkrot
+#   analysis = linkrot.analyze(["idigbio.tsv.bz2"], ingest_mode="stream", lifetime_engine="matrix")
+#   print(linkrot.text_report(analysis.totals))
+#
+# pandas and matplotlib are only imported by the functions that build data frames and
+# figures.
+
+from .inputs import (
+    NOT_QUERIED, NO_CONTENT, MISSING_CONTENT, content_is_missing,
+    parse_crawl_time, crawl_time_ms, format_crawl_time,
+    open_input, is_header, read_input_lines, read_input_rows,
+)
+from .provenance import NQUADS_QUERY_SHAPES, ProvenanceIndex, read_provenance, provenance_rows
+from .observations import CrawlObservations, read_observations, intern_rows, read_url_queries
+from .lifetimes import (
+    Status, UrlLifetime, build_url_lifetime, LifetimeStore, LifetimeView, UrlLifetimes,
+    LifetimeColumns, LifetimeMatrix, build_lifetime_matrix, build_lifetime_matrix_from_observations,
+)
+from .state import save_analysis_state, load_analysis_state, append_crawls
+from .totals import (
+    LifetimeTotals, lifetime_totals_from_columns, crawl_status_totals_frame, crawl_totals_columns, crawl_totals_frame, crawl_frames,
+)
+from .external import ExternalSorter, sort_rows_on_disk, total_sorted_lifetimes
+from .report import (
+    totals_table, text_report, write_report, approximate_report, write_approximate_report, overlap_report, write_overlap_report,
+    window_report, write_window_report,
+)
+from .analysis import INGEST_MODES, LIFETIME_ENGINES, Analysis, analyze, analyze_observations
+from .batch import NetworkBatch, analyze_networks, network_overlap
+from .groups import url_group, url_group_ids, GroupTotals, group_totals, write_group_totals, worst_groups_frame
+from .cooccurrence import (
+    ContentIndex, build_content_index, content_index_from_lifetimes, ContentMigrations, content_migrations, duplicate_clusters,
+    ClusterSummary, cluster_summary, cooccurrence_report, write_cooccurrence_report, migrations_frame,
+)
+from .shards import ShardConflicts, shard_urls, merge_shard_urls, merge_shard_rows, read_merged_observations, merge_report, write_merge_report
+from .windows import WINDOW_COUNTS, WINDOW_FRACTIONS, WindowIndex, build_window_index, write_window_table
+from .export import EXPORT_FORMATS, EXPORT_TABLES, export_tables, write_export
+from .service import DEFAULT_PORT, FIGURE_VARIANTS, FIGURE_FORMATS, NotFound, AnalysisService, ServiceRequestHandler, check_socket_path, make_server
+from .approximate import CrawlSketches, UrlSample, ApproximateAnalysis, analyze_approximately
+from .profiling import RunProfile, StageRecord, StackSampler, profile_stage
+from .synthetic import CrawlHistoryParameters, generate_crawl_history, write_crawl_history
+from .figures import FigureJob, figure_jobs, render_figures, build_figures, approximate_figure_jobs, build_approximate_figures
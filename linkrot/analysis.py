@@ -0,0 +1,205 @@
+# Reading a network's rows and totalling its URL lifetimes, with any combination of
+# ingest mode and lifetime engine
+
+import tempfile
+
+from .inputs import read_input_rows
+from .observations import read_observations, read_url_queries, observations_cache_key, save_observations_cache, load_observations_cache
+from .lifetimes import LifetimeStore, LifetimeMatrix, UrlLifetimes, build_url_lifetime, build_lifetime_matrix, build_lifetime_matrix_from_observations
+from .state import save_analysis_state, load_analysis_state, append_crawls
+from .totals import lifetime_totals_from_columns
+from .external import sort_rows_on_disk, total_sorted_lifetimes
+from .cooccurrence import content_index_from_lifetimes
+from .shards import ShardConflicts, merge_shard_urls, merge_shard_rows, read_merged_observations
+from .profiling import profile_stage
+
+INGEST_MODES = ["dict", "stream", "external"]
+LIFETIME_ENGINES = ["loop", "matrix"]
+
+class Analysis:
+    # The crawl axis and network-wide totals of a network, and whatever the ingest mode
+    # and lifetime engine kept along the way (None otherwise)
+
+    def __init__(self, crawl_times, totals):
+        self.crawl_times = crawl_times
+        self.totals = totals
+
+        self.observations = None        # "stream" CrawlObservations
+        self.url_queries = None         # "dict" { url : { crawl time : content } }
+        self.lifetime_store = None      # "loop" LifetimeStore
+        self.lifetime_matrix = None     # "matrix" LifetimeMatrix, or LifetimeColumns after appending
+        self.content_index = None       # ContentIndex, if asked for and the engine kept content IDs
+        self.shard_conflicts = None     # ShardConflicts, if input shards were merged (and not loaded from the cache)
+
+    @property
+    def lifetimes(self):
+        # The per-URL lifetime arrays the engine kept (LifetimeStore, LifetimeMatrix or
+        # LifetimeColumns), or None in "external" mode
+        return self.lifetime_store if self.lifetime_store is not None else self.lifetime_matrix
+
+    @property
+    def url_lifetimes(self):
+        # { url : LifetimeView }, or None if no engine kept every URL's statuses
+        for lifetimes in [self.lifetime_store, self.lifetime_matrix]:
+            if isinstance(lifetimes, (LifetimeStore, LifetimeMatrix)):
+                return UrlLifetimes(lifetimes)
+        return None
+
+    @property
+    def num_crawls(self):
+        return len(self.crawl_times)
+
+def analyze(input_paths=(), ingest_mode="dict", lifetime_engine="loop", input_format="tsv", query_shape=None, skip_header=True,
+        num_workers=1, max_memory=1 << 30, cache_directory=None, state_directory=None, append=False, index_contents=False,
+        merge_shards=False, profile=None):
+    # Reads rows from input_paths (stdin if empty) and totals every URL's lifetime.
+    #  - cache_directory: in "stream" mode, where parsed --input files are cached
+    #  - state_directory: with the "matrix" engine, where lifetimes are saved for appending
+    #  - append: fold the rows into the lifetimes saved in state_directory
+    #  - index_contents: build a ContentIndex of which URLs returned each content, unless
+    #    the lifetimes keep no content IDs ("external" mode, or after appending)
+    #  - merge_shards: input_paths are shards sorted by URL then crawl time, to merge into
+    #    one row per (URL, crawl) pair (see merge_shard_rows)
+    #  - profile: a RunProfile to record the "ingest", "lifetimes", "totals" and "index"
+    #    stages in
+    if ingest_mode not in INGEST_MODES:
+        raise ValueError("Unknown ingest mode %s; pick one of %s" % (ingest_mode, ", ".join(INGEST_MODES)))
+    if lifetime_engine not in LIFETIME_ENGINES:
+        raise ValueError("Unknown lifetime engine %s; pick one of %s" % (lifetime_engine, ", ".join(LIFETIME_ENGINES)))
+    if ingest_mode == "external" and lifetime_engine != "loop":
+        raise ValueError("The external ingest mode builds lifetimes with the loop engine")
+    if append and (ingest_mode != "stream" or lifetime_engine != "matrix" or state_directory is None):
+        raise ValueError("Appending needs stream ingest, the matrix engine and a state directory")
+    if merge_shards and (input_format != "tsv" or not input_paths):
+        raise ValueError("Only query output files can be merged as shards")
+
+    shard_conflicts = ShardConflicts(input_paths) if merge_shards else None
+
+    with profile_stage(profile, "ingest") as stage:
+        def read_rows():
+            if merge_shards:
+                return stage.count_rows(merge_shard_rows(input_paths, shard_conflicts))
+            return stage.count_rows(read_input_rows(input_paths, input_format, query_shape, skip_header))
+
+        use_observations_cache = cache_directory is not None and ingest_mode == "stream" and len(input_paths) > 0 and not append
+
+        observations = None
+        if use_observations_cache:
+            observations_key = observations_cache_key(input_paths, query_shape if input_format == "nquads" else None, merge_shards)
+            observations = load_observations_cache(cache_directory, observations_key)
+            if observations is not None:
+                print("Loaded parsed input from %s" % cache_directory)
+                shard_conflicts = None
+
+        all_url_queries = None
+        if observations is not None:
+            crawl_times = observations.crawl_times
+        elif ingest_mode == "stream":
+            if merge_shards:
+                # Merged rows are already parsed, and sorted by URL
+                observations = read_merged_observations(merge_shard_urls(input_paths, shard_conflicts))
+                stage.num_rows = len(observations.url_ids)
+            else:
+                observations = read_observations(read_rows())
+            crawl_times = observations.crawl_times
+
+            if use_observations_cache:
+                save_observations_cache(cache_directory, observations_key, observations)
+        elif ingest_mode == "external":
+            # Half of the memory budget is for rows, half for content first positions
+            external_sort_directory = tempfile.TemporaryDirectory(prefix="linkrot-")
+            crawl_times, sorted_rows = sort_rows_on_disk(read_rows(), max_memory // 2, external_sort_directory.name)
+        else:
+            all_url_queries, crawl_times = read_url_queries(read_rows())
+
+        stage.finish_counting_rows()
+        if observations is not None:
+            stage.num_urls = len(observations.urls)
+        elif all_url_queries is not None:
+            stage.num_urls = len(all_url_queries)
+
+    if ingest_mode == "stream" and not append:
+        analysis = analyze_observations(observations, lifetime_engine, num_workers, state_directory, index_contents, profile)
+        analysis.shard_conflicts = shard_conflicts
+        return analysis
+
+    # The "external" mode totals each lifetime as it is built, so its "lifetimes" stage
+    # includes its totals
+    with profile_stage(profile, "lifetimes") as stage:
+        lifetime_matrix = None
+        lifetime_store = None
+        if append:
+            lifetime_matrix = load_analysis_state(state_directory)
+            append_crawls(lifetime_matrix, observations)
+            crawl_times = lifetime_matrix.crawl_times
+        elif lifetime_engine == "matrix":
+            lifetime_matrix = build_lifetime_matrix(all_url_queries, crawl_times, num_workers)
+        elif ingest_mode == "external":
+            # Lifetimes are totalled as they are built, so only one is held at a time
+            lifetime_totals = total_sorted_lifetimes(sorted_rows.sorted_lines(), crawl_times, max_memory // 2, external_sort_directory.name)
+            external_sort_directory.cleanup()
+        else:
+            lifetime_store = build_lifetime_store(((url, all_url_queries[url]) for url in all_url_queries), list(all_url_queries), crawl_times)
+
+        if lifetime_engine == "matrix" and state_directory is not None:
+            save_analysis_state(state_directory, lifetime_matrix)
+
+    if ingest_mode != "external":
+        with profile_stage(profile, "totals") as totals_stage:
+            lifetime_totals = lifetime_totals_from_columns(lifetime_matrix if lifetime_matrix is not None else lifetime_store, len(crawl_times))
+        totals_stage.num_urls = lifetime_totals.total_num_urls
+    stage.num_urls = lifetime_totals.total_num_urls
+
+    analysis = Analysis(crawl_times, lifetime_totals)
+    analysis.observations = observations
+    analysis.url_queries = all_url_queries
+    analysis.lifetime_store = lifetime_store
+    analysis.lifetime_matrix = lifetime_matrix
+    analysis.shard_conflicts = shard_conflicts
+    if index_contents:
+        index_analysis_contents(analysis, profile)
+    return analysis
+
+def analyze_observations(observations, lifetime_engine="loop", num_workers=1, state_directory=None, index_contents=False, profile=None):
+    # Lifetimes and totals of interned rows, as analyze() computes them in "stream" mode
+    crawl_times = observations.crawl_times
+    lifetime_matrix = None
+    lifetime_store = None
+    with profile_stage(profile, "lifetimes") as stage:
+        if lifetime_engine == "matrix":
+            lifetime_matrix = build_lifetime_matrix_from_observations(observations, num_workers)
+            if state_directory is not None:
+                save_analysis_state(state_directory, lifetime_matrix)
+        else:
+            lifetime_store = build_lifetime_store(observations.url_queries(), observations.urls, crawl_times)
+    stage.num_urls = len(observations.urls)
+
+    with profile_stage(profile, "totals") as stage:
+        lifetime_totals = lifetime_totals_from_columns(lifetime_matrix if lifetime_matrix is not None else lifetime_store, len(crawl_times))
+    stage.num_urls = len(observations.urls)
+
+    analysis = Analysis(crawl_times, lifetime_totals)
+    analysis.observations = observations
+    analysis.lifetime_store = lifetime_store
+    analysis.lifetime_matrix = lifetime_matrix
+    if index_contents:
+        index_analysis_contents(analysis, profile)
+    return analysis
+
+def index_analysis_contents(analysis, profile=None):
+    # Sets analysis.content_index from the content runs the engine kept, if it kept them
+    lifetimes = analysis.lifetimes
+    if not isinstance(lifetimes, (LifetimeStore, LifetimeMatrix)):
+        return
+    with profile_stage(profile, "index") as stage:
+        analysis.content_index = content_index_from_lifetimes(lifetimes)
+    stage.num_urls = len(lifetimes.urls)
+
+def build_lifetime_store(url_queries, urls, crawl_times):
+    # Builds the UrlLifetime of each (url, queries) in the order of urls and packs it into a
+    # LifetimeStore, so only one UrlLifetime is held at a time
+    lifetime_store = LifetimeStore(urls, len(crawl_times))
+    for row, (url, queries) in enumerate(url_queries):
+        lifetime_store.add(row, build_url_lifetime(queries, crawl_times))
+    lifetime_store.finish()
+    return lifetime_store
@@ -0,0 +1,278 @@
+# Approximate totals in memory independent of the number of distinct URLs and contents.
+# Running totals of URLs and contents come from per-crawl HyperLogLog sketches, merged in
+# crawl order; responsiveness, stability and the break and change rates come from the
+# full lifetimes of a fixed-size uniform sample of URLs. Error bounds are about 95%
+
+import hashlib
+
+import numpy as np
+
+from .inputs import MISSING_CONTENT, content_is_missing, crawl_time_ms, read_input_rows
+from .analysis import build_lifetime_store
+from .totals import lifetime_totals_from_columns, crawl_time_index
+from .profiling import profile_stage
+
+# Standard normal quantile of the error bounds
+ERROR_BOUND_Z = 1.96
+
+# Rows hashed and added to the sketches at a time
+SKETCH_CHUNK_SIZE = 1 << 16
+
+def string_hashes(strings):
+    # 64-bit hashes of strings, the same in every process
+    return np.frombuffer(b"".join([hashlib.blake2b(string.encode(), digest_size=8).digest() for string in strings]), dtype="<u8")
+
+def bit_lengths(values):
+    # int.bit_length() of each uint64, in two exact float64 halves
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xffffffff)).astype(np.float64)
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+class CrawlSketches:
+    # One HyperLogLog sketch (2 ** precision registers) per crawl
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("Sketch precision must be between 4 and 18, not %d" % precision)
+        self.precision = precision
+        self.registers = np.zeros((0, 1 << precision), dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        # Standard error of an estimate, relative to the count
+        return 1.04 / np.sqrt(self.registers.shape[1])
+
+    def grow(self, num_crawls):
+        if num_crawls > len(self.registers):
+            new_rows = np.zeros((num_crawls - len(self.registers), self.registers.shape[1]), dtype=np.uint8)
+            self.registers = np.vstack([self.registers, new_rows])
+
+    def add(self, crawl_rows, hashes):
+        # Adds hashes to the sketches of their crawls (registers rows)
+        if crawl_rows.size:
+            self.grow(crawl_rows.max() + 1)
+
+        # The first precision bits pick the register; it keeps the highest position of the
+        # first 1 bit among the rest
+        remaining_bits = 64 - self.precision
+        indexes = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        ranks = (remaining_bits + 1 - bit_lengths(hashes & np.uint64((1 << remaining_bits) - 1))).astype(np.uint8)
+        np.maximum.at(self.registers, (crawl_rows, indexes), ranks)
+
+    def running_estimates(self, order):
+        # Estimated distinct values seen up to each crawl, crawls taken in order
+        self.grow(len(order))
+        registers = np.maximum.accumulate(self.registers[order], axis=0)
+        return np.array([register_estimate(crawl_registers, 64 - self.precision) for crawl_registers in registers], dtype=np.float64)
+
+# Ertl's improved HyperLogLog estimator ("New cardinality estimation algorithms for
+# HyperLogLog sketches", 2017), which needs no bias correction or switch to linear
+# counting at small counts
+
+def sigma(x):
+    if x == 1:
+        return float("inf")
+    (y, z) = (1.0, x)
+    while True:
+        x *= x
+        previous_z = z
+        z += x * y
+        y += y
+        if z == previous_z:
+            return z
+
+def tau(x):
+    if x == 0 or x == 1:
+        return 0.0
+    (y, z) = (1.0, 1 - x)
+    while True:
+        x = np.sqrt(x)
+        previous_z = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous_z:
+            return z / 3
+
+def register_estimate(registers, remaining_bits):
+    m = len(registers)
+    counts = np.bincount(registers, minlength=remaining_bits + 2).tolist()
+    z = m * tau(1 - counts[remaining_bits + 1] / m)
+    for k in range(remaining_bits, 0, -1):
+        z = 0.5 * (z + counts[k])
+    z += m * sigma(counts[0] / m)
+    return m * m / (2 * np.log(2) * z)
+
+class UrlSample:
+    # Every query of the URLs with the sample_size smallest hashes, a uniform sample of the
+    # distinct URLs. A URL is only added while its hash is below the threshold, which only
+    # shrinks, so a URL that stays in the sample was never missing any of its queries
+
+    def __init__(self, sample_size=10000):
+        if sample_size < 2:
+            raise ValueError("The URL sample needs at least 2 URLs, not %d" % sample_size)
+        self.sample_size = sample_size
+        self.threshold = np.uint64(0xffffffffffffffff)
+        self.url_queries = dict()       # { url : { crawl time : content } }
+        self.url_hashes = dict()        # { url : hash }
+
+    def add(self, urls, contents, crawl_times, hashes):
+        for i in np.flatnonzero(hashes <= self.threshold).tolist():
+            url = urls[i]
+            queries = self.url_queries.get(url)
+            if queries is None:
+                queries = self.url_queries[url] = dict()
+                self.url_hashes[url] = hashes[i]
+            queries[crawl_times[i]] = MISSING_CONTENT if content_is_missing(contents[i]) else contents[i]
+
+        if len(self.url_queries) > 2 * self.sample_size:
+            self.shrink()
+
+    def shrink(self):
+        # Keeps only the sample_size URLs with the smallest hashes
+        if len(self.url_queries) <= self.sample_size:
+            return
+        self.threshold = sorted(self.url_hashes.values())[self.sample_size - 1]
+        for url in [url for (url, url_hash) in self.url_hashes.items() if url_hash > self.threshold]:
+            del self.url_queries[url]
+            del self.url_hashes[url]
+
+def sample_ratio(numerators, denominators):
+    # Ratio estimate sum(numerators) / sum(denominators) over the sampled URLs, and the
+    # half-width of its error bounds
+    numerators = numerators.astype(np.float64)
+    denominators = denominators.astype(np.float64)
+    n = len(numerators)
+    if n < 2 or denominators.sum() == 0:
+        return float("nan"), float("nan")
+    ratio = numerators.sum() / denominators.sum()
+    standard_error = np.sqrt(np.sum((numerators - ratio * denominators) ** 2) / (n * (n - 1))) / denominators.mean()
+    return float(ratio), float(ERROR_BOUND_Z * standard_error)
+
+def proportion_bounds(successes, trials):
+    # Proportions and the half-widths of their error bounds, NaN where there are no trials
+    successes = np.asarray(successes, dtype=np.float64)
+    trials = np.asarray(trials, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        proportions = successes / trials
+        return proportions, ERROR_BOUND_Z * np.sqrt(proportions * (1 - proportions) / trials)
+
+class ApproximateAnalysis:
+    # Estimated totals of a network, from CrawlSketches of its URLs and contents and the
+    # lifetimes of a UrlSample
+
+    def __init__(self, crawl_times, url_estimates, content_estimates, relative_error, sample_lifetimes, sample_totals):
+        self.crawl_times = crawl_times
+        self.url_estimates = url_estimates              # Distinct URLs up to each crawl
+        self.content_estimates = content_estimates      # Distinct contents up to each crawl
+        self.relative_error = relative_error            # Of url_estimates and content_estimates
+        self.sample_lifetimes = sample_lifetimes        # LifetimeStore of the sampled URLs
+        self.sample_totals = sample_totals              # Their LifetimeTotals
+        self.num_rows = 0
+
+    @property
+    def num_crawls(self):
+        return len(self.crawl_times)
+
+    @property
+    def num_sampled_urls(self):
+        return self.sample_totals.total_num_urls
+
+    def count_error(self, estimates):
+        return ERROR_BOUND_Z * self.relative_error * estimates
+
+    def percent_series(self):
+        # { "Percent ..." : (proportions, error half-widths) } at each crawl, over the
+        # sampled URLs first queried (or first responding) by then
+        totals = self.sample_totals
+        total_urls = np.cumsum(totals.crawl_url_totals)
+        total_responded = np.cumsum(totals.crawl_first_response_totals)
+        series = dict()
+        for (name, failures, trials) in [
+                ("Percent Responsive", totals.crawl_first_break_totals, total_urls),
+                ("Percent Stable", totals.crawl_first_change_totals, total_responded),
+                ("Percent Reliable", totals.crawl_first_unreliable_totals, total_urls)]:
+            proportions, errors = proportion_bounds(trials - np.cumsum(failures), trials)
+            series[name] = (proportions, errors)
+        return series
+
+    def rates(self):
+        # { name : (rate, error half-width) } of the break, change and revert rates between
+        # queries, as report.txt states them
+        store = self.sample_lifetimes
+        max_num_content_changes = store.num_resolves - 1
+        return {
+            "break" : sample_ratio(store.num_breaks, store.num_resolves + store.num_breaks),
+            "change" : sample_ratio(store.num_content_changes, max_num_content_changes),
+            "revert" : sample_ratio(store.num_reverts, max_num_content_changes),
+        }
+
+    def crawl_totals_frame(self):
+        # Estimated running totals and percentages at each crawl, each with an "... Error"
+        # column holding the half-width of its error bounds
+        import pandas as pd
+        columns = {
+            "Total URLs" : self.url_estimates,
+            "Total URLs Error" : self.count_error(self.url_estimates),
+            "Total Contents" : self.content_estimates,
+            "Total Contents Error" : self.count_error(self.content_estimates),
+        }
+        for (name, (proportions, errors)) in self.percent_series().items():
+            columns[name] = proportions
+            columns[name + " Error"] = errors
+        return pd.DataFrame(columns, index=crawl_time_index(self.crawl_times))
+
+def analyze_approximately(input_paths=(), input_format="tsv", query_shape=None, skip_header=True, precision=14,
+        sample_size=10000, profile=None):
+    # Reads rows from input_paths (stdin if empty) into CrawlSketches of URLs and contents
+    # and a UrlSample, and estimates the network's totals from them
+    url_sketches = CrawlSketches(precision)
+    content_sketches = CrawlSketches(precision)
+    sample = UrlSample(sample_size)
+    crawl_rows = dict()     # { crawl time : row of the sketches' registers }
+    num_rows = 0
+
+    with profile_stage(profile, "ingest") as stage:
+        def add_chunk(urls, contents, crawl_times):
+            url_hashes = string_hashes(urls)
+            rows = np.array([crawl_rows.setdefault(crawl_time, len(crawl_rows)) for crawl_time in crawl_times], dtype=np.int64)
+            url_sketches.add(rows, url_hashes)
+
+            responded = [i for (i, content) in enumerate(contents) if not content_is_missing(content)]
+            content_sketches.add(rows[responded], string_hashes([contents[i] for i in responded]))
+
+            sample.add(urls, contents, crawl_times, url_hashes)
+
+        urls, contents, crawl_times = [], [], []
+        for line in read_input_rows(input_paths, input_format, query_shape, skip_header):
+            parts = line[:-1].split("\t")
+            urls.append(parts[0])
+            contents.append(parts[1])
+            crawl_times.append(crawl_time_ms(parts[2]))
+            if len(urls) == SKETCH_CHUNK_SIZE:
+                add_chunk(urls, contents, crawl_times)
+                num_rows += len(urls)
+                urls, contents, crawl_times = [], [], []
+        if urls:
+            add_chunk(urls, contents, crawl_times)
+            num_rows += len(urls)
+        sample.shrink()
+        stage.num_rows = num_rows
+
+    with profile_stage(profile, "lifetimes") as stage:
+        # Crawls no sampled URL was queried in still count, so the sample's lifetimes are
+        # over every crawl
+        all_crawl_times = sorted(crawl_rows)
+        sample_urls = list(sample.url_queries)
+        store = build_lifetime_store(((url, sample.url_queries[url]) for url in sample_urls), sample_urls, all_crawl_times)
+        stage.num_urls = len(sample_urls)
+
+    with profile_stage(profile, "totals") as stage:
+        sample_totals = lifetime_totals_from_columns(store, len(all_crawl_times))
+
+        order = [crawl_rows[crawl_time] for crawl_time in all_crawl_times]
+        url_estimates = url_sketches.running_estimates(order)
+        content_estimates = content_sketches.running_estimates(order)
+
+    approximate = ApproximateAnalysis(all_crawl_times, url_estimates, content_estimates, url_sketches.relative_error, store, sample_totals)
+    approximate.num_rows = num_rows
+    return approximate
@@ -0,0 +1,125 @@
+# Analyzing several networks in one run. The rows of every network are interned into one
+# set of URL, content and crawl tables, so strings and crawl times that networks share are
+# parsed and held once, and the overlap between networks is a comparison of integer IDs
+
+import numpy as np
+
+from .inputs import NO_CONTENT, read_input_lines, read_input_rows
+from .observations import CrawlObservations, intern_rows
+from .analysis import analyze_observations
+from .profiling import profile_stage
+
+class NetworkBatch:
+    # The Analysis of each network, and the shared tables their rows were interned into
+
+    def __init__(self, urls, contents, crawl_times):
+        self.urls = urls                # Shared URL strings, by shared ID
+        self.contents = contents        # Shared content strings, by shared ID
+        self.crawl_times = crawl_times  # Every network's crawls, sorted
+
+        self.analyses = dict()          # { network : Analysis }
+        self.network_url_ids = dict()   # { network : sorted shared IDs of its URLs }
+        self.network_content_ids = dict()
+
+def read_network_rows(network_inputs, input_format="tsv", query_shapes=None, skip_header=True):
+    # Yields (network, rows) in the order of network_inputs. Networks read from the same
+    # provenance logs share one pass over them
+    if input_format != "nquads":
+        for (network, input_paths) in network_inputs.items():
+            yield network, read_input_rows(input_paths, input_format, None, skip_header)
+        return
+
+    from .provenance import NQUADS_QUERY_SHAPES, read_provenance, provenance_rows
+    for network in network_inputs:
+        if query_shapes[network] not in NQUADS_QUERY_SHAPES:
+            raise ValueError("No by-activity query shape for %s; pick one of %s" % (query_shapes[network], ", ".join(NQUADS_QUERY_SHAPES)))
+
+    indexes = dict()
+    for (network, input_paths) in network_inputs.items():
+        key = tuple(input_paths)
+        if key not in indexes:
+            indexes[key] = read_provenance(read_input_lines(input_paths))
+        yield network, provenance_rows(indexes[key], query_shapes[network])
+
+def first_seen_positions(ids):
+    # The distinct values of ids in the order they first appear, and each ID's position
+    # among them
+    distinct, first_indexes, inverse = np.unique(ids, return_index=True, return_inverse=True)
+    order = np.argsort(first_indexes)
+    positions = np.empty(len(order), dtype=np.int32)
+    positions[order] = np.arange(len(order), dtype=np.int32)
+    return distinct[order], positions[inverse.reshape(-1)]
+
+def network_observations(shared, urls, contents, crawl_times, start, end):
+    # The finished observations of rows start:end of the shared (unfinished) observations,
+    # numbered as read_observations would number them on their own. urls, contents and
+    # crawl_times are the shared tables as lists
+    url_ids = np.frombuffer(shared.url_ids, dtype=np.int32)[start:end]
+    content_ids = np.frombuffer(shared.content_ids, dtype=np.int32)[start:end]
+    crawl_ids = np.frombuffer(shared.crawl_ids, dtype=np.int32)[start:end]
+
+    observations = CrawlObservations()
+
+    shared_url_ids, observations.url_ids = first_seen_positions(url_ids)
+    observations.url_table = { urls[i] : position for (position, i) in enumerate(shared_url_ids.tolist()) }
+
+    responded = content_ids >= 0
+    shared_content_ids, content_positions = first_seen_positions(content_ids[responded])
+    observations.content_ids = np.full(len(content_ids), NO_CONTENT, dtype=np.int32)
+    observations.content_ids[responded] = content_positions
+    observations.content_table = { contents[i] : position for (position, i) in enumerate(shared_content_ids.tolist()) }
+
+    shared_crawl_ids, observations.crawl_ids = first_seen_positions(crawl_ids)
+    observations.crawl_table = { crawl_times[i] : position for (position, i) in enumerate(shared_crawl_ids.tolist()) }
+
+    observations.finish()
+    return observations, np.sort(shared_url_ids), np.sort(shared_content_ids)
+
+def analyze_networks(network_inputs, lifetime_engine="loop", input_format="tsv", query_shapes=None, skip_header=True,
+        num_workers=1, state_directories=None, index_contents=False, profile=None):
+    # Reads every network's rows into shared tables, then totals each network's lifetimes
+    # over its own crawls, exactly as analyze() would in "stream" mode.
+    #  - network_inputs: { network : input paths }, in the order networks are read
+    #  - query_shapes: with "nquads" input, { network : query shape }
+    #  - state_directories: with the "matrix" engine, { network : state directory }
+    #  - index_contents: build each network's ContentIndex
+    #  - profile: a RunProfile to record the "ingest" stage, and each network's stages, in
+    state_directories = state_directories or dict()
+
+    shared = CrawlObservations()
+    network_rows = dict()
+    with profile_stage(profile, "ingest") as stage:
+        for (network, rows) in read_network_rows(network_inputs, input_format, query_shapes, skip_header):
+            start = len(shared.url_ids)
+            intern_rows(shared, rows)
+            network_rows[network] = (start, len(shared.url_ids))
+        stage.num_rows = len(shared.url_ids)
+        stage.num_urls = len(shared.url_table)
+
+    urls = list(shared.url_table)
+    contents = list(shared.content_table)
+    shared_crawl_times = list(shared.crawl_table)
+    batch = NetworkBatch(urls, contents, sorted(shared_crawl_times))
+
+    for (network, (start, end)) in network_rows.items():
+        with profile_stage(profile, network):
+            observations, batch.network_url_ids[network], batch.network_content_ids[network] = network_observations(
+                shared, urls, contents, shared_crawl_times, start, end)
+            batch.analyses[network] = analyze_observations(
+                observations, lifetime_engine, num_workers, state_directories.get(network), index_contents, profile)
+    return batch
+
+### Overlap between networks
+
+def network_overlap(network_ids):
+    # { (network, other network) : number of IDs both hold } for every ordered pair,
+    # including each network with itself
+    return {
+        (network, other) : len(np.intersect1d(ids, other_ids, assume_unique=True))
+        for (network, ids) in network_ids.items()
+        for (other, other_ids) in network_ids.items()
+    }
+
+def network_counts(network_ids):
+    # Number of networks holding each ID
+    return np.bincount(np.concatenate([np.empty(0, dtype=np.int64)] + list(network_ids.values())))
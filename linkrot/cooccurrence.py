@@ -0,0 +1,241 @@
+# Which URLs returned the same content: an inverted index from content ID to the (URL,
+# crawl) positions it was returned at, and what it shows. Content that moved from a URL
+# that died to another URL is a migration; URLs linked by any content they share form a
+# duplicate cluster (mirrors, or the same dataset published twice)
+
+import os
+
+import numpy as np
+
+from .lifetimes import Status
+from .groups import url_group_ids
+
+class ContentIndex:
+    # Postings of each content ID as CSR arrays, one posting per run of consecutive crawls
+    # a URL returned the content in: the postings of content c are url_positions,
+    # crawl_starts and crawl_lengths[offsets[c]:offsets[c + 1]], sorted by URL then crawl
+
+    def __init__(self, offsets, url_positions, crawl_starts, crawl_lengths):
+        self.offsets = offsets
+        self.url_positions = url_positions
+        self.crawl_starts = crawl_starts
+        self.crawl_lengths = crawl_lengths
+
+    @property
+    def num_contents(self):
+        return len(self.offsets) - 1
+
+    def postings(self, content):
+        # (URL positions, first crawls, numbers of crawls) of the runs content was returned in
+        (start, end) = (self.offsets[content], self.offsets[content + 1])
+        return self.url_positions[start:end], self.crawl_starts[start:end], self.crawl_lengths[start:end]
+
+    def content_ids(self):
+        # The content ID of each posting
+        return np.repeat(np.arange(self.num_contents, dtype=np.int32), np.diff(self.offsets))
+
+    def url_spans(self):
+        # One entry per (content, URL) pair, sorted by content then URL: the content, the
+        # URL, and the first and last crawl the URL returned the content in
+        content_ids = self.content_ids()
+        if len(content_ids) == 0:
+            empty = np.empty(0, dtype=np.int32)
+            return empty, empty, empty, empty
+        starts = np.flatnonzero(np.concatenate([[True], (np.diff(content_ids) != 0) | (np.diff(self.url_positions) != 0)]))
+        ends = np.append(starts[1:], len(content_ids)) - 1
+        last_crawls = self.crawl_starts[ends] + self.crawl_lengths[ends] - 1
+        return content_ids[starts], self.url_positions[starts], self.crawl_starts[starts], last_crawls
+
+def build_content_index(url_positions, content_ids, crawl_starts, crawl_lengths, num_contents):
+    # ContentIndex of runs of (URL, content ID, start crawl, number of crawls) in URL then
+    # crawl order. Runs without content (negative content IDs) are left out, and runs that
+    # continue the URL's previous run of the same content are merged into it
+    returned = content_ids >= 0
+    (url_positions, content_ids, crawl_starts, crawl_lengths) = (
+        url_positions[returned], content_ids[returned], crawl_starts[returned], crawl_lengths[returned])
+
+    # A stable sort by content ID keeps each content's runs in URL then crawl order
+    order = np.argsort(content_ids, kind="stable")
+    (url_positions, content_ids, crawl_starts, crawl_lengths) = (
+        url_positions[order], content_ids[order], crawl_starts[order], crawl_lengths[order])
+
+    continues = np.zeros(len(content_ids), dtype=bool)
+    continues[1:] = (
+        (content_ids[1:] == content_ids[:-1])
+        & (url_positions[1:] == url_positions[:-1])
+        & (crawl_starts[1:] == crawl_starts[:-1] + crawl_lengths[:-1])
+    )
+    heads = np.flatnonzero(~continues)
+    if len(heads) < len(content_ids):
+        crawl_lengths = np.add.reduceat(crawl_lengths, heads)
+        (url_positions, content_ids, crawl_starts) = (url_positions[heads], content_ids[heads], crawl_starts[heads])
+
+    offsets = np.zeros(num_contents + 1, dtype=np.int64)
+    np.cumsum(np.bincount(content_ids, minlength=num_contents), out=offsets[1:])
+    return ContentIndex(offsets, url_positions.astype(np.int32), crawl_starts.astype(np.int32), crawl_lengths.astype(np.int32))
+
+def content_index_from_lifetimes(lifetimes):
+    # ContentIndex of the runs of a LifetimeStore or LifetimeMatrix
+    (url_positions, statuses, content_ids, crawl_starts, crawl_lengths) = lifetimes.runs()
+    return build_content_index(url_positions, content_ids, crawl_starts, crawl_lengths, len(lifetimes.content_strings))
+
+### Migrations: content whose first URL died, and that another URL began returning only
+### after the first URL had stopped
+
+UNRESPONSIVE_STATUSES = [Status.BECAME_UNRESPONSIVE.value, Status.STILL_UNRESPONSIVE.value]
+
+class ContentMigrations:
+    # One entry per migration, sorted by content then new URL
+
+    def __init__(self, content_ids, old_url_positions, new_url_positions, old_last_crawl_positions, new_first_crawl_positions):
+        self.content_ids = content_ids
+        self.old_url_positions = old_url_positions
+        self.new_url_positions = new_url_positions
+        self.old_last_crawl_positions = old_last_crawl_positions    # Last crawl the old URL returned the content in
+        self.new_first_crawl_positions = new_first_crawl_positions  # First crawl the new URL returned it in
+
+    def __len__(self):
+        return len(self.content_ids)
+
+def url_died(lifetimes, num_crawls):
+    # Whether each URL was unresponsive at its last query, or stopped being queried
+    return np.isin(lifetimes.last_known_status, UNRESPONSIVE_STATUSES) | (lifetimes.last_crawl_position < num_crawls - 1)
+
+def content_migrations(index, lifetimes, num_crawls):
+    # The ContentMigrations of a ContentIndex over lifetimes' URLs. Each content's old URL
+    # is the first to return it (ties by URL position)
+    (contents, urls, first_crawls, last_crawls) = index.url_spans()
+    if len(contents) == 0:
+        empty = np.empty(0, dtype=np.int32)
+        return ContentMigrations(empty, empty, empty, empty, empty)
+
+    # The span of each content's old URL, by the smallest (first crawl, URL) key within
+    # the content's spans
+    content_starts = np.flatnonzero(np.concatenate([[True], np.diff(contents) != 0]))
+    keys = first_crawls.astype(np.int64) * (len(lifetimes.urls) + 1) + urls
+    old_keys = np.minimum.reduceat(keys, content_starts)
+    span_contents = np.repeat(np.arange(len(content_starts)), np.diff(np.append(content_starts, len(contents))))
+    old_spans = np.flatnonzero(keys == old_keys[span_contents])
+    old_span = np.empty(len(content_starts), dtype=np.int64)
+    old_span[span_contents[old_spans]] = old_spans
+    old_span = old_span[span_contents]
+
+    migrated = (
+        (urls != urls[old_span])
+        & (first_crawls > last_crawls[old_span])
+        & url_died(lifetimes, num_crawls)[urls[old_span]]
+    )
+    return ContentMigrations(
+        contents[migrated], urls[old_span][migrated], urls[migrated],
+        last_crawls[old_span][migrated], first_crawls[migrated])
+
+### Duplicate clusters: URLs linked, directly or through other URLs, by content they share
+
+def duplicate_clusters(index, num_urls):
+    # The cluster of each URL, labeled by its smallest URL position, and the cluster of
+    # each content ID (-1 for content nobody returned). Each content links the URLs that
+    # returned it to the first of them, and the links are joined with a union-find that
+    # keeps the smaller root, in time near linear in the (content, URL) pairs
+    (contents, urls, first_crawls, last_crawls) = index.url_spans()
+    content_starts = np.flatnonzero(np.concatenate([[True], np.diff(contents) != 0])) if len(contents) else np.empty(0, dtype=np.int64)
+    first_urls = np.repeat(urls[content_starts], np.diff(np.append(content_starts, len(contents))))
+    linked = urls != first_urls
+
+    parents = list(range(num_urls))
+    for (a, b) in zip(first_urls[linked].tolist(), urls[linked].tolist()):
+        # Path halving on the way to each root
+        while parents[a] != a:
+            parents[a] = a = parents[parents[a]]
+        while parents[b] != b:
+            parents[b] = b = parents[parents[b]]
+        if a < b:
+            parents[b] = a
+        elif b < a:
+            parents[a] = b
+
+    url_labels = np.array(parents, dtype=np.int64)
+    while True:
+        roots = url_labels[url_labels]
+        if np.array_equal(roots, url_labels):
+            break
+        url_labels = roots
+
+    content_labels = np.full(index.num_contents, -1, dtype=np.int64)
+    content_labels[contents[content_starts]] = url_labels[urls[content_starts]]
+    return url_labels, content_labels
+
+class ClusterSummary:
+    # The clusters of more than one URL, largest first
+
+    def __init__(self, labels, num_urls, num_contents, num_hosts):
+        self.labels = labels                # Smallest URL position in the cluster
+        self.num_urls = num_urls
+        self.num_contents = num_contents    # Contents returned by the cluster's URLs
+        self.num_hosts = num_hosts
+
+def cluster_summary(url_labels, content_labels, urls):
+    cluster_sizes = np.bincount(url_labels, minlength=len(url_labels))
+    labels = np.flatnonzero(cluster_sizes > 1)
+    labels = labels[np.lexsort((labels, -cluster_sizes[labels]))]
+
+    content_counts = np.bincount(content_labels[content_labels >= 0], minlength=len(url_labels))
+
+    # Distinct (cluster, host) pairs
+    clustered = np.flatnonzero(cluster_sizes[url_labels] > 1)
+    (hosts, host_ids) = url_group_ids([urls[i] for i in clustered.tolist()])
+    pairs = np.unique(url_labels[clustered] * max(len(hosts), 1) + host_ids)
+    host_counts = np.bincount(pairs // max(len(hosts), 1), minlength=len(url_labels))
+
+    return ClusterSummary(labels, cluster_sizes[labels], content_counts[labels], host_counts[labels])
+
+### Reports
+
+def cooccurrence_report(index, migrations, clusters, num_urls):
+    url_counts = np.bincount(index.url_spans()[0], minlength=index.num_contents)
+    num_contents = int(np.count_nonzero(url_counts))
+    num_shared = int(np.count_nonzero(url_counts > 1))
+    num_clustered_urls = int(clusters.num_urls.sum())
+
+    report = ""
+    report += ("%s of %s contents (%s) were returned by more than one URL\n"
+        % ("{0:,}".format(num_shared), "{0:,}".format(num_contents), "{0:.2%}".format(num_shared / max(num_contents, 1))))
+    report += ("%s of %s URLs (%s) returned content another URL also returned, in %s duplicate clusters; the largest has %s URLs\n"
+        % ("{0:,}".format(num_clustered_urls), "{0:,}".format(num_urls), "{0:.2%}".format(num_clustered_urls / max(num_urls, 1)),
+           "{0:,}".format(len(clusters.labels)), "{0:,}".format(int(clusters.num_urls[0]) if len(clusters.labels) else 0)))
+    report += ("%s contents migrated to another URL after the first URL to return them died, in %s (old URL, new URL) pairs\n"
+        % ("{0:,}".format(len(np.unique(migrations.content_ids))),
+           "{0:,}".format(len(np.unique(migrations.old_url_positions.astype(np.int64) * num_urls + migrations.new_url_positions)))))
+    return report
+
+def write_cooccurrence_report(index, migrations, clusters, urls, content_strings, crawl_times, output_directory):
+    # Writes content-migrations.tsv, duplicate-clusters.tsv and content-cooccurrence.txt,
+    # and returns the text report
+    from .inputs import format_crawl_time
+
+    with open(os.path.join(output_directory, "content-migrations.tsv"), "w") as file:
+        file.write("content\told_url\tnew_url\told_last_crawl\tnew_first_crawl\n")
+        for (content, old_url, new_url, old_last, new_first) in zip(migrations.content_ids.tolist(), migrations.old_url_positions.tolist(),
+                migrations.new_url_positions.tolist(), migrations.old_last_crawl_positions.tolist(), migrations.new_first_crawl_positions.tolist()):
+            file.write("%s\t%s\t%s\t%s\t%s\n" % (content_strings[content], urls[old_url], urls[new_url],
+                format_crawl_time(crawl_times[old_last]), format_crawl_time(crawl_times[new_first])))
+
+    with open(os.path.join(output_directory, "duplicate-clusters.tsv"), "w") as file:
+        file.write("first_url\tnum_urls\tnum_contents\tnum_hosts\n")
+        file.write("".join(["%s\t%d\t%d\t%d\n" % (urls[label], num_urls, num_contents, num_hosts) for (label, num_urls, num_contents, num_hosts)
+            in zip(clusters.labels.tolist(), clusters.num_urls.tolist(), clusters.num_contents.tolist(), clusters.num_hosts.tolist())]))
+
+    report = cooccurrence_report(index, migrations, clusters, len(urls))
+    with open(os.path.join(output_directory, "content-cooccurrence.txt"), "w") as file:
+        file.write(report)
+    return report
+
+def migrations_frame(migrations, crawl_times):
+    # New and running total migrations at each crawl, by the crawl the new URL first
+    # returned the content in
+    import pandas as pd
+    from .totals import crawl_time_index
+    new_migrations = np.bincount(migrations.new_first_crawl_positions, minlength=len(crawl_times))
+    return pd.DataFrame({
+        "Migrations" : new_migrations,
+        "Total Migrations" : np.cumsum(new_migrations),
+    }, index=crawl_time_index(crawl_times))
@@ -0,0 +1,120 @@
+# Exporting an analysis as Arrow tables, so that tools downstream can query the lifetimes
+# and per-crawl totals without re-running it: url-lifetimes (one row per URL), url-runs
+# (each URL's timeline as runs of unchanged status and content), crawl-status-totals and
+# crawl-totals (one row per crawl). URLs, contents and statuses are dictionary encoded, and
+# positions are crawl rows of the per-crawl tables (null where UrlLifetime holds None).
+# pyarrow is only imported here, and only needed to export
+
+import os
+
+import numpy as np
+
+from .lifetimes import Status, LIFETIME_POSITIONS, LIFETIME_COUNTS, LifetimeStore, LifetimeMatrix
+from .totals import crawl_totals_columns
+
+# "parquet" files are compressed and read by most tools; "arrow" (IPC) files are not
+# compressed, and can be memory-mapped and read without a copy
+EXPORT_FORMATS = ["parquet", "arrow"]
+
+# Export table names, in the order they are written
+EXPORT_TABLES = ["url-lifetimes", "url-runs", "crawl-status-totals", "crawl-totals"]
+
+def import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Exporting tables needs the pyarrow package")
+    return pyarrow
+
+def column_name(frame_column):
+    # "Percent Responsive" -> "percent_responsive"
+    return frame_column.lower().replace(" ", "_")
+
+def dictionary_column(indices, dictionary, mask=None):
+    # Indices into dictionary (a list of strings), null where mask
+    pa = import_pyarrow()
+    return pa.DictionaryArray.from_arrays(pa.array(indices, mask=mask), pa.array(dictionary, type=pa.string()))
+
+def status_column(status_codes):
+    return dictionary_column(np.asarray(status_codes).astype(np.int8), [status.name for status in Status])
+
+def url_lifetimes_table(lifetimes):
+    # One row per URL of a LifetimeStore, LifetimeMatrix or LifetimeColumns
+    pa = import_pyarrow()
+    columns = { "url" : dictionary_column(np.arange(len(lifetimes.urls), dtype=np.int32), lifetimes.urls) }
+    for name in LIFETIME_POSITIONS:
+        positions = np.asarray(getattr(lifetimes, name), dtype=np.int32)
+        columns[name] = pa.array(positions, mask=positions < 0)
+    for name in LIFETIME_COUNTS:
+        columns[name] = pa.array(np.asarray(getattr(lifetimes, name), dtype=np.int32))
+    columns["last_known_status"] = status_column(lifetimes.last_known_status)
+    return pa.table(columns)
+
+def url_runs_table(lifetimes):
+    # One row per run of a LifetimeStore or LifetimeMatrix, in URL then crawl order. Content
+    # is null where the URL was not queried or returned no content
+    pa = import_pyarrow()
+    (url_positions, statuses, content_ids, starts, lengths) = lifetimes.runs()
+    return pa.table({
+        "url" : dictionary_column(url_positions.astype(np.int32), lifetimes.urls),
+        "status" : status_column(statuses),
+        "content" : dictionary_column(content_ids.astype(np.int32), lifetimes.content_strings, content_ids < 0),
+        "start_crawl_position" : pa.array(starts.astype(np.int32)),
+        "num_crawls" : pa.array(lengths.astype(np.int32)),
+    })
+
+def crawl_columns(crawl_times):
+    pa = import_pyarrow()
+    return {
+        "crawl_position" : pa.array(np.arange(len(crawl_times), dtype=np.int32)),
+        "crawl_time" : pa.array(np.array(crawl_times, dtype=np.int64), type=pa.timestamp("ms", tz="UTC")),
+    }
+
+def crawl_status_totals_table(totals, crawl_times):
+    # crawl_status_totals_frame, with a column per Status name
+    pa = import_pyarrow()
+    columns = crawl_columns(crawl_times)
+    status_totals = np.asarray(totals.crawl_status_totals, dtype=np.int64).reshape(len(crawl_times), len(Status))
+    for status in Status:
+        columns[status.name.lower()] = pa.array(status_totals[:, status.value])
+    return pa.table(columns)
+
+def crawl_totals_table(totals, crawl_times):
+    # crawl_totals_frame, with snake_case column names
+    pa = import_pyarrow()
+    columns = crawl_columns(crawl_times)
+    for (name, values) in crawl_totals_columns(totals).items():
+        columns[column_name(name)] = pa.array(values)
+    return pa.table(columns)
+
+def export_tables(analysis):
+    # { EXPORT_TABLES name : pyarrow.Table } of an Analysis. url-lifetimes needs per-URL
+    # arrays ("external" mode keeps none) and url-runs needs runs (lost after appending)
+    tables = dict()
+    lifetimes = analysis.lifetimes
+    if lifetimes is not None:
+        tables["url-lifetimes"] = url_lifetimes_table(lifetimes)
+    if isinstance(lifetimes, (LifetimeStore, LifetimeMatrix)):
+        tables["url-runs"] = url_runs_table(lifetimes)
+    tables["crawl-status-totals"] = crawl_status_totals_table(analysis.totals, analysis.crawl_times)
+    tables["crawl-totals"] = crawl_totals_table(analysis.totals, analysis.crawl_times)
+    return tables
+
+def write_export(analysis, output_directory, export_format="parquet"):
+    # Writes export_tables(analysis) to output_directory as NAME.parquet or NAME.arrow, and
+    # returns their paths
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("Unknown export format %s; pick one of %s" % (export_format, ", ".join(EXPORT_FORMATS)))
+    pa = import_pyarrow()
+
+    paths = []
+    for (name, table) in export_tables(analysis).items():
+        path = os.path.join(output_directory, "%s.%s" % (name, export_format))
+        if export_format == "parquet":
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(table, path)
+        else:
+            with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        paths.append(path)
+    return paths
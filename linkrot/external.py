@@ -0,0 +1,104 @@
+# Sorting rows on disk when they do not fit in memory, and totalling the lifetimes of
+# rows sorted by URL one URL at a time
+
+import sys
+import os
+import heapq
+import itertools
+
+from .inputs import content_is_missing, crawl_time_ms
+from .lifetimes import build_url_lifetime
+from .totals import LifetimeTotals
+
+def first_field(line):
+    return line[:line.index("\t")]
+
+def all_but_last_field(line):
+    return line[:line.rindex("\t")]
+
+class ExternalSorter:
+    # Sorts lines by key within a memory budget, spilling sorted runs to temporary files
+    # and k-way merging them. Lines with equal keys keep the order they were added in.
+
+    def __init__(self, key, memory_budget, directory):
+        self.key = key
+        self.memory_budget = memory_budget
+        self.directory = directory
+        self.lines = []
+        self.size = 0
+        self.run_paths = []
+
+    def add(self, line):
+        self.lines.append(line)
+        # The line, its sort key and their list slots
+        self.size += 2 * sys.getsizeof(line) + 16
+        if self.size >= self.memory_budget:
+            self.spill()
+
+    def spill(self):
+        self.lines.sort(key=self.key)
+        path = os.path.join(self.directory, "run-%d-%d" % (id(self), len(self.run_paths)))
+        with open(path, "w") as file:
+            file.writelines(self.lines)
+        self.run_paths.append(path)
+        self.lines = []
+        self.size = 0
+
+    def sorted_lines(self):
+        if not self.run_paths:
+            self.lines.sort(key=self.key)
+            yield from self.lines
+            return
+
+        if self.lines:
+            self.spill()
+        runs = [open(path, "r") for path in self.run_paths]
+        try:
+            # Ties go to the earlier run, which holds the earlier lines
+            yield from heapq.merge(*runs, key=self.key)
+        finally:
+            for run in runs:
+                run.close()
+            for path in self.run_paths:
+                os.remove(path)
+
+def sort_rows_on_disk(lines, memory_budget, directory):
+    # Returns the sorted crawl times and an ExternalSorter of "url crawl_time content" rows,
+    # with crawl times in milliseconds
+    rows = ExternalSorter(all_but_last_field, memory_budget, directory)
+    crawl_times_set = set()
+    for line in lines:
+        (url, content, crawl_time) = line.rstrip("\n").split("\t")
+        crawl_time = crawl_time_ms(crawl_time)
+        crawl_times_set.add(crawl_time)
+        rows.add("%s\t%d\t%s\n" % (url, crawl_time, content))
+    return sorted(crawl_times_set), rows
+
+def total_sorted_lifetimes(rows, crawl_times, memory_budget, directory):
+    totals = LifetimeTotals(len(crawl_times), count_contents=False)
+
+    # The first crawl of each content is found with a second sort, by content
+    content_firsts = ExternalSorter(first_field, memory_budget, directory)
+
+    for url, url_rows in itertools.groupby(rows, key=first_field):
+        queries = dict()
+        for row in url_rows:
+            (_, crawl_time, content) = row.rstrip("\n").split("\t")
+            queries[int(crawl_time)] = content
+
+        lifetime = build_url_lifetime(queries, crawl_times)
+        totals.add(lifetime)
+
+        url_content_firsts = dict()
+        for (status, content, start, length) in lifetime.runs:
+            if content is not None and not content_is_missing(content) and content not in url_content_firsts:
+                url_content_firsts[content] = start
+        for (content, i) in url_content_firsts.items():
+            content_firsts.add("%s\t%d\n" % (content, i))
+
+    for content, content_rows in itertools.groupby(content_firsts.sorted_lines(), key=first_field):
+        first_position = min(int(row[len(content) + 1:]) for row in content_rows)
+        totals.crawl_content_totals[first_position] += 1
+
+    totals.finish()
+    return totals
@@ -0,0 +1,539 @@
+# Figures. matplotlib and pandas are imported when a figure is drawn, so the rest of the
+# package works without them
+
+import os
+import sys
+import json
+import hashlib
+import datetime
+import multiprocessing
+from itertools import cycle, islice
+
+import numpy as np
+
+from .inputs import parse_crawl_time
+from .lifetimes import Status
+from .totals import crawl_frames
+from .profiling import profile_stage
+
+col_hex = {
+    "blue"      : "#1f77b4",
+    "orange"    : "#ff7f0e",
+    "green"     : "#2ca02c",
+    "red"       : "#d62728",
+    "purple"    : "#9467bd",
+    "brown"     : "#8c564b",
+    "pink"      : "#e377c2",
+    "gray"      : "#7f7f7f",
+    "yellow"    : "#bcbd22",
+    "teal"      : "#17becf",
+
+    "bright green"  : "#00ff00",
+    "bright red"    : "#ff0000",
+    "green yellow"  : "#9ACD32",
+    "olive"         : "#808000"
+}
+
+# Stacking order of the status figures, bottom first
+STATUS_FIGURE_ORDER = [
+    Status.SAME_CONTENT,
+    Status.FIRST_CONTENT,
+    Status.OLD_CONTENT,
+    Status.CHANGED_CONTENT,
+    Status.STILL_UNRESPONSIVE,
+    Status.BECAME_UNRESPONSIVE,
+    Status.UNKNOWN,
+    Status.ERROR
+]
+
+status_colors = {
+    Status.UNKNOWN             : "gray",
+    Status.FIRST_CONTENT       : "bright green",
+    Status.SAME_CONTENT        : "green",
+    Status.CHANGED_CONTENT     : "yellow",
+    Status.OLD_CONTENT         : "olive",
+    Status.BECAME_UNRESPONSIVE : "bright red",
+    Status.STILL_UNRESPONSIVE  : "red",
+    Status.ERROR               : "purple",
+}
+
+def use_draft_style(dpi):
+    from matplotlib import rc
+    rc("text", usetex=False)
+    rc("savefig", format="png", dpi=dpi)
+    rc("font", size=14, family="DejaVu Sans")
+
+def use_paper_style(dpi, usetex=True):
+    # Expects the "Computer Modern" font to be installed. If not installed, probably a
+    # default (ugly) font will be used instead
+    from matplotlib import rc
+    rc("text", usetex=usetex)
+    rc("savefig", format="pdf", dpi=dpi)
+    rc("font", size=14, family="serif", serif=["Computer Modern", "DejaVu Serif"])
+
+def frequency_arrays(frequencies):
+    # (values, counts) arrays of a Counter, sorted by value
+    return [np.array(x) for x in zip(*sorted(frequencies.items()))]
+
+def save_legend(ax, output_path, figsize):
+    # Export legend (https://stackoverflow.com/a/50279532)
+    import matplotlib.pyplot as plt
+    fig_leg = plt.figure(figsize=figsize)
+    ax_leg = fig_leg.add_subplot(111)
+    # add the legend from the previous axes
+    ax_leg.legend(*ax.get_legend_handles_labels(), loc='center')
+    # hide the axes frame and the x/y labels
+    ax_leg.axis('off')
+    fig_leg.savefig(output_path + "-legend")
+    plt.close(fig_leg)
+
+def plot_status_counts_per_crawl(status_df, network_name, output_path, dpi):
+    import matplotlib.pyplot as plt
+    figure_title = network_name + ": Stacked URL status counts per crawl"
+
+    fig_df = status_df[STATUS_FIGURE_ORDER]
+    status_color_map = list(islice(cycle([col_hex[status_colors[x]] for x in fig_df.columns]), None, 256))
+
+    ax = fig_df.plot(
+        kind="bar",
+        stacked=True,
+        width=.95,
+        color=status_color_map,
+        figsize=(15, 5),
+        legend=False
+    );
+
+    # Bare
+    plt.savefig(output_path, dpi=dpi);
+
+    # Annotated
+    plt.title(figure_title)
+    plt.legend()
+    plt.savefig(output_path + "-annotated", dpi=dpi);
+    plt.close(ax.figure)
+
+def plot_status_counts_over_time(status_df, network_name, output_path, dpi):
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    figure_title = network_name + ": Stacked URL Status Counts Over Time (Stepped)"
+
+    fig_df = status_df[STATUS_FIGURE_ORDER]
+    status_color_map = list(islice(cycle([col_hex[status_colors[x]] for x in fig_df.columns]), None, 256))
+
+    fig = plt.figure(figsize=(16, 5))
+    ax = fig.add_subplot(111)
+
+    # Fill in space between lines
+    x = fig_df.index.append(pd.Index([datetime.datetime.now()]))
+    y1 = pd.Series({ q : 0 for q in x })
+
+    columns = fig_df.columns
+    n = len(columns)
+    for i in range(0, n):
+        y2 = y1 + fig_df[columns[i]] + 0
+        ax.fill_between(x, y1, y2, step="post", color=status_color_map[i])
+        y1 = y2
+
+    # Bare
+    plt.savefig(output_path, dpi=dpi);
+
+    # Annotated
+    plt.title(figure_title)
+    plt.savefig(output_path + "-annotated", dpi=dpi);
+    plt.close(fig)
+
+def plot_count_frequencies(frequencies, figure_title, xlabel, output_path, dpi):
+    # Line plot of how many URLs had each count of something
+    import matplotlib.pyplot as plt
+    count_frequencies = frequency_arrays(frequencies)
+
+    fig = plt.figure()
+    plt.plot(
+        count_frequencies[0],
+        count_frequencies[1],
+        "-o",
+        color="black"
+    );
+    ax = plt.gca()
+
+    plt.xlabel(xlabel);
+    plt.ylabel("Number of URLs");
+
+    ax.set_yticklabels(["{:,}k".format(int(y / 1000)) for y in plt.yticks()[0]]);
+
+    # Bare
+    plt.savefig(output_path, dpi=dpi);
+
+    # Annotated
+    plt.title(figure_title)
+    plt.savefig(output_path + "-annotated", dpi=dpi);
+    plt.close(fig)
+
+def plot_break_frequencies(break_count_frequencies, network_name, output_path, dpi):
+    plot_count_frequencies(
+        break_count_frequencies,
+        network_name + ": Frequency Distribution of Total Losses of Responsiveness Per URL",
+        "Number of losses of responsiveness",
+        output_path,
+        dpi
+    )
+
+def plot_content_change_frequencies(content_change_count_frequencies, network_name, output_path, dpi):
+    plot_count_frequencies(
+        content_change_count_frequencies,
+        network_name + ": Frequency Distribution of Total Content Changes Per URL",
+        "Number of content changes",
+        output_path,
+        dpi
+    )
+
+def plot_break_and_change_frequencies(break_count_frequencies, content_change_count_frequencies, network_name, output_path, dpi):
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    figure_title = network_name + ": Frequency Distribution of Breaks and Changes"
+
+    max_count = max(list(break_count_frequencies) + list(content_change_count_frequencies) + [0])
+    frequencies_df = pd.DataFrame(
+        columns=["Unresolvable", "Changed Content"],
+        index=range(max_count + 1),
+        data=0
+    )
+    for (num_breaks, num_urls) in break_count_frequencies.items():
+        frequencies_df.loc[num_breaks, "Unresolvable"] = num_urls
+    for (num_changes, num_urls) in content_change_count_frequencies.items():
+        frequencies_df.loc[num_changes, "Changed Content"] = num_urls
+
+    ax = frequencies_df.plot(
+        color="black",
+        style=["-+", "--o"],
+        legend=False
+    );
+
+    plt.ylabel("Number of URLs");
+    plt.xlabel("Number of queries");
+
+    ax.set_yticklabels(["{:,}k".format(int(y / 1000)) for y in plt.yticks()[0]]);
+
+    # Bare
+    plt.savefig(output_path, dpi=dpi);
+
+    # Annotated
+    plt.title(figure_title)
+    plt.legend()
+    plt.savefig(output_path + "-annotated", dpi=dpi);
+    plt.close(ax.figure)
+
+def fill_error_bounds(ax, crawl_totals_df, columns):
+    # Shades the error bounds of estimated columns, whose half-widths are in "... Error"
+    # columns (see ApproximateAnalysis.crawl_totals_frame)
+    for column in columns:
+        if column + " Error" in crawl_totals_df:
+            (values, errors) = (crawl_totals_df[column], crawl_totals_df[column + " Error"])
+            ax.fill_between(crawl_totals_df.index, values - errors, values + errors, color="black", alpha=0.15, linewidth=0)
+
+def plot_running_totals(crawl_totals_df, network_name, output_path, time_frame, dpi):
+    import matplotlib.pyplot as plt
+    figure_title = network_name + ": Running Total of Unique URLs and Contents"
+
+    df = crawl_totals_df[[
+        "Total URLs",
+        "Total Contents",
+    #     "Total Abandoned"
+    ]]
+
+    ax = df.plot(
+        color="black",
+        style=["--", ":", "-"],
+        legend=False,
+        fillstyle="none",
+        markersize=7
+    );
+    for i, line in enumerate(ax.get_lines()):
+        line.set_marker(["s", "D"][i])
+    fill_error_bounds(ax, crawl_totals_df, df.columns)
+
+    plt.xlim(time_frame);
+    plt.ylim([0, max(df.max()) * 1.05])
+
+    ax.set_yticklabels(["{:,}k".format(int(y / 1000)) for y in plt.yticks()[0]]);
+
+    # Bare
+    plt.savefig(output_path, dpi=dpi);
+
+    # Annotated
+    plt.title(figure_title)
+    plt.legend()
+    plt.savefig(output_path + "-annotated", dpi=dpi);
+
+    save_legend(ax, output_path, (2.2, .75))
+    plt.close(ax.figure)
+
+def plot_reliability(crawl_totals_df, network_name, output_path, time_frame, dpi):
+    import matplotlib.pyplot as plt
+    figure_title = network_name + ": Responsiveness, Stability, Reliability Over Time"
+
+    ax = crawl_totals_df[[
+        "Percent Responsive",
+        "Percent Stable",
+        "Percent Reliable"
+    ]].plot(
+        color="black",
+        style=["--", ":", "-"],
+        legend=False,
+        fillstyle="none",
+        markersize=8
+    );
+    for i, line in enumerate(ax.get_lines()):
+        line.set_marker(["x", "+", "o"][i])
+    fill_error_bounds(ax, crawl_totals_df, ["Percent Responsive", "Percent Stable", "Percent Reliable"])
+
+    plt.xlim(time_frame);
+    plt.ylim([0.0, 1.05]);
+    ax.set_yticklabels(["{:.0%}".format(float(y)) for y in plt.yticks()[0]]);
+
+    # Bare
+    plt.savefig(output_path, dpi=dpi);
+
+    # Annotated
+    plt.title(figure_title)
+    plt.legend()
+    plt.savefig(output_path + "-annotated");
+
+    save_legend(ax, output_path, (2.5, 1))
+    plt.close(ax.figure)
+
+TEX_SPECIAL_CHARACTERS = { character : "\\" + character for character in "&%$#_{}" }
+TEX_SPECIAL_CHARACTERS.update({ "~" : "\\textasciitilde{}", "^" : "\\textasciicircum{}", "\\" : "\\textbackslash{}" })
+
+def tex_escape(text):
+    return "".join(TEX_SPECIAL_CHARACTERS.get(character, character) for character in text)
+
+def plot_worst_groups(worst_groups_df, network_name, output_path, dpi):
+    import matplotlib.pyplot as plt
+    figure_title = network_name + ": Least Reliable Hosts"
+
+    # Worst at the top. Host names may hold characters LaTeX treats specially
+    df = worst_groups_df[::-1]
+    if plt.rcParams["text.usetex"]:
+        df = df.set_axis([tex_escape(name) for name in df.index], axis=0)
+
+    ax = df.plot.barh(
+        stacked=True,
+        color=[col_hex["green"], col_hex["yellow"], col_hex["red"]],
+        legend=False,
+        width=0.8,
+        figsize=(8, max(2.4, 0.25 * len(df) + 1.2)),
+    );
+    ax.set_xlabel("URLs")
+    ax.set_ylabel("")
+    ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, position: "{:,}".format(int(x))))
+
+    # Bare. Host names are long, so the figure is cropped to fit them
+    plt.savefig(output_path, dpi=dpi, bbox_inches="tight");
+
+    # Annotated, with the legend beside the bars
+    plt.title(figure_title)
+    plt.legend(loc="center left", bbox_to_anchor=(1.0, 0.5), frameon=False)
+    plt.savefig(output_path + "-annotated", dpi=dpi, bbox_inches="tight");
+    plt.close(ax.figure)
+
+def plot_content_migrations(migrations_df, network_name, output_path, time_frame, dpi):
+    import matplotlib.pyplot as plt
+    figure_title = network_name + ": Running Total of Contents Migrated to Another URL"
+
+    ax = migrations_df[["Total Migrations"]].plot(
+        color="black",
+        style=["-"],
+        legend=False,
+        fillstyle="none",
+        markersize=7
+    );
+    ax.get_lines()[0].set_marker("o")
+
+    plt.xlim(time_frame);
+    plt.ylim([0, max(1, migrations_df["Total Migrations"].max()) * 1.05])
+    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda y, position: "{:,}".format(int(y))))
+
+    # Bare
+    plt.savefig(output_path, dpi=dpi);
+
+    # Annotated
+    plt.title(figure_title)
+    plt.savefig(output_path + "-annotated", dpi=dpi);
+    plt.close(ax.figure)
+
+def figure_time_frame(crawl_times, start_time=None, end_time=None):
+    # The x axis limits of the figures over time. Start and end times are crawl time
+    # literals; None uses the first and last crawls
+    import pandas as pd
+    start_time = parse_crawl_time(start_time) if start_time else crawl_times[0]
+    end_time = parse_crawl_time(end_time) if end_time else crawl_times[-1]
+    return tuple(pd.to_datetime(np.array([start_time, end_time], dtype=np.int64), unit="ms").to_pydatetime())
+
+### Rendering. Each figure is a FigureJob: a plot function and the small frame or
+### frequencies it is drawn from. Jobs are independent, so they can be drawn in a process
+### pool, and a job whose data and style hash the same as last run is not redrawn
+
+FIGURE_CACHE_VERSION = "1"
+
+class FigureJob:
+    # One figure file set: name.pdf, name-annotated.pdf and maybe name-legend.pdf
+
+    def __init__(self, name, plot, data, network_name, output_path, args=(), style="paper", dpi=300, usetex=True, legend=False):
+        self.name = name
+        self.plot = plot
+        self.data = data                # Positional data arguments of plot: frames or Counters
+        self.network_name = network_name
+        self.output_path = output_path
+        self.args = args                # Arguments of plot between output_path and dpi
+        self.style = style              # "draft" (png) or "paper" (pdf)
+        self.dpi = dpi
+        self.usetex = usetex
+        self.legend = legend            # Whether plot also saves a "-legend" figure
+
+    @property
+    def output_files(self):
+        extension = ".png" if self.style == "draft" else ".pdf"
+        suffixes = ["", "-annotated"] + (["-legend"] if self.legend else [])
+        return [self.output_path + suffix + extension for suffix in suffixes]
+
+    def digest(self):
+        # Hash of everything that ends up in the figure files
+        from importlib.metadata import version
+        digest = hashlib.sha256(FIGURE_CACHE_VERSION.encode())
+        settings = (self.plot.__name__, self.network_name, self.output_path, self.args, self.style, self.dpi, self.usetex, version("matplotlib"))
+        digest.update(repr(settings).encode())
+        for data in self.data:
+            if hasattr(data, "to_csv"):
+                digest.update(data.to_csv(sep="\t").encode())
+            else:
+                digest.update(repr(sorted(data.items())).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+def render_figure(job):
+    if job.style == "draft":
+        use_draft_style(job.dpi)
+    else:
+        use_paper_style(job.dpi, job.usetex)
+    job.plot(*job.data, job.network_name, job.output_path, *job.args, job.dpi)
+    return job.name
+
+def read_figure_digests(cache_directory):
+    try:
+        with open(os.path.join(cache_directory, "figure-digests.json"), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def write_figure_digests(cache_directory, digests):
+    os.makedirs(cache_directory, exist_ok=True)
+    path = os.path.join(cache_directory, "figure-digests.json")
+    with open(path + ".tmp", "w") as file:
+        json.dump(digests, file, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def render_figures(jobs, num_workers=1, cache_directory=None, tex_cache_directory=None):
+    # Draws jobs, skipping those whose figures in cache_directory's digests are up to date,
+    # and returns the names of the figures drawn
+    if tex_cache_directory is not None and "matplotlib" not in sys.modules:
+        # matplotlib keeps the output of each LaTeX string it typesets under its cache
+        # directory, which is fixed when it is first imported
+        os.environ.setdefault("MPLCONFIGDIR", tex_cache_directory)
+
+    digests = {}
+    if cache_directory is not None:
+        digests = read_figure_digests(cache_directory)
+        job_digests = { job.name : job.digest() for job in jobs }
+        jobs = [
+            job for job in jobs
+            if digests.get(job.name) != job_digests[job.name] or not all(os.path.exists(path) for path in job.output_files)
+        ]
+
+    if num_workers > 1 and len(jobs) > 1:
+        # build-figures.py does its work at import time, so workers must be forked rather than spawned
+        with multiprocessing.get_context("fork").Pool(min(num_workers, len(jobs))) as pool:
+            drawn = pool.map(render_figure, jobs, chunksize=1)
+    else:
+        drawn = [render_figure(job) for job in jobs]
+
+    if cache_directory is not None:
+        for name in drawn:
+            digests[name] = job_digests[name]
+        write_figure_digests(cache_directory, digests)
+    return drawn
+
+def figure_jobs(totals, crawl_times, network_name, output_directory, start_time=None, end_time=None, dpi=300, usetex=True,
+        status_counts_per_crawl=False, status_counts_over_time=False, unstable_histogram=False, unavailable_histogram=False,
+        frames=None, worst_groups_df=None, migrations_df=None):
+    # The FigureJobs of every figure of a network's totals. frames are crawl_frames(totals,
+    # crawl_times), if the caller already has them; with a worst_groups_frame(), the
+    # worst-hosts figure is drawn too, and with a migrations_frame(), content-migrations
+    crawl_status_totals_df, crawl_totals_df = frames if frames is not None else crawl_frames(totals, crawl_times)
+
+    def job(name, plot, data, args=(), style="paper", legend=False):
+        return FigureJob(name, plot, data, network_name, os.path.join(output_directory, name), args, style, dpi, usetex, legend)
+
+    jobs = []
+    if status_counts_per_crawl or status_counts_over_time:
+        status_df = crawl_status_totals_df[STATUS_FIGURE_ORDER]
+        if status_counts_per_crawl:
+            jobs.append(job("stacked-query-status-counts-per-crawl", plot_status_counts_per_crawl, (status_df,), style="draft"))
+        if status_counts_over_time:
+            jobs.append(job("stacked-query-status-counts-over-time", plot_status_counts_over_time, (status_df,), style="draft"))
+
+    jobs.append(job("url-break-freq-dist", plot_break_frequencies, (totals.break_count_frequencies,)))
+    if unstable_histogram:
+        jobs.append(job("url-unstable-histogram", plot_content_change_frequencies, (totals.content_change_count_frequencies,)))
+    if unavailable_histogram:
+        jobs.append(job("url-unavailable-histogram", plot_break_and_change_frequencies, (totals.break_count_frequencies, totals.content_change_count_frequencies)))
+
+    time_frame = figure_time_frame(crawl_times, start_time, end_time)
+    jobs.append(job("running-total-urls-and-contents", plot_running_totals,
+        (crawl_totals_df[["Total URLs", "Total Contents"]],), (time_frame,), legend=True))
+    jobs.append(job("reliability-over-time", plot_reliability,
+        (crawl_totals_df[["Percent Responsive", "Percent Stable", "Percent Reliable"]],), (time_frame,), legend=True))
+    if worst_groups_df is not None and len(worst_groups_df) > 0:
+        jobs.append(job("worst-hosts", plot_worst_groups, (worst_groups_df,)))
+    if migrations_df is not None:
+        jobs.append(job("content-migrations", plot_content_migrations, (migrations_df[["Total Migrations"]],), (time_frame,)))
+    return jobs
+
+def approximate_figure_jobs(approximate, network_name, output_directory, start_time=None, end_time=None, dpi=300, usetex=True,
+        crawl_totals_df=None):
+    # The FigureJobs of the figures an ApproximateAnalysis can draw: the running totals and
+    # reliability over time, with their error bounds shaded
+    if crawl_totals_df is None:
+        crawl_totals_df = approximate.crawl_totals_frame()
+
+    def job(name, plot, columns):
+        columns = [column for name in columns for column in [name, name + " Error"]]
+        return FigureJob(name, plot, (crawl_totals_df[columns],), network_name, os.path.join(output_directory, name), (time_frame,),
+            "paper", dpi, usetex, True)
+
+    time_frame = figure_time_frame(approximate.crawl_times, start_time, end_time)
+    return [
+        job("running-total-urls-and-contents", plot_running_totals, ["Total URLs", "Total Contents"]),
+        job("reliability-over-time", plot_reliability, ["Percent Responsive", "Percent Stable", "Percent Reliable"]),
+    ]
+
+def build_approximate_figures(approximate, network_name, output_directory, start_time=None, end_time=None, dpi=300, usetex=True,
+        num_workers=1, cache_directory=None, tex_cache_directory=None, profile=None, crawl_totals_df=None):
+    # build_figures for an ApproximateAnalysis
+    with profile_stage(profile, "frames"):
+        jobs = approximate_figure_jobs(approximate, network_name, output_directory, start_time, end_time, dpi, usetex, crawl_totals_df)
+    with profile_stage(profile, "rendering"):
+        return render_figures(jobs, num_workers, cache_directory, tex_cache_directory)
+
+def build_figures(totals, crawl_times, network_name, output_directory, start_time=None, end_time=None, dpi=300, usetex=True,
+        status_counts_per_crawl=False, status_counts_over_time=False, unstable_histogram=False, unavailable_histogram=False,
+        num_workers=1, cache_directory=None, tex_cache_directory=None, profile=None, frames=None, worst_groups_df=None,
+        migrations_df=None):
+    # Draws every figure of a network's totals into output_directory, in num_workers
+    # processes. With a cache_directory, figures that are up to date are not redrawn
+    with profile_stage(profile, "frames"):
+        jobs = figure_jobs(totals, crawl_times, network_name, output_directory, start_time, end_time, dpi, usetex,
+            status_counts_per_crawl, status_counts_over_time, unstable_histogram, unavailable_histogram, frames, worst_groups_df,
+            migrations_df)
+    with profile_stage(profile, "rendering"):
+        return render_figures(jobs, num_workers, cache_directory, tex_cache_directory)
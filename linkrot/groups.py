@@ -0,0 +1,121 @@
+# Totals per host (or per host and leading path segments, e.g. one IPT instance of a
+# shared host), so that the hosts driving a network's breaks and content changes can be
+# found. Each URL's group is extracted once and interned into a group ID; every count is
+# then one bincount over the per-URL lifetime arrays
+
+import os
+
+import numpy as np
+
+def url_group(url, path_depth=0):
+    # "<https://User@Host.org:8080/ipt/eml.do?r=x>" -> "host.org", or with path_depth=1,
+    # "host.org/ipt"
+    if url.startswith("<") and url.endswith(">"):
+        url = url[1:-1]
+    (scheme, separator, rest) = url.partition("://")
+    if not separator:
+        rest = url
+    parts = rest.split("?", 1)[0].split("#", 1)[0].split("/")
+
+    host = parts[0].rpartition("@")[2]
+    if not host.endswith("]"):
+        host = host.rpartition(":")[0] or host
+    return "/".join([host.lower()] + [part for part in parts[1:1 + path_depth] if part])
+
+def url_group_ids(urls, path_depth=0):
+    # The distinct groups of urls, in first-seen order, and each URL's group ID
+    groups = dict()
+    group_ids = np.fromiter((groups.setdefault(url_group(url, path_depth), len(groups)) for url in urls), dtype=np.int32, count=len(urls))
+    return list(groups), group_ids
+
+# GroupTotals columns, in the order of host-totals.tsv
+GROUP_COUNTS = [
+    "num_urls", "num_unreliable", "num_unresponsive", "num_unstable", "num_abandoned", "num_never_responded",
+    "num_resolves", "num_breaks", "num_content_changes",
+]
+GROUP_FRACTIONS = ["percent_reliable", "percent_responsive", "percent_stable", "percent_abandoned", "break_rate", "change_rate"]
+
+class GroupTotals:
+    # report.txt's counts, one entry per group
+
+    def __init__(self, names):
+        self.names = names
+        for name in GROUP_COUNTS:
+            setattr(self, name, np.zeros(len(names), dtype=np.int64))
+        self.num_responded = np.zeros(len(names), dtype=np.int64)
+        self.max_num_content_changes = np.zeros(len(names), dtype=np.int64)
+
+    def fraction(self, name):
+        def ratio(numerators, denominators):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return numerators / denominators
+
+        if name == "percent_reliable":
+            return 1 - ratio(self.num_unreliable, self.num_urls)
+        if name == "percent_responsive":
+            return 1 - ratio(self.num_unresponsive, self.num_urls)
+        if name == "percent_stable":
+            return ratio(self.num_urls - self.num_unstable, self.num_responded)
+        if name == "percent_abandoned":
+            return ratio(self.num_abandoned, self.num_urls)
+        if name == "break_rate":
+            return ratio(self.num_breaks, self.num_resolves + self.num_breaks)
+        if name == "change_rate":
+            return ratio(self.num_content_changes, self.max_num_content_changes)
+        raise ValueError("Unknown group fraction %s; pick one of %s" % (name, ", ".join(GROUP_FRACTIONS)))
+
+    def worst_order(self):
+        # Groups with the most unreliable URLs first, ties by name
+        return np.lexsort((np.array(self.names, dtype=str), -self.num_unreliable))
+
+def group_totals(lifetimes, num_crawls, path_depth=0):
+    # GroupTotals of the groups of lifetimes.urls, from the per-URL arrays of a
+    # LifetimeStore, LifetimeMatrix or LifetimeColumns
+    names, group_ids = url_group_ids(lifetimes.urls, path_depth)
+    totals = GroupTotals(names)
+
+    def count(mask):
+        return np.bincount(group_ids[mask], minlength=len(names))
+
+    def total(values):
+        return np.bincount(group_ids, weights=values, minlength=len(names)).round().astype(np.int64)
+
+    responsive = lifetimes.num_breaks == 0
+    stable = lifetimes.num_contents == 1
+    responded = lifetimes.num_resolves > 0
+
+    totals.num_urls = np.bincount(group_ids, minlength=len(names))
+    totals.num_unreliable = count(~(responsive & stable))
+    totals.num_unresponsive = count(~responsive)
+    totals.num_unstable = count(~stable)
+    totals.num_abandoned = count(lifetimes.last_crawl_position < num_crawls - 1)
+    totals.num_never_responded = count(~responded)
+    totals.num_responded = count(responded)
+
+    totals.num_resolves = total(lifetimes.num_resolves)
+    totals.num_breaks = total(lifetimes.num_breaks)
+    totals.num_content_changes = total(lifetimes.num_content_changes)
+    totals.max_num_content_changes = total(lifetimes.num_resolves - 1)
+    return totals
+
+def write_group_totals(totals, output_directory, group_label="host"):
+    # Writes host-totals.tsv, one row per group with the most unreliable URLs first
+    fractions = [totals.fraction(name) for name in GROUP_FRACTIONS]
+    with open(os.path.join(output_directory, "host-totals.tsv"), "w") as file:
+        file.write("\t".join([group_label] + GROUP_COUNTS + GROUP_FRACTIONS) + "\n")
+        for i in totals.worst_order().tolist():
+            file.write("\t".join(
+                [totals.names[i]]
+                + ["%d" % getattr(totals, name)[i] for name in GROUP_COUNTS]
+                + ["%.4f" % fraction[i] for fraction in fractions]) + "\n")
+
+def worst_groups_frame(totals, num_groups=20):
+    # Reliable, unstable (but responsive) and unresponsive URLs of the num_groups groups
+    # with the most unreliable URLs, worst first
+    import pandas as pd
+    rows = totals.worst_order()[:num_groups]
+    return pd.DataFrame({
+        "Reliable" : totals.num_urls[rows] - totals.num_unreliable[rows],
+        "Unstable" : totals.num_unreliable[rows] - totals.num_unresponsive[rows],
+        "Unresponsive" : totals.num_unresponsive[rows],
+    }, index=pd.Index([totals.names[i] for i in rows.tolist()], name="Host"))
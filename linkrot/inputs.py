@@ -0,0 +1,195 @@
+# Reading (possibly compressed) query output and crawl time literals
+
+import sys
+import os
+import io
+import shutil
+import datetime
+import threading
+import subprocess
+from queue import Queue
+
+NOT_QUERIED = -1    # Content ID for crawls that did not query the URL
+NO_CONTENT  = -2    # Content ID for queries that failed to return content
+
+# Stands in for the discarded content of a failed query; only its "<http" prefix matters
+MISSING_CONTENT = "<http://no-content>"
+
+def content_is_missing(content):
+    return str(content).startswith("<http")
+
+UNIX_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+def parse_crawl_time(literal):
+    # "2019-09-01T09:34:33.505Z"^^<http://www.w3.org/2001/XMLSchema#dateTime> -> milliseconds
+    # since the epoch, read from fixed positions. The quotes and datatype are optional
+    i = 1 if literal.startswith('"') else 0
+    days = datetime.date(int(literal[i:i + 4]), int(literal[i + 5:i + 7]), int(literal[i + 8:i + 10])).toordinal() - UNIX_EPOCH_ORDINAL
+    seconds = days * 86400 + int(literal[i + 11:i + 13]) * 3600 + int(literal[i + 14:i + 16]) * 60 + int(literal[i + 17:i + 19])
+
+    milliseconds = 0
+    end = i + 19
+    if literal[end:end + 1] == ".":
+        fraction_end = end + 1
+        while literal[fraction_end:fraction_end + 1].isdigit():
+            fraction_end += 1
+        milliseconds = int((literal[end + 1:fraction_end] + "00")[:3])
+        end = fraction_end
+    if literal[end:end + 1] != "Z":
+        raise ValueError("Crawl time %s is not a UTC xsd:dateTime" % literal)
+    return seconds * 1000 + milliseconds
+
+# Crawl time literal -> milliseconds, so each distinct literal is only parsed once
+crawl_time_milliseconds = dict()
+
+def crawl_time_ms(literal):
+    milliseconds = crawl_time_milliseconds.get(literal)
+    if milliseconds is None:
+        milliseconds = crawl_time_milliseconds[literal] = parse_crawl_time(literal)
+    return milliseconds
+
+def format_crawl_time(milliseconds):
+    return (datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=milliseconds)).isoformat(timespec="milliseconds") + "Z"
+
+COMPRESSION_MAGIC_BYTES = [
+    (b"BZh",                "bz2"),
+    (b"\x1f\x8b",           "gzip"),
+    (b"\xfd7zXZ\x00",       "xz"),
+    (b"\x28\xb5\x2f\xfd",   "zstd"),
+]
+
+# Decompressors that use several cores, tried in order before falling back to Python's
+DECOMPRESS_THREADS = os.cpu_count() or 1
+PARALLEL_DECOMPRESSORS = {
+    "bz2"  : [["lbzip2", "-d", "-c", "-n", str(DECOMPRESS_THREADS)], ["pbzip2", "-d", "-c", "-p%d" % DECOMPRESS_THREADS]],
+    "gzip" : [["pigz", "-d", "-c"]],
+    "xz"   : [["xz", "-d", "-c", "-T%d" % DECOMPRESS_THREADS]],
+    "zstd" : [["zstd", "-d", "-c", "-q"]],
+}
+
+READ_CHUNK_SIZE = 1 << 20
+
+def detect_compression(path):
+    with open(path, "rb") as file:
+        magic = file.read(8)
+    for (prefix, compression) in COMPRESSION_MAGIC_BYTES:
+        if magic.startswith(prefix):
+            return compression
+    return None
+
+def open_decompressed(path, compression):
+    # Returns a binary file of decompressed bytes read by Python on the calling thread
+    if compression == "bz2":
+        import bz2
+        return bz2.open(path, "rb")
+    if compression == "gzip":
+        import gzip
+        return gzip.open(path, "rb")
+    if compression == "xz":
+        import lzma
+        return lzma.open(path, "rb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Reading %s needs the zstd command or the zstandard package (pip install zstandard)" % path)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+class BackgroundReader(io.RawIOBase):
+    # Reads a binary file on a background thread, a chunk ahead of its consumer. The
+    # decompressors release the GIL, so decompression overlaps with parsing.
+
+    def __init__(self, file, queued_chunks=8):
+        self.file = file
+        self.chunks = Queue(maxsize=queued_chunks)
+        self.chunk = memoryview(b"")
+        self.error = None
+        self.thread = threading.Thread(target=self._read_chunks, daemon=True)
+        self.thread.start()
+
+    def _read_chunks(self):
+        try:
+            while True:
+                chunk = self.file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.chunks.put(chunk)
+        except Exception as error:
+            self.error = error
+        finally:
+            self.chunks.put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.chunk:
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.chunks.put(None)
+                if self.error is not None:
+                    raise self.error
+                return 0
+            self.chunk = memoryview(chunk)
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+def open_input(path):
+    # Returns a text file of the (decompressed) contents of path, and the decompressing
+    # process if one was started
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, "r"), None
+
+    for command in PARALLEL_DECOMPRESSORS[compression]:
+        if shutil.which(command[0]):
+            process = subprocess.Popen(command + [path], stdout=subprocess.PIPE)
+            return io.TextIOWrapper(process.stdout), process
+
+    reader = BackgroundReader(open_decompressed(path, compression))
+    return io.TextIOWrapper(io.BufferedReader(reader, READ_CHUNK_SIZE)), None
+
+def is_header(line):
+    # tdbquery's --results tsv output starts with a line of query variables, e.g.
+    # "?dataset_url\t?dataset_content\t?crawl_date"; rows start with a URL
+    return line.startswith("?")
+
+def without_header(lines):
+    lines = iter(lines)
+    first_line = next(lines, None)
+    if first_line is not None and not is_header(first_line):
+        yield first_line
+    yield from lines
+
+def read_input_lines(input_paths, skip_headers=False):
+    # Yields the lines of input_paths in order (stdin if empty). With skip_headers, each
+    # input's header line is left out, so every file may be a query output of its own
+    if not input_paths:
+        yield from (without_header(sys.stdin) if skip_headers else sys.stdin)
+        return
+
+    for path in input_paths:
+        file, process = open_input(path)
+        with file:
+            yield from (without_header(file) if skip_headers else file)
+        if process is not None and process.wait() != 0:
+            raise RuntimeError("%s failed to decompress %s" % (process.args[0], path))
+
+def read_input_rows(input_paths, input_format="tsv", query_shape=None, skip_header=True):
+    # Yields "url\tcontent\tcrawl_time\n" rows of query output, or of the rows extracted
+    # from Preston provenance logs with input_format="nquads". With skip_header, the header
+    # line of each query output is skipped
+    if input_format == "nquads":
+        from .provenance import NQUADS_QUERY_SHAPES, read_provenance, provenance_rows
+        if query_shape not in NQUADS_QUERY_SHAPES:
+            raise ValueError("No by-activity query shape for %s; pick one of %s" % (query_shape, ", ".join(NQUADS_QUERY_SHAPES)))
+        return provenance_rows(read_provenance(read_input_lines(input_paths)), query_shape)
+
+    return read_input_lines(input_paths, skip_header)
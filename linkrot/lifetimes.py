@@ -0,0 +1,665 @@
+# Classifying each URL's query at each crawl, one URL at a time or every URL at once
+
+import bisect
+import multiprocessing
+from array import array
+from collections.abc import Mapping
+from multiprocessing import shared_memory
+from enum import Enum
+
+import numpy as np
+
+from .inputs import NOT_QUERIED, NO_CONTENT, MISSING_CONTENT, content_is_missing
+
+class Status(Enum):
+    UNKNOWN             = 0    # Did not check for content
+    FIRST_CONTENT       = 1    # Returned content for the first time
+    SAME_CONTENT        = 2    # Returned the same content as the last successful query
+    CHANGED_CONTENT     = 3    # Returned new content
+    OLD_CONTENT         = 4    # Returned previously seen content that is different from the previous successful data
+    BECAME_UNRESPONSIVE = 5    # Failed to return content after a successful query
+    STILL_UNRESPONSIVE  = 6    # Failed to return content again
+    ERROR               = 7    # Returned malformed content
+
+class UrlLifetime:
+    # A URL's timeline is kept as runs of consecutive crawls with the same status and
+    # content, [status, content, start crawl, number of crawls], covering every crawl. Most
+    # URLs spend nearly every crawl in SAME_CONTENT or STILL_UNRESPONSIVE, so a lifetime
+    # grows with its number of changes rather than its number of crawls
+    __slots__ = (
+        "runs", "first_crawl_position", "last_crawl_position", "last_known_status",
+        "first_response_position", "first_change_position", "first_break_position", "num_resolves",
+        "num_breaks", "num_contents", "num_content_changes", "num_reverts", "revert_distances",
+    )
+
+    def __init__(self):
+        self.runs = []
+
+        self.first_crawl_position = None
+        self.last_crawl_position = None
+        self.last_known_status = Status.UNKNOWN
+        self.first_response_position = None
+        self.first_change_position = None
+        self.first_break_position = None
+
+        self.num_resolves = 0
+        self.num_breaks = 0
+        self.num_contents = 0
+        self.num_content_changes = 0
+        self.num_reverts = 0
+
+        # Number of crawls since the reverted-to content was last seen, one per revert
+        self.revert_distances = []
+
+    def add_run(self, status, content, i, length=1):
+        # Extends the last run if it holds the same status and content up to crawl i
+        runs = self.runs
+        if runs and runs[-1][0] is status and runs[-1][2] + runs[-1][3] == i and runs[-1][1] == content:
+            runs[-1][3] += length
+        else:
+            runs.append([status, content, i, length])
+
+    @property
+    def statuses(self):
+        # The Status at each crawl
+        return [status for (status, content, start, length) in self.runs for _ in range(length)]
+
+    @property
+    def contents(self):
+        # The content returned at each crawl, None where the URL was not queried
+        return [content for (status, content, start, length) in self.runs for _ in range(length)]
+
+### Collect the contents seen over the course of each URL's lifetime
+
+def build_url_lifetime(queries, crawl_times):
+    lifetime = UrlLifetime()
+
+    # Fill statuses and stuff, one query at a time in crawl order. Crawls between queries
+    # are UNKNOWN
+    was_alive = True
+    most_recent_content = None
+    content_last_seen = dict()
+    next_position = 0
+    for (i, content) in sorted((bisect.bisect_left(crawl_times, crawl), content) for (crawl, content) in queries.items()):
+        if i > next_position:
+            lifetime.add_run(Status.UNKNOWN, None, next_position, i - next_position)
+        next_position = i + 1
+
+        # Became unresponsive
+        if content_is_missing(content):
+            if was_alive:
+                status = Status.BECAME_UNRESPONSIVE
+                lifetime.num_breaks += 1
+
+        # Still unresponsive
+            else:
+                status = Status.STILL_UNRESPONSIVE
+
+            was_alive = False
+
+            if lifetime.first_break_position is None:
+                lifetime.first_break_position = i
+
+        # First content
+        else:
+            if most_recent_content == None:
+                status = Status.FIRST_CONTENT
+                most_recent_content = content
+                lifetime.num_contents += 1
+                lifetime.first_response_position = i
+
+        # Same content
+            elif content == most_recent_content:
+                status = Status.SAME_CONTENT
+
+            else:
+        # Old content
+                if content in content_last_seen:
+                    status = Status.OLD_CONTENT
+                    lifetime.num_reverts += 1
+                    lifetime.revert_distances.append(i - content_last_seen[content])
+
+        # Changed content
+                else:
+                    status = Status.CHANGED_CONTENT
+                    if lifetime.first_change_position is None:
+                        lifetime.first_change_position = i
+                    lifetime.num_contents += 1
+
+                most_recent_content = content
+                lifetime.num_content_changes += 1
+
+            content_last_seen[content] = i
+            was_alive = True
+            lifetime.num_resolves += 1
+
+        lifetime.last_known_status = status
+
+        if lifetime.first_crawl_position is None:
+            lifetime.first_crawl_position = i
+        lifetime.last_crawl_position = i
+
+        lifetime.add_run(status, content, i)
+
+    # Unknown
+    if next_position < len(crawl_times):
+        lifetime.add_run(Status.UNKNOWN, None, next_position, len(crawl_times) - next_position)
+    return lifetime
+
+### Hold every URL's lifetime in arrays rather than one UrlLifetime each
+
+# UrlLifetime scalars kept as one array per field. Positions are -1 where UrlLifetime
+# would hold None
+LIFETIME_POSITIONS = ["first_crawl_position", "last_crawl_position", "first_response_position", "first_change_position", "first_break_position"]
+LIFETIME_COUNTS = ["num_resolves", "num_breaks", "num_contents", "num_content_changes", "num_reverts"]
+
+STATUS_CODES = { status : status.value for status in Status }
+
+class LifetimeStore:
+    # UrlLifetimes packed into arrays: every URL's runs as parallel run arrays, in URL then
+    # crawl order, and each scalar as a column with one entry per URL. The runs of urls[row]
+    # are run_offsets[row]:run_offsets[row + 1]. Run content IDs are NOT_QUERIED or
+    # NO_CONTENT where runs hold None or a missing content
+
+    def __init__(self, urls, num_crawls):
+        self.urls = urls
+        self.num_crawls = num_crawls
+        self.content_table = dict()
+
+        self.run_offsets = np.zeros(len(urls) + 1, dtype=np.int64)
+        self.run_statuses = array("B")
+        self.run_contents = array("i")
+        self.run_starts = array("i")
+        self.run_lengths = array("i")
+
+        for name in LIFETIME_POSITIONS:
+            setattr(self, name, np.full(len(urls), -1, dtype=np.int32))
+        for name in LIFETIME_COUNTS:
+            setattr(self, name, np.zeros(len(urls), dtype=np.int32))
+        self.last_known_status = np.zeros(len(urls), dtype=np.uint8)
+
+        # One entry per revert, in URL order
+        self.revert_url_positions = array("i")
+        self.revert_distances = array("i")
+
+    def add(self, row, lifetime):
+        # Packs the UrlLifetime of urls[row]. Rows must be added in order
+        content_table = self.content_table
+        for (status, content, start, length) in lifetime.runs:
+            self.run_statuses.append(status.value)
+            self.run_contents.append(
+                NOT_QUERIED if content is None else
+                NO_CONTENT if content_is_missing(content) else
+                content_table.setdefault(content, len(content_table)))
+            self.run_starts.append(start)
+            self.run_lengths.append(length)
+        self.run_offsets[row + 1] = len(self.run_statuses)
+
+        for name in LIFETIME_POSITIONS:
+            position = getattr(lifetime, name)
+            getattr(self, name)[row] = -1 if position is None else position
+        for name in LIFETIME_COUNTS:
+            getattr(self, name)[row] = getattr(lifetime, name)
+        self.last_known_status[row] = lifetime.last_known_status.value
+
+        self.revert_url_positions.extend([row] * len(lifetime.revert_distances))
+        self.revert_distances.extend(lifetime.revert_distances)
+
+    def finish(self):
+        self.content_strings = list(self.content_table)
+        del self.content_table
+        self.run_statuses = np.frombuffer(self.run_statuses, dtype=np.uint8)
+        self.run_contents = np.frombuffer(self.run_contents, dtype=np.int32)
+        self.run_starts = np.frombuffer(self.run_starts, dtype=np.int32)
+        self.run_lengths = np.frombuffer(self.run_lengths, dtype=np.int32)
+        self.revert_url_positions = np.frombuffer(self.revert_url_positions, dtype=np.int32)
+        self.revert_distances = np.frombuffer(self.revert_distances, dtype=np.int32)
+
+    @property
+    def num_urls(self):
+        return len(self.urls)
+
+    def url_statuses(self, row):
+        # Status codes of urls[row] at each crawl
+        (start, end) = (self.run_offsets[row], self.run_offsets[row + 1])
+        return np.repeat(self.run_statuses[start:end], self.run_lengths[start:end])
+
+    def url_contents(self, row):
+        # Content IDs of urls[row] at each crawl
+        (start, end) = (self.run_offsets[row], self.run_offsets[row + 1])
+        return np.repeat(self.run_contents[start:end], self.run_lengths[start:end])
+
+    def runs(self):
+        # (URL position, status code, content ID, start crawl, number of crawls) of every run
+        url_positions = np.repeat(np.arange(len(self.urls), dtype=np.int32), np.diff(self.run_offsets))
+        return url_positions, self.run_statuses, self.run_contents, self.run_starts, self.run_lengths
+
+    # The per-crawl columns LifetimeColumns keeps as it goes, computed from the runs, so
+    # lifetime_totals_from_columns can total a LifetimeStore
+
+    @property
+    def status_totals(self):
+        # Crawl x Status counts. Each run adds one at its start crawl and takes one away
+        # after its end in a difference array, whose running sums are the counts
+        num_statuses = len(Status)
+        size = (self.num_crawls + 1) * num_statuses
+        starts = self.run_starts.astype(np.int64) * num_statuses + self.run_statuses
+        ends = (self.run_starts.astype(np.int64) + self.run_lengths) * num_statuses + self.run_statuses
+        changes = np.bincount(starts, minlength=size) - np.bincount(ends, minlength=size)
+        return np.cumsum(changes.reshape(self.num_crawls + 1, num_statuses)[:-1], axis=0)
+
+    @property
+    def content_first_crawl_positions(self):
+        # The first crawl each content ID was returned in
+        first_positions = np.full(len(self.content_strings), self.num_crawls, dtype=np.int32)
+        returned = self.run_contents >= 0
+        np.minimum.at(first_positions, self.run_contents[returned], self.run_starts[returned])
+        first_positions[first_positions == self.num_crawls] = -1
+        return first_positions
+
+class LifetimeView:
+    # The UrlLifetime of one URL (row) of a LifetimeStore or LifetimeMatrix, read from its
+    # arrays on access
+
+    __slots__ = ("lifetimes", "row")
+
+    def __init__(self, lifetimes, row):
+        self.lifetimes = lifetimes
+        self.row = row
+
+    @property
+    def statuses(self):
+        return [Status(status) for status in self.lifetimes.url_statuses(self.row).tolist()]
+
+    @property
+    def contents(self):
+        content_strings = self.lifetimes.content_strings
+        return [
+            None if content == NOT_QUERIED else MISSING_CONTENT if content == NO_CONTENT else content_strings[content]
+            for content in self.lifetimes.url_contents(self.row).tolist()
+        ]
+
+    @property
+    def last_known_status(self):
+        return Status(int(self.lifetimes.last_known_status[self.row]))
+
+    @property
+    def revert_distances(self):
+        return self.lifetimes.revert_distances[self.lifetimes.revert_url_positions == self.row].tolist()
+
+    def __getattr__(self, name):
+        if name in LIFETIME_POSITIONS:
+            position = int(getattr(self.lifetimes, name)[self.row])
+            return None if position < 0 else position
+        if name in LIFETIME_COUNTS:
+            return int(getattr(self.lifetimes, name)[self.row])
+        raise AttributeError(name)
+
+class UrlLifetimes(Mapping):
+    # { url : LifetimeView } over a LifetimeStore or LifetimeMatrix
+
+    def __init__(self, lifetimes):
+        self.lifetimes = lifetimes
+        self.url_rows = None
+
+    def __getitem__(self, url):
+        if self.url_rows is None:
+            self.url_rows = { url : row for (row, url) in enumerate(self.lifetimes.urls) }
+        return LifetimeView(self.lifetimes, self.url_rows[url])
+
+    def __iter__(self):
+        return iter(self.lifetimes.urls)
+
+    def __len__(self):
+        return len(self.lifetimes.urls)
+
+### Collect every URL's lifetime at once, one crawl (column) at a time
+
+def set_first_position(positions, mask, i):
+    positions[mask & (positions < 0)] = i
+
+class ContentLastSeen:
+    # The last crawl position each URL returned each content, by (url, content) key. Keys
+    # are kept in sorted runs, longest first: each crawl's new keys are a run of their own,
+    # and a run is merged into the one before it once it is at least half as long, so there
+    # are O(log n) runs to look keys up in and each key is merged O(log n) times
+
+    def __init__(self, keys=None, positions=None):
+        self.runs = []      # [(sorted keys, positions)]
+        if keys is not None:
+            self.extend(keys, positions)
+
+    def entries(self):
+        # (keys, positions) of every key, sorted by key
+        self.merge_runs(merge_all=True)
+        if not self.runs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        return self.runs[0]
+
+    def extend(self, keys, positions):
+        # Adds keys that are not yet recorded, in any order
+        if len(keys) > 0:
+            order = np.argsort(keys, kind="stable")
+            self.runs.append((np.asarray(keys, dtype=np.int64)[order], np.asarray(positions, dtype=np.int32)[order]))
+            self.merge_runs()
+
+    def merge_runs(self, merge_all=False):
+        while len(self.runs) > 1 and (merge_all or 2 * len(self.runs[-1][0]) >= len(self.runs[-2][0])):
+            (newer_keys, newer_positions) = self.runs.pop()
+            (older_keys, older_positions) = self.runs.pop()
+            keys = np.concatenate([older_keys, newer_keys])
+            # Two sorted runs, which a stable sort merges in linear time
+            order = np.argsort(keys, kind="stable")
+            self.runs.append((keys[order], np.concatenate([older_positions, newer_positions])[order]))
+
+    def update(self, url_positions, content_ids, i):
+        # Records that each URL returned its content in crawl i and returns the previous
+        # position the URL returned that content, or -1. URL positions must be ascending.
+        keys = (url_positions.astype(np.int64) << 32) | content_ids.astype(np.int64)
+        previous = np.full(len(keys), -1, dtype=np.int32)
+
+        # A key is in at most one run
+        unseen = np.arange(len(keys))
+        for (run_keys, run_positions) in self.runs:
+            at = np.searchsorted(run_keys, keys[unseen])
+            found = at < len(run_keys)
+            found[found] = run_keys[at[found]] == keys[unseen[found]]
+            previous[unseen[found]] = run_positions[at[found]]
+            run_positions[at[found]] = i
+            unseen = unseen[~found]
+
+        # One content per URL, and URLs ascending, so the new keys are already sorted
+        if len(unseen) > 0:
+            self.runs.append((keys[unseen], np.full(len(unseen), i, dtype=np.int32)))
+            self.merge_runs()
+        return previous
+
+class GrowingArray:
+    # A NumPy array appended to in amortized constant time per entry, by doubling the
+    # capacity of the buffer it fills
+
+    def __init__(self, values):
+        self.buffer = values
+        self.length = len(values)
+
+    @property
+    def values(self):
+        return self.buffer[:self.length]
+
+    def extend(self, values):
+        end = self.length + len(values)
+        if end > len(self.buffer):
+            buffer = np.empty((max(end, 2 * len(self.buffer)),) + self.buffer.shape[1:], dtype=self.buffer.dtype)
+            buffer[:self.length] = self.values
+            self.buffer = buffer
+        self.buffer[self.length:end] = values
+        self.length = end
+
+def growing_array_property(name):
+    # An array attribute kept in the GrowingArray attribute name
+    def get(self):
+        return getattr(self, name).values
+
+    def set(self, values):
+        setattr(self, name, GrowingArray(np.asarray(values)))
+
+    return property(get, set)
+
+# LifetimeColumns arrays with one entry per URL
+URL_COLUMNS = [
+    "first_crawl_position", "last_crawl_position", "last_known_status", "first_response_position",
+    "first_change_position", "first_break_position", "num_resolves", "num_breaks", "num_contents",
+    "num_content_changes", "num_reverts", "was_alive", "most_recent_content",
+]
+
+class LifetimeColumns:
+    # The UrlLifetime scalars of every URL as parallel arrays, the per-crawl totals, and
+    # the state needed to classify the next crawl
+
+    revert_url_positions = growing_array_property("revert_url_position_array")
+    revert_distances = growing_array_property("revert_distance_array")
+    status_totals = growing_array_property("status_total_array")
+
+    def __init__(self, num_urls=0, num_contents=0):
+        # Positions are -1 where UrlLifetime would hold None
+        self.first_crawl_position = np.full(num_urls, -1, dtype=np.int32)
+        self.last_crawl_position = np.full(num_urls, -1, dtype=np.int32)
+        self.last_known_status = np.full(num_urls, Status.UNKNOWN.value, dtype=np.int8)
+        self.first_response_position = np.full(num_urls, -1, dtype=np.int32)
+        self.first_change_position = np.full(num_urls, -1, dtype=np.int32)
+        self.first_break_position = np.full(num_urls, -1, dtype=np.int32)
+
+        self.num_resolves = np.zeros(num_urls, dtype=np.int32)
+        self.num_breaks = np.zeros(num_urls, dtype=np.int32)
+        self.num_contents = np.zeros(num_urls, dtype=np.int32)
+        self.num_content_changes = np.zeros(num_urls, dtype=np.int32)
+        self.num_reverts = np.zeros(num_urls, dtype=np.int32)
+
+        self.was_alive = np.ones(num_urls, dtype=bool)
+        self.most_recent_content = np.full(num_urls, NOT_QUERIED, dtype=np.int32)
+        self.content_last_seen = ContentLastSeen()
+
+        # One entry per revert, in crawl order
+        self.revert_url_positions = np.empty(0, dtype=np.int32)
+        self.revert_distances = np.empty(0, dtype=np.int32)
+
+        # Crawl x Status counts, and the first crawl each content ID was returned in
+        self.status_totals = np.zeros((0, len(Status)), dtype=np.int64)
+        self.content_first_crawl_positions = np.full(num_contents, -1, dtype=np.int32)
+
+    @property
+    def num_urls(self):
+        return len(self.first_crawl_position)
+
+    def add_urls(self, num_new_urls):
+        # New URLs were not queried by any earlier crawl
+        new_urls = LifetimeColumns(num_new_urls)
+        for name in URL_COLUMNS:
+            setattr(self, name, np.append(getattr(self, name), getattr(new_urls, name)))
+        self.status_totals[:, Status.UNKNOWN.value] += num_new_urls
+
+    def add_contents(self, num_new_contents):
+        self.content_first_crawl_positions = np.append(self.content_first_crawl_positions, np.full(num_new_contents, -1, dtype=np.int32))
+
+    def add_crawl(self, contents):
+        # Classifies one crawl's content IDs (one per URL) and returns their statuses
+        i = len(self.status_totals)
+
+        queried = contents != NOT_QUERIED
+        missing = contents == NO_CONTENT
+        responded = queried & ~missing
+
+        responded_positions = np.flatnonzero(responded)
+        last_seen = np.full(len(contents), -1, dtype=np.int32)
+        last_seen[responded_positions] = self.content_last_seen.update(responded_positions, contents[responded_positions], i)
+
+        became_unresponsive = missing & self.was_alive
+        first_content = responded & (self.most_recent_content == NOT_QUERIED)
+        same_content = responded & (contents == self.most_recent_content)
+        old_content = responded & ~first_content & ~same_content & (last_seen >= 0)
+        changed_content = responded & ~first_content & ~same_content & ~old_content
+
+        statuses = np.full(len(contents), Status.UNKNOWN.value, dtype=np.int8)
+        statuses[became_unresponsive] = Status.BECAME_UNRESPONSIVE.value
+        statuses[missing & ~self.was_alive] = Status.STILL_UNRESPONSIVE.value
+        statuses[first_content] = Status.FIRST_CONTENT.value
+        statuses[same_content] = Status.SAME_CONTENT.value
+        statuses[changed_content] = Status.CHANGED_CONTENT.value
+        statuses[old_content] = Status.OLD_CONTENT.value
+
+        self.num_breaks += became_unresponsive
+        self.num_resolves += responded
+        self.num_contents += first_content | changed_content
+        self.num_content_changes += changed_content | old_content
+        self.num_reverts += old_content
+
+        reverted_positions = np.flatnonzero(old_content)
+        self.revert_url_position_array.extend(reverted_positions)
+        self.revert_distance_array.extend(i - last_seen[reverted_positions])
+
+        set_first_position(self.first_break_position, missing, i)
+        set_first_position(self.first_response_position, first_content, i)
+        set_first_position(self.first_change_position, changed_content, i)
+        set_first_position(self.first_crawl_position, queried, i)
+        self.last_crawl_position[queried] = i
+        self.last_known_status[queried] = statuses[queried]
+
+        self.was_alive[missing] = False
+        self.was_alive[responded] = True
+        self.most_recent_content[responded] = contents[responded]
+
+        returned_contents = contents[responded_positions]
+        first_positions = self.content_first_crawl_positions
+        first_positions[returned_contents[first_positions[returned_contents] < 0]] = i
+
+        self.status_total_array.extend(np.bincount(statuses, minlength=len(Status))[np.newaxis])
+        return statuses
+
+class LifetimeMatrix(LifetimeColumns):
+    # LifetimeColumns that also keep every URL's content ID and status at every crawl
+
+    def __init__(self, urls, crawl_times, content_strings):
+        super().__init__(len(urls), len(content_strings))
+
+        self.urls = urls
+        self.crawl_times = crawl_times
+        self.content_strings = content_strings
+        self.contents = np.full((len(urls), len(crawl_times)), NOT_QUERIED, dtype=np.int32)
+        self.statuses = np.full((len(urls), len(crawl_times)), Status.UNKNOWN.value, dtype=np.int8)
+
+    def url_statuses(self, row):
+        return self.statuses[row]
+
+    def url_contents(self, row):
+        return self.contents[row]
+
+    def runs(self):
+        # (URL position, status code, content ID, start crawl, number of crawls) of each run
+        # of crawls in which a URL held the same status and content ID, in URL then crawl
+        # order, as a LifetimeStore keeps them
+        (contents, statuses) = (self.contents, self.statuses)
+        run_starts = np.ones(contents.shape, dtype=bool)
+        run_starts[:, 1:] = (contents[:, 1:] != contents[:, :-1]) | (statuses[:, 1:] != statuses[:, :-1])
+        (url_positions, crawl_starts) = np.nonzero(run_starts)
+
+        # Every row starts a run, so each run ends where the next (in row-major order) starts
+        flat_starts = url_positions.astype(np.int64) * contents.shape[1] + crawl_starts
+        lengths = np.diff(np.append(flat_starts, contents.size))
+        return (url_positions.astype(np.int32), statuses[url_positions, crawl_starts].astype(np.uint8), contents[url_positions, crawl_starts],
+            crawl_starts.astype(np.int32), lengths.astype(np.int32))
+
+def build_lifetime_matrix(all_url_queries, crawl_times, num_workers=1):
+    urls = list(all_url_queries)
+
+    crawl_positions = { crawl : i for i, crawl in enumerate(crawl_times) }
+    content_ids = dict()
+    url_positions, crawl_columns, url_contents = [], [], []
+    for row, url in enumerate(urls):
+        for (crawl, content) in all_url_queries[url].items():
+            if content_is_missing(content):
+                content_id = NO_CONTENT
+            else:
+                content_id = content_ids.setdefault(content, len(content_ids))
+            url_positions.append(row)
+            crawl_columns.append(crawl_positions[crawl])
+            url_contents.append(content_id)
+
+    matrix = LifetimeMatrix(urls, crawl_times, list(content_ids))
+    matrix.contents[url_positions, crawl_columns] = url_contents
+
+    fill_lifetime_matrix(matrix, num_workers)
+    return matrix
+
+def build_lifetime_matrix_from_observations(observations, num_workers=1):
+    matrix = LifetimeMatrix(observations.urls, observations.crawl_times, observations.contents)
+    matrix.contents[observations.url_ids, observations.crawl_positions] = observations.content_ids
+
+    fill_lifetime_matrix(matrix, num_workers)
+    return matrix
+
+def fill_lifetime_matrix(matrix, num_workers=1):
+    if num_workers > 1:
+        fill_lifetime_matrix_in_parallel(matrix, num_workers)
+        return
+
+    for i in range(matrix.contents.shape[1]):
+        matrix.statuses[:, i] = matrix.add_crawl(matrix.contents[:, i])
+
+### Fill the lifetime matrix with one process per shard of URLs
+
+def url_shards(num_urls, num_shards):
+    # Multiplicative hash of each URL position, so that shards mix old and new URLs
+    hashes = (np.arange(num_urls, dtype=np.uint64) * np.uint64(2654435761)) & np.uint64(0xffffffff)
+    return (hashes % np.uint64(num_shards)).astype(np.int32)
+
+def fill_lifetime_shard(task):
+    # Runs in a worker process. Reads the shard's rows of the shared content matrix,
+    # writes their statuses into the shared status matrix and returns their columns.
+    (contents_name, statuses_name, shape, num_contents, num_shards, shard) = task
+
+    contents_memory = shared_memory.SharedMemory(name=contents_name)
+    statuses_memory = shared_memory.SharedMemory(name=statuses_name)
+    try:
+        contents = np.ndarray(shape, dtype=np.int32, buffer=contents_memory.buf)
+        statuses = np.ndarray(shape, dtype=np.int8, buffer=statuses_memory.buf)
+
+        rows = np.flatnonzero(url_shards(shape[0], num_shards) == shard)
+        shard_contents = contents[rows]
+        shard_statuses = np.empty((len(rows), shape[1]), dtype=np.int8)
+
+        columns = LifetimeColumns(len(rows), num_contents)
+        for i in range(shape[1]):
+            shard_statuses[:, i] = columns.add_crawl(shard_contents[:, i])
+        statuses[rows] = shard_statuses
+
+        del contents, statuses
+        return rows, columns
+    finally:
+        contents_memory.close()
+        statuses_memory.close()
+
+def merge_lifetime_shard(lifetimes, rows, shard):
+    for name in URL_COLUMNS:
+        getattr(lifetimes, name)[rows] = getattr(shard, name)
+
+    lifetimes.status_totals += shard.status_totals
+
+    first_positions = lifetimes.content_first_crawl_positions
+    shard_first_positions = shard.content_first_crawl_positions
+    earlier = (shard_first_positions >= 0) & ((first_positions < 0) | (shard_first_positions < first_positions))
+    first_positions[earlier] = shard_first_positions[earlier]
+
+    lifetimes.revert_url_positions = np.append(lifetimes.revert_url_positions, rows[shard.revert_url_positions].astype(np.int32))
+    lifetimes.revert_distances = np.append(lifetimes.revert_distances, shard.revert_distances)
+
+    # Shard keys hold shard-local URL positions in their high bits
+    (keys, positions) = shard.content_last_seen.entries()
+    keys = (rows[keys >> 32].astype(np.int64) << 32) | (keys & 0xffffffff)
+    lifetimes.content_last_seen.extend(keys, positions)
+
+def fill_lifetime_matrix_in_parallel(matrix, num_workers):
+    shape = matrix.contents.shape
+    contents_memory = shared_memory.SharedMemory(create=True, size=max(1, matrix.contents.nbytes))
+    statuses_memory = shared_memory.SharedMemory(create=True, size=max(1, matrix.statuses.nbytes))
+    try:
+        np.ndarray(shape, dtype=np.int32, buffer=contents_memory.buf)[:] = matrix.contents
+
+        tasks = [
+            (contents_memory.name, statuses_memory.name, shape, len(matrix.content_first_crawl_positions), num_workers, shard)
+            for shard in range(num_workers)
+        ]
+        # build-figures.py does its work at import time, so workers must be forked rather than spawned
+        with multiprocessing.get_context("fork").Pool(num_workers) as pool:
+            shards = pool.map(fill_lifetime_shard, tasks)
+
+        matrix.statuses[:] = np.ndarray(shape, dtype=np.int8, buffer=statuses_memory.buf)
+    finally:
+        contents_memory.close()
+        contents_memory.unlink()
+        statuses_memory.close()
+        statuses_memory.unlink()
+
+    matrix.status_totals = np.zeros((shape[1], len(Status)), dtype=np.int64)
+    for (rows, shard) in shards:
+        merge_lifetime_shard(matrix, rows, shard)
+
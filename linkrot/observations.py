@@ -0,0 +1,180 @@
+# Interning rows into integer IDs, and caching the result as flat arrays
+
+import os
+import csv
+import hashlib
+from array import array
+
+import numpy as np
+
+from .inputs import NO_CONTENT, MISSING_CONTENT, READ_CHUNK_SIZE, content_is_missing, crawl_time_ms, crawl_time_milliseconds
+
+class CrawlObservations:
+    # Interned (url, content, crawl) rows. Each distinct string is held once, in its
+    # table, and each row costs three ints. Crawls are keyed by their time in milliseconds.
+
+    def __init__(self):
+        self.url_table = dict()
+        self.content_table = dict()
+        self.crawl_table = dict()
+
+        self.url_ids = array("i")
+        self.content_ids = array("i")
+        self.crawl_ids = array("i")
+
+    def finish(self):
+        # Sort the crawl axis, then sort rows by (url, crawl position) keeping the last
+        # row for each pair, like the nested dicts do
+        self.urls = list(self.url_table)
+        self.contents = list(self.content_table)
+        self.crawl_times = sorted(self.crawl_table)
+
+        crawl_id_positions = np.empty(len(self.crawl_times), dtype=np.int32)
+        for i, crawl in enumerate(self.crawl_times):
+            crawl_id_positions[self.crawl_table[crawl]] = i
+
+        url_ids = np.frombuffer(self.url_ids, dtype=np.int32)
+        crawl_positions = crawl_id_positions[np.frombuffer(self.crawl_ids, dtype=np.int32)]
+        keys = url_ids.astype(np.int64) * len(self.crawl_times) + crawl_positions
+        order = np.argsort(keys, kind="stable")
+        is_last = np.append(keys[order][1:] != keys[order][:-1], True)
+        order = order[is_last]
+
+        self.url_ids = url_ids[order]
+        self.content_ids = np.frombuffer(self.content_ids, dtype=np.int32)[order]
+        self.crawl_positions = crawl_positions[order]
+        del self.crawl_table
+
+    def url_queries(self):
+        # Yields (url, { crawl time : content }) in the format of all_url_queries
+        url_starts = np.flatnonzero(np.append(True, self.url_ids[1:] != self.url_ids[:-1]))
+        url_ends = np.append(url_starts[1:], len(self.url_ids))
+        for start, end in zip(url_starts.tolist(), url_ends.tolist()):
+            yield self.urls[self.url_ids[start]], {
+                self.crawl_times[crawl] : (self.contents[content] if content >= 0 else MISSING_CONTENT)
+                for (crawl, content) in zip(self.crawl_positions[start:end].tolist(), self.content_ids[start:end].tolist())
+            }
+
+def read_observations(lines):
+    observations = CrawlObservations()
+    intern_rows(observations, lines)
+    observations.finish()
+    return observations
+
+def intern_rows(observations, lines):
+    # Appends rows to unfinished observations, whose tables may already hold the strings
+    # and crawls of other rows
+    url_table = observations.url_table
+    content_table = observations.content_table
+    crawl_table = observations.crawl_table
+    url_ids = observations.url_ids
+    content_ids = observations.content_ids
+    crawl_ids = observations.crawl_ids
+    crawl_literal_ids = dict()
+
+    for (url, content, crawl_time) in csv.reader(lines, delimiter="\t", quoting=csv.QUOTE_NONE):
+        url_id = url_table.get(url)
+        if url_id is None:
+            url_id = url_table[url] = len(url_table)
+
+        if content_is_missing(content):
+            content_id = NO_CONTENT
+        else:
+            content_id = content_table.get(content)
+            if content_id is None:
+                content_id = content_table[content] = len(content_table)
+
+        crawl_id = crawl_literal_ids.get(crawl_time)
+        if crawl_id is None:
+            crawl_id = crawl_literal_ids[crawl_time] = crawl_table.setdefault(crawl_time_ms(crawl_time), len(crawl_table))
+
+        url_ids.append(url_id)
+        content_ids.append(content_id)
+        crawl_ids.append(crawl_id)
+
+def read_url_queries(lines):
+    # Reads rows into nested { url : { crawl time : content } } dicts, and returns them
+    # with the sorted crawl times
+    all_url_queries = dict()
+    crawl_times_set = set()
+
+    for line in lines:
+        # Remove \n and get tsv column values
+        parts = line[:-1].split("\t")
+        url = parts[0]
+        content = parts[1]
+        crawl_time = crawl_time_milliseconds.get(parts[2])
+        if crawl_time is None:
+            crawl_time = crawl_time_ms(parts[2])
+
+        crawl_times_set.add(crawl_time)
+
+        if url not in all_url_queries:
+            all_url_queries[url] = dict()
+        all_url_queries[url][crawl_time] = content
+
+    crawl_times = list(crawl_times_set)
+    crawl_times.sort()
+    return all_url_queries, crawl_times
+
+### Cache interned rows as flat arrays, keyed by a hash of the input files
+
+OBSERVATIONS_CACHE_VERSION = "3"
+
+def observations_cache_key(input_paths, query_shape=None, merge_shards=False):
+    digest = hashlib.sha256(OBSERVATIONS_CACHE_VERSION.encode())
+    if query_shape is not None:
+        digest.update(b"nquads:" + query_shape.encode() + b"\0")
+    if merge_shards:
+        digest.update(b"shards\0")
+    for path in input_paths:
+        digest.update(os.path.abspath(path).encode() + b"\0")
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(READ_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def write_string_table(path, strings):
+    with open(path, "w") as file:
+        file.write("\n".join(strings))
+
+def read_string_table(path):
+    with open(path, "r") as file:
+        text = file.read()
+    return text.split("\n") if text else []
+
+def save_observations_cache(cache_directory, key, observations):
+    os.makedirs(cache_directory, exist_ok=True)
+
+    # Remove the key first so that a partially written cache is never loaded
+    key_path = os.path.join(cache_directory, "key")
+    if os.path.exists(key_path):
+        os.remove(key_path)
+
+    write_string_table(os.path.join(cache_directory, "urls.txt"), observations.urls)
+    write_string_table(os.path.join(cache_directory, "contents.txt"), observations.contents)
+    np.save(os.path.join(cache_directory, "crawl-times.npy"), np.array(observations.crawl_times, dtype=np.int64))
+    np.save(os.path.join(cache_directory, "url-ids.npy"), observations.url_ids.astype(np.int32))
+    np.save(os.path.join(cache_directory, "content-ids.npy"), observations.content_ids.astype(np.int32))
+    np.save(os.path.join(cache_directory, "crawl-positions.npy"), observations.crawl_positions.astype(np.int32))
+
+    with open(key_path, "w") as file:
+        file.write(key)
+
+def load_observations_cache(cache_directory, key):
+    # Returns the cached observations, or None if there is no cache for key
+    try:
+        with open(os.path.join(cache_directory, "key"), "r") as file:
+            if file.read() != key:
+                return None
+    except OSError:
+        return None
+
+    observations = CrawlObservations()
+    observations.urls = read_string_table(os.path.join(cache_directory, "urls.txt"))
+    observations.contents = read_string_table(os.path.join(cache_directory, "contents.txt"))
+    observations.crawl_times = np.load(os.path.join(cache_directory, "crawl-times.npy")).tolist()
+    observations.url_ids = np.load(os.path.join(cache_directory, "url-ids.npy"), mmap_mode="r")
+    observations.content_ids = np.load(os.path.join(cache_directory, "content-ids.npy"), mmap_mode="r")
+    observations.crawl_positions = np.load(os.path.join(cache_directory, "crawl-positions.npy"), mmap_mode="r")
+    return observations
@@ -0,0 +1,161 @@
+# Wall time, CPU time, peak memory and throughput of each stage of a run, and a sampling
+# profiler that writes a chosen stage's stacks in the collapsed format of flame graph tools
+# (flamegraph.pl, speedscope)
+
+import os
+import json
+import time
+import signal
+import resource
+import contextlib
+from collections import Counter
+from itertools import count
+from operator import itemgetter
+
+def cpu_seconds():
+    # Of this process and of the worker processes it has waited for
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def counted(iterable, counter):
+    # Yields the items of iterable; next(counter) is then the number yielded
+    return map(itemgetter(0), zip(iterable, counter))
+
+class StageRecord:
+
+    def __init__(self, name, depth=0):
+        self.name = name
+        self.depth = depth              # Number of stages this one is nested in
+        self.start_seconds = None       # Since the profile was created
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_mb = None
+        self.peak_rss_delta_mb = None   # How much the stage raised the process's peak RSS
+        self.num_rows = None            # Set by the stage, for throughput
+        self.num_urls = None
+        self.row_counter = None
+
+    def count_rows(self, rows):
+        # Counts the rows as the stage consumes them
+        self.row_counter = count()
+        return counted(rows, self.row_counter)
+
+    def finish_counting_rows(self):
+        if self.row_counter is not None:
+            self.num_rows = next(self.row_counter)
+
+    def as_dict(self):
+        record = {
+            "name" : self.name,
+            "depth" : self.depth,
+            "start_seconds" : round(self.start_seconds, 4),
+            "wall_seconds" : round(self.wall_seconds, 4),
+            "cpu_seconds" : round(self.cpu_seconds, 4),
+            "peak_rss_mb" : round(self.peak_rss_mb, 1),
+            "peak_rss_delta_mb" : round(self.peak_rss_delta_mb, 1),
+        }
+        for (name, value) in [("rows", self.num_rows), ("urls", self.num_urls)]:
+            if value is not None:
+                record["num_" + name] = value
+                record[name + "_per_second"] = round(value / self.wall_seconds) if self.wall_seconds > 0 else None
+        return record
+
+class StackSampler:
+    # Records the Python stack every interval seconds of CPU time (SIGPROF). Only the main
+    # thread of this process is sampled, so forked worker processes are not
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler)
+
+    def collapsed_stacks(self):
+        return "".join("%s %d\n" % (stack, num_samples) for (stack, num_samples) in sorted(self.stacks.items()))
+
+class RunProfile:
+    # The StageRecords of a run, in the order stages started
+
+    def __init__(self, sample_stage=None, sample_interval=0.005):
+        self.stages = []
+        self.depth = 0
+        self.created = time.perf_counter()
+        self.sample_stage = sample_stage
+        self.sample_interval = sample_interval
+        self.sampler = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = StageRecord(name, self.depth)
+        self.stages.append(record)
+        self.depth += 1
+
+        sampler = None
+        if name == self.sample_stage and self.sampler is None:
+            sampler = self.sampler = StackSampler(self.sample_interval)
+            sampler.start()
+
+        start_wall = time.perf_counter()
+        start_cpu = cpu_seconds()
+        start_peak_rss = peak_rss_mb()
+        try:
+            yield record
+        finally:
+            if sampler is not None:
+                sampler.stop()
+            record.start_seconds = start_wall - self.created
+            record.wall_seconds = time.perf_counter() - start_wall
+            record.cpu_seconds = cpu_seconds() - start_cpu
+            record.peak_rss_mb = peak_rss_mb()
+            record.peak_rss_delta_mb = record.peak_rss_mb - start_peak_rss
+            self.depth -= 1
+
+    def summary(self):
+        # A text table of the finished stages
+        lines = ["%-28s %9s %9s %10s %10s %12s %12s" % ("Stage", "Wall (s)", "CPU (s)", "Peak (MB)", "+Peak (MB)", "Rows/s", "URLs/s")]
+        for record in self.stages:
+            if record.wall_seconds is None:
+                continue
+            stats = record.as_dict()
+            lines.append("%-28s %9.2f %9.2f %10.0f %10.0f %12s %12s" % (
+                "  " * record.depth + record.name, record.wall_seconds, record.cpu_seconds, record.peak_rss_mb, record.peak_rss_delta_mb,
+                "{0:,}".format(stats["rows_per_second"]) if stats.get("rows_per_second") is not None else "",
+                "{0:,}".format(stats["urls_per_second"]) if stats.get("urls_per_second") is not None else ""))
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_directory):
+        # Writes profile.json, and the sampled stage's stacks to profile-STAGE.collapsed
+        profile = {
+            "stages" : [record.as_dict() for record in self.stages if record.wall_seconds is not None],
+            "sampled_stage" : self.sample_stage,
+            "sample_interval" : self.sample_interval,
+        }
+        with open(os.path.join(output_directory, "profile.json"), "w") as file:
+            json.dump(profile, file, indent=1)
+
+        if self.sampler is not None:
+            with open(os.path.join(output_directory, "profile-%s.collapsed" % self.sample_stage), "w") as file:
+                file.write(self.sampler.collapsed_stacks())
+
+def profile_stage(profile, name):
+    # profile.stage(name), or a stage that records nothing without a profile
+    if profile is None:
+        return contextlib.nullcontext(StageRecord(name))
+    return profile.stage(name)
@@ -0,0 +1,146 @@
+# Extracting (url, content, crawl time) rows straight from a Preston provenance log (N-Quads)
+
+import re
+import sys
+
+NQUADS_TERM = r'(<[^>]*>|_:\S+|"(?:[^"\\]|\\.)*"(?:\^\^<[^>]*>|@[A-Za-z][A-Za-z0-9-]*)?)'
+NQUADS_LINE = re.compile(r"\s*%s\s+%s\s+%s(?:\s+%s)?\s*\.\s*$" % ((NQUADS_TERM,) * 4))
+
+RDF_TYPE                = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+PROV_ORGANIZATION       = "<http://www.w3.org/ns/prov#Organization>"
+PROV_WAS_INFORMED_BY    = "<http://www.w3.org/ns/prov#wasInformedBy>"
+PROV_USED               = "<http://www.w3.org/ns/prov#used>"
+PROV_GENERATED_AT_TIME  = "<http://www.w3.org/ns/prov#generatedAtTime>"
+PROV_STARTED_AT_TIME    = "<http://www.w3.org/ns/prov#startedAtTime>"
+PROV_QUALIFIED_GENERATION = "<http://www.w3.org/ns/prov#qualifiedGeneration>"
+
+NQUADS_PREDICATES = { RDF_TYPE, PROV_WAS_INFORMED_BY, PROV_USED, PROV_GENERATED_AT_TIME, PROV_STARTED_AT_TIME, PROV_QUALIFIED_GENERATION }
+
+# The organization each sparql-queries/select-*-by-activity.rq kickstarts its crawl from
+NQUADS_QUERY_SHAPES = {
+    "idigbio" : "<https://idigbio.org>",
+    "gbif"    : "<https://gbif.org>",
+    "bhl"     : "<https://biodiversitylibrary.org>",
+    "dataone" : None,   # select-dataone.rq follows prov:wasInformedBy+ from any crawl
+}
+
+GBIF_PAGE_URL_PREFIX = "<https://api.gbif.org/v1/dataset"
+DATAONE_SOLR_QUERY_URL_PREFIX = "<http://cn.dataone.org/cn/v2/query/solr/"
+
+class ProvenanceIndex:
+    # The statements the by-activity queries join on, keyed by activity IRI. Preston
+    # writes each activity's statements into a graph named after the activity, so only
+    # the kickstart's organization needs its graph.
+
+    def __init__(self):
+        self.informed_by = dict()       # activity -> the activity that informed it
+        self.used = dict()              # generation -> URL it queried
+        self.generated_at = set()       # generations with a prov:generatedAtTime
+        self.started_at = dict()        # crawl -> start time literal
+        self.kickstarts = set()         # (kickstart activity, organization)
+        self.generations = list()       # (content, generation)
+        self.num_malformed_lines = 0
+
+    def add(self, subject, predicate, object, graph):
+        if predicate == PROV_WAS_INFORMED_BY:
+            self.informed_by[sys.intern(subject)] = sys.intern(object)
+        elif predicate == PROV_USED:
+            self.used[sys.intern(subject)] = object
+        elif predicate == PROV_QUALIFIED_GENERATION:
+            self.generations.append((subject, sys.intern(object)))
+        elif predicate == PROV_GENERATED_AT_TIME:
+            self.generated_at.add(sys.intern(subject))
+        elif predicate == PROV_STARTED_AT_TIME:
+            self.started_at[sys.intern(subject)] = object
+        elif predicate == RDF_TYPE and object == PROV_ORGANIZATION and graph is not None:
+            self.kickstarts.add((sys.intern(graph), subject))
+
+    def informers(self, activity, max_hops):
+        # The activities max_hops or fewer prov:wasInformedBy hops upstream, nearest first
+        chain = []
+        while len(chain) < max_hops:
+            activity = self.informed_by.get(activity)
+            if activity is None:
+                break
+            chain.append(activity)
+        return chain
+
+    def kickstart_crawl_date(self, chain, hops, network):
+        # The start time of the crawl whose kickstart for network is hops upstream
+        if len(chain) < hops or (chain[hops - 1], network) not in self.kickstarts:
+            return None
+        return self.started_at.get(self.informed_by.get(chain[hops - 1]))
+
+def read_provenance(lines):
+    index = ProvenanceIndex()
+    match_line = NQUADS_LINE.match
+    add = index.add
+    for line in lines:
+        # Preston writes "<s> <p> <o> <g> .", so most lines split on spaces; the regex is
+        # only needed for literals with spaces and the like
+        parts = line.split(" ")
+        if len(parts) == 5 and parts[4].rstrip() == "." and "" not in parts and not parts[2].startswith('"'):
+            if parts[1] in NQUADS_PREDICATES:
+                add(parts[0], parts[1], parts[2], parts[3])
+            continue
+
+        match = match_line(line)
+        if match is None:
+            if line.strip() and not line.lstrip().startswith("#"):
+                index.num_malformed_lines += 1
+            continue
+        if match.group(2) in NQUADS_PREDICATES:
+            add(*match.groups())
+
+    if index.num_malformed_lines > 0:
+        print("Skipped %d malformed N-Quads lines" % index.num_malformed_lines)
+    return index
+
+def provenance_rows(index, query_shape):
+    # Yields "url\tcontent\tcrawl_date\n" rows, like the query output of the shape's .rq file
+    network = NQUADS_QUERY_SHAPES[query_shape]
+    num_rows = 0
+    for (content, generation) in index.generations:
+        url = index.used.get(generation)
+        if url is None:
+            continue
+
+        if query_shape == "dataone":
+            if url.startswith(DATAONE_SOLR_QUERY_URL_PREFIX):
+                continue
+            seen = set()
+            activity = index.informed_by.get(generation)
+            while activity is not None and activity not in seen:
+                seen.add(activity)
+                crawl_date = index.started_at.get(activity)
+                if crawl_date is not None:
+                    num_rows += 1
+                    yield "%s\t%s\t%s\n" % (url, content, crawl_date)
+                activity = index.informed_by.get(activity)
+            continue
+
+        if generation not in index.generated_at:
+            continue
+
+        chain = index.informers(generation, 5)
+        if query_shape == "idigbio":
+            # dataset gen -> rss parse -> rss gen -> pubs parse -> pubs gen -> kickstart
+            crawl_date = index.kickstart_crawl_date(chain, 5, network)
+        elif query_shape == "bhl":
+            # dataset gen -> registry parse -> registry gen -> kickstart
+            crawl_date = index.kickstart_crawl_date(chain, 3, network)
+        else:
+            # dataset gen -> first page parse -> first page gen -> kickstart, or
+            # dataset gen -> page parse -> page gen -> first page parse -> first page gen -> kickstart
+            crawl_date = None
+            if not url.startswith(GBIF_PAGE_URL_PREFIX):
+                crawl_date = index.kickstart_crawl_date(chain, 3, network)
+            if crawl_date is None and len(chain) > 1 and index.used.get(chain[1], "").startswith(GBIF_PAGE_URL_PREFIX):
+                crawl_date = index.kickstart_crawl_date(chain, 5, network)
+
+        if crawl_date is not None:
+            num_rows += 1
+            yield "%s\t%s\t%s\n" % (url, content, crawl_date)
+
+    if num_rows == 0:
+        print("Found no %s dataset queries in the provenance log" % query_shape)
@@ -0,0 +1,192 @@
+# The "totals" file, report.txt and the other plain-text outputs. Nothing here needs
+# pandas or matplotlib, so reports can be written without a plotting stack
+
+import os
+
+import numpy as np
+
+def totals_table(totals):
+    # The (label, value) pairs of the "totals" file
+    return {
+        "total_num_urls" : totals.total_num_urls,
+        "total_num_resolves" : totals.total_num_resolves,
+        "total_num_breaks" : totals.total_num_breaks,
+        "total_num_contents" : totals.total_num_contents,
+        "total_num_content_changes" : totals.total_num_content_changes,
+        "maxnum_content_changes" : totals.max_num_content_changes,
+        "total_num_reverts" : totals.total_num_reverts,
+        "num_never_responded" : totals.num_never_responded,
+        "num_unreliable" : totals.num_unreliable,
+        "num_unstable" : totals.num_unstable,
+        "num_unresponsive" : totals.num_unresponsive
+    }
+
+def text_report(totals):
+    total_num_urls = totals.total_num_urls
+    num_unreliable = totals.num_unreliable
+    num_unresponsive = totals.num_unresponsive
+    max_num_content_changes = totals.max_num_content_changes
+
+    text_report = ""
+
+    # Totals
+    text_report += ("Of all %s observed URLs,\n"
+        % ("{0:,}".format(total_num_urls)))
+    text_report += ("\t%s of URLs (%s total) were responsive\n"
+        % ("{0:.2%}".format(totals.num_responsive / total_num_urls), "{0:,}".format(totals.num_responsive)))
+    text_report += ("\t%s of URLs (%s total) were stable\n"
+        % ("{0:.2%}".format(totals.num_stable / totals.num_responded), "{0:,}".format(totals.num_stable)))
+    text_report += ("\t%s of URLs (%s total) were reliable (both responsive and stable)\n"
+        % ("{0:.2%}".format(totals.num_reliable / total_num_urls), "{0:,}".format(totals.num_reliable)))
+    text_report += ("\t%s of URLs (%s total) were responsive in the last crawl\n"
+        % ("{0:.2%}".format(num_unresponsive / total_num_urls), "{0:,}".format(num_unresponsive)))
+    text_report += ("\t%s of URLs (%s total) never responded in any crawl\n"
+        % ("{0:.2%}".format(totals.num_never_responded / total_num_urls), "{0:,}".format(totals.num_never_responded)))
+    text_report += ("\t%s of URLs (%s total) were abandoned\n"
+        % ("{0:.2%}".format(totals.num_abandoned / total_num_urls), "{0:,}".format(totals.num_abandoned)))
+
+    # Unreliable URLs
+    text_report += "\n"
+    text_report += ("Of the %s unreliable URLs,\n"
+        % ("{0:,}".format(num_unreliable)))
+    text_report += ("\t%s of unreliable URLs (%s total) were not always responsive\n"
+        % ("{0:.2%}".format(num_unresponsive / num_unreliable), "{0:,}".format(num_unresponsive)))
+    text_report += ("\t%s of unreliable URLs (%s total) were not always stable\n"
+        % ("{0:.2%}".format(totals.num_unstable / num_unreliable), "{0:,}".format(totals.num_unstable)))
+
+    # Behavior
+    text_report += "\n"
+    text_report += ("URLs break %s of the time between queries\n"
+        % ("{0:.2%}".format(totals.total_num_breaks / (totals.total_num_resolves + totals.total_num_breaks))))
+    text_report += ("URLs contents change %s of the time between queries\n"
+        % ("{0:.2%}".format(totals.total_num_content_changes / max_num_content_changes)))
+    text_report += ("URLs contents revert to a previously seen version %s of the time between queries\n"
+        % ("{0:.2%}".format(totals.total_num_reverts / max_num_content_changes)))
+
+    return text_report
+
+def write_report(totals, output_directory):
+    # Writes "totals", report.txt and revert-distance-freq-dist.tsv, and returns the report
+    with open(os.path.join(output_directory, "totals"), 'w') as file:
+        file.write("\n".join([ "%s\t%d" % (label, value) for (label, value) in totals_table(totals).items()]))
+
+    report = text_report(totals)
+    with open(os.path.join(output_directory, "report.txt"), "w+") as file:
+        file.write(report)
+
+    # How many crawls back reverted-to content was last seen
+    with open(os.path.join(output_directory, "revert-distance-freq-dist.tsv"), "w") as file:
+        file.write("revert_distance\tnum_reverts\n")
+        file.write("".join([ "%d\t%d\n" % (distance, count) for (distance, count) in sorted(totals.revert_distance_frequencies.items()) ]))
+
+    return report
+
+def approximate_report(approximate):
+    # The network-wide numbers of report.txt, estimated by an ApproximateAnalysis, with
+    # the half-widths of their error bounds
+    from .approximate import proportion_bounds
+
+    def estimate(value, error, format="{0:.2%}"):
+        return "%s (+/- %s)" % (format.format(value), format.format(error))
+
+    totals = approximate.sample_totals
+    num_urls = approximate.url_estimates[-1] if approximate.num_crawls > 0 else 0
+    num_contents = approximate.content_estimates[-1] if approximate.num_crawls > 0 else 0
+
+    approximate_report = ""
+    approximate_report += ("Of about %s observed URLs, returning about %s distinct contents,\n"
+        % (estimate(num_urls, approximate.count_error(num_urls), "{0:,.0f}"), estimate(num_contents, approximate.count_error(num_contents), "{0:,.0f}")))
+    for (label, count, num_trials) in [
+            ("were responsive", totals.num_responsive, totals.total_num_urls),
+            ("were stable", totals.num_stable, totals.num_responded),
+            ("were reliable (both responsive and stable)", totals.num_reliable, totals.total_num_urls),
+            ("never responded in any crawl", totals.num_never_responded, totals.total_num_urls),
+            ("were abandoned", totals.num_abandoned, totals.total_num_urls)]:
+        proportion, error = proportion_bounds(count, num_trials)
+        approximate_report += "\tabout %s of URLs %s\n" % (estimate(proportion, error), label)
+
+    rates = approximate.rates()
+    approximate_report += "\n"
+    approximate_report += "URLs break %s of the time between queries\n" % estimate(*rates["break"])
+    approximate_report += "URLs contents change %s of the time between queries\n" % estimate(*rates["change"])
+    approximate_report += "URLs contents revert to a previously seen version %s of the time between queries\n" % estimate(*rates["revert"])
+
+    approximate_report += "\n"
+    approximate_report += ("Counts are HyperLogLog estimates (standard error %s); percentages are over a uniform sample of %s URLs. Error bounds are about 95%%.\n"
+        % ("{0:.2%}".format(approximate.relative_error), "{0:,}".format(approximate.num_sampled_urls)))
+    return approximate_report
+
+def write_approximate_report(approximate, output_directory):
+    # Writes approximate-report.txt and returns it
+    report = approximate_report(approximate)
+    with open(os.path.join(output_directory, "approximate-report.txt"), "w") as file:
+        file.write(report)
+    return report
+
+def overlap_report(batch):
+    # How many URLs and contents networks in a NetworkBatch have in common
+    from .batch import network_counts
+
+    overlap_report = ""
+    for (label, verb, network_ids) in [("URLs", "crawled", batch.network_url_ids), ("contents", "returned", batch.network_content_ids)]:
+        counts = network_counts(network_ids)
+        num_ids = int(np.count_nonzero(counts))
+        num_shared = int(np.count_nonzero(counts > 1))
+        overlap_report += ("Of all %s %s across %d networks, %s (%s) were %s by more than one network\n"
+            % ("{0:,}".format(num_ids), label, len(network_ids), "{0:,}".format(num_shared), "{0:.2%}".format(num_shared / max(num_ids, 1)), verb))
+        for (network, ids) in network_ids.items():
+            num_network_shared = int(np.count_nonzero(counts[ids] > 1))
+            overlap_report += ("\t%s of %s's %s %s (%s total) were also %s by another network\n"
+                % ("{0:.2%}".format(num_network_shared / max(len(ids), 1)), network, "{0:,}".format(len(ids)), label, "{0:,}".format(num_network_shared), verb))
+        overlap_report += "\n"
+
+    return overlap_report
+
+def write_overlap_report(batch, output_directory):
+    # Writes network-overlap.tsv, with the URLs and contents each pair of networks have in
+    # common, and network-overlap.txt, and returns the text report
+    from .batch import network_overlap
+
+    url_overlap = network_overlap(batch.network_url_ids)
+    content_overlap = network_overlap(batch.network_content_ids)
+    with open(os.path.join(output_directory, "network-overlap.tsv"), "w") as file:
+        file.write("network\tother_network\tshared_urls\tshared_contents\n")
+        file.write("".join([ "%s\t%s\t%d\t%d\n" % (network, other, url_overlap[(network, other)], content_overlap[(network, other)]) for (network, other) in url_overlap ]))
+
+    report = overlap_report(batch)
+    with open(os.path.join(output_directory, "network-overlap.txt"), "w") as file:
+        file.write(report)
+    return report
+
+def window_report(index, start, end):
+    # report.txt's numbers over crawls start through end of a WindowIndex
+    from .inputs import format_crawl_time
+
+    totals = { name : value.item() for (name, value) in index.totals(start, end).items() }
+    num_urls = totals["num_urls"]
+
+    window_report = ""
+    window_report += ("Between the crawls of %s and %s (%d crawls), of the %s URLs queried (%s new), returning %s distinct contents (%s new),\n"
+        % (format_crawl_time(index.crawl_times[start]), format_crawl_time(index.crawl_times[end]), totals["num_crawls"],
+           "{0:,}".format(num_urls), "{0:,}".format(totals["num_new_urls"]), "{0:,}".format(totals["num_contents"]), "{0:,}".format(totals["num_new_contents"])))
+    window_report += ("\t%s of URLs (%s total) were responsive\n"
+        % ("{0:.2%}".format(totals["percent_responsive"]), "{0:,}".format(num_urls - totals["num_unresponsive"])))
+    window_report += ("\t%s of URLs (%s total) were stable\n"
+        % ("{0:.2%}".format(totals["percent_stable"]), "{0:,}".format(totals["num_responded"] - totals["num_unstable"])))
+    window_report += ("\t%s of URLs (%s total) were reliable (both responsive and stable)\n"
+        % ("{0:.2%}".format(totals["percent_reliable"]), "{0:,}".format(num_urls - totals["num_unreliable"])))
+    window_report += ("\t%s URLs were abandoned during the window\n"
+        % ("{0:,}".format(totals["num_abandoned"])))
+
+    window_report += "\n"
+    window_report += "URLs break %s of the time between queries\n" % "{0:.2%}".format(totals["break_rate"])
+    window_report += "URLs contents change %s of the time between queries\n" % "{0:.2%}".format(totals["change_rate"])
+    window_report += "URLs contents revert to a previously seen version %s of the time between queries\n" % "{0:.2%}".format(totals["revert_rate"])
+    return window_report
+
+def write_window_report(index, start, end, output_directory):
+    # Writes window-report.txt and returns it
+    report = window_report(index, start, end)
+    with open(os.path.join(output_directory, "window-report.txt"), "w") as file:
+        file.write(report)
+    return report
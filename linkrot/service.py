@@ -0,0 +1,340 @@
+# A long-running service that keeps networks' lifetimes in memory and answers JSON
+# queries over HTTP, on a local port or a Unix socket: a URL's timeline, report.txt's
+# counts per host (or for a set of hosts), report.txt's numbers over a window of crawls,
+# and figures over any time frame. The indexes each query needs are built on its first use
+# and kept; drawn figures are kept in an LRU cache
+#
+#   GET /networks
+#   GET /url?network=iDigBio&url=<https://...>
+#   GET /hosts?network=iDigBio[&host=a.org&host=b.org][&path_depth=1][&limit=20]
+#   GET /window?network=iDigBio[&start=2019-09-01T00:00:00Z][&end=2020-01-01T00:00:00Z]
+#   GET /figure?network=iDigBio&name=reliability-over-time[&start=...][&end=...][&variant=annotated][&format=png]
+
+import os
+import json
+import stat
+import tempfile
+import threading
+import socketserver
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from .inputs import NOT_QUERIED, NO_CONTENT, MISSING_CONTENT, format_crawl_time, parse_crawl_time
+from .lifetimes import Status, LIFETIME_POSITIONS, LIFETIME_COUNTS
+from .groups import GROUP_COUNTS, GROUP_FRACTIONS, GroupTotals, group_totals, worst_groups_frame
+from .windows import WINDOW_COUNTS, WINDOW_FRACTIONS, build_window_index
+from .report import window_report
+from .totals import crawl_frames
+from .cooccurrence import content_migrations, migrations_frame
+
+DEFAULT_PORT = 8470
+
+# Which file of a figure /figure returns, and the style each format is drawn in
+FIGURE_VARIANTS = { "bare" : "", "annotated" : "-annotated", "legend" : "-legend" }
+FIGURE_FORMATS = { "png" : ("draft", "image/png"), "pdf" : ("paper", "application/pdf") }
+
+class NotFound(LookupError):
+    # An unknown network, URL, host or figure, which ServiceRequestHandler answers with a 404
+    pass
+
+def json_number(value):
+    # JSON has no NaN
+    value = value.item() if hasattr(value, "item") else value
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+def canonical_crawl_time(literal):
+    # A crawl time literal written as format_crawl_time would, or None for None
+    if literal is None:
+        return None
+    try:
+        return format_crawl_time(parse_crawl_time(literal))
+    except (ValueError, IndexError):
+        raise ValueError("Cannot read crawl time %s; write e.g. 2019-09-01T00:00:00Z" % literal)
+
+def crawl_time_or_none(crawl_times, position):
+    return None if position < 0 else format_crawl_time(crawl_times[position])
+
+class AnalysisService:
+    # Answers queries about the Analysis of each network. Each method returns a dict to
+    # send as JSON, and raises NotFound for an unknown network, URL, host or figure and
+    # ValueError for other bad arguments
+
+    def __init__(self, analyses, figure_cache_size=64, dpi=150, usetex=False):
+        self.analyses = analyses                # { network : Analysis }
+        self.figure_cache_size = figure_cache_size
+        self.dpi = dpi
+        self.usetex = usetex
+
+        # Each cache holds a Future of each entry, so that an entry is built once, by the
+        # first request for it, while later requests for it wait and others go on
+        self.url_lifetimes = dict()             # { network : UrlLifetimes }
+        self.window_indexes = dict()            # { network : WindowIndex }
+        self.host_totals = dict()               # { (network, path depth) : GroupTotals }
+        self.frames = dict()                    # { network : crawl_frames() }
+        self.migrations = dict()                # { network : migrations_frame(), or None }
+        self.figures = OrderedDict()            # { figure key : (content type, bytes) }, least recently used first
+        self.lock = threading.Lock()            # Guards the caches above, only to look up and insert
+        self.figure_lock = threading.Lock()     # pyplot draws one figure at a time
+
+    def analysis(self, network):
+        if network not in self.analyses:
+            raise NotFound("Unknown network %s; pick one of %s" % (network, ", ".join(self.analyses)))
+        return self.analyses[network]
+
+    def cached(self, cache, key, build, max_size=None):
+        # cache[key], built outside the lock if nobody has asked for it yet. A failed build
+        # is not kept, so the next request tries again. A cache with a max_size drops its
+        # least recently used entries
+        with self.lock:
+            future = cache.get(key)
+            is_builder = future is None
+            if is_builder:
+                future = cache[key] = Future()
+                while max_size is not None and len(cache) > max_size:
+                    cache.popitem(last=False)
+            elif max_size is not None:
+                cache.move_to_end(key)
+
+        if is_builder:
+            try:
+                future.set_result(build())
+            except Exception as error:
+                with self.lock:
+                    if cache.get(key) is future:
+                        del cache[key]
+                future.set_exception(error)
+        return future.result()
+
+    def networks(self):
+        return { "networks" : [
+            {
+                "network" : network,
+                "num_urls" : analysis.totals.total_num_urls,
+                "num_crawls" : analysis.num_crawls,
+                "first_crawl" : crawl_time_or_none(analysis.crawl_times, 0 if analysis.num_crawls else -1),
+                "last_crawl" : crawl_time_or_none(analysis.crawl_times, analysis.num_crawls - 1),
+                "timelines" : analysis.url_lifetimes is not None,
+            }
+            for (network, analysis) in self.analyses.items()
+        ] }
+
+    def url_timeline(self, network, url):
+        # A URL's lifetime, its statuses and contents as runs of unchanged crawls
+        analysis = self.analysis(network)
+        if analysis.url_lifetimes is None:
+            raise ValueError("%s was analyzed without per-URL timelines" % network)
+        url_lifetimes = self.cached(self.url_lifetimes, network, lambda: analysis.url_lifetimes)
+        if url not in url_lifetimes:
+            raise NotFound("%s has no URL %s" % (network, url))
+        lifetime = url_lifetimes[url]
+
+        lifetimes = lifetime.lifetimes
+        statuses = lifetimes.url_statuses(lifetime.row)
+        contents = lifetimes.url_contents(lifetime.row)
+        starts = np.flatnonzero(np.concatenate([[True], (statuses[1:] != statuses[:-1]) | (contents[1:] != contents[:-1])]))
+        ends = np.append(starts[1:], len(statuses)) - 1
+
+        crawl_times = analysis.crawl_times
+        timeline = { "network" : network, "url" : url }
+        for name in LIFETIME_POSITIONS:
+            position = getattr(lifetime, name)
+            timeline[name.replace("_position", "")] = None if position is None else format_crawl_time(crawl_times[position])
+        for name in LIFETIME_COUNTS:
+            timeline[name] = getattr(lifetime, name)
+        timeline["last_known_status"] = lifetime.last_known_status.name
+        timeline["runs"] = [
+            {
+                "status" : Status(int(statuses[start])).name,
+                "content" : None if contents[start] == NOT_QUERIED else MISSING_CONTENT if contents[start] == NO_CONTENT else lifetimes.content_strings[contents[start]],
+                "first_crawl" : format_crawl_time(crawl_times[start]),
+                "last_crawl" : format_crawl_time(crawl_times[end]),
+                "num_crawls" : end - start + 1,
+            }
+            for (start, end) in zip(starts.tolist(), ends.tolist())
+        ]
+        return timeline
+
+    def hosts(self, network, hosts=(), path_depth=0, limit=20):
+        # report.txt's counts for each of hosts and for all of them together, or for the
+        # limit hosts with the most unreliable URLs
+        if path_depth < 0 or limit < 0:
+            raise ValueError("path_depth and limit cannot be negative")
+        analysis = self.analysis(network)
+        if analysis.lifetimes is None:
+            raise ValueError("%s was analyzed without per-URL arrays" % network)
+        totals = self.cached(self.host_totals, (network, path_depth),
+            lambda: group_totals(analysis.lifetimes, analysis.num_crawls, path_depth))
+
+        def host_rows(totals, rows):
+            fractions = { name : totals.fraction(name) for name in GROUP_FRACTIONS }
+            return [
+                dict([("host", totals.names[i])]
+                    + [(name, int(getattr(totals, name)[i])) for name in GROUP_COUNTS]
+                    + [(name, json_number(fractions[name][i])) for name in GROUP_FRACTIONS])
+                for i in rows
+            ]
+
+        if not hosts:
+            return { "network" : network, "hosts" : host_rows(totals, totals.worst_order()[:limit].tolist()) }
+
+        host_positions = { name : i for (i, name) in enumerate(totals.names) }
+        for host in hosts:
+            if host not in host_positions:
+                raise NotFound("No URLs of %s have host %s" % (network, host))
+        rows = [host_positions[host] for host in hosts]
+
+        combined = GroupTotals(["+".join(hosts)])
+        for name in GROUP_COUNTS + ["num_responded", "max_num_content_changes"]:
+            setattr(combined, name, getattr(totals, name)[rows].sum(keepdims=True))
+        return { "network" : network, "hosts" : host_rows(totals, rows), "total" : host_rows(combined, [0])[0] }
+
+    def window(self, network, start_time=None, end_time=None):
+        # report.txt's numbers over the crawls from start_time to end_time
+        analysis = self.analysis(network)
+        if analysis.url_lifetimes is None:
+            raise ValueError("%s was analyzed without the runs windows are counted from" % network)
+        index = self.cached(self.window_indexes, network,
+            lambda: build_window_index(analysis.lifetimes, analysis.totals, analysis.crawl_times))
+        (start, end) = index.crawl_range(canonical_crawl_time(start_time), canonical_crawl_time(end_time))
+
+        response = { "network" : network, "first_crawl" : format_crawl_time(index.crawl_times[start]), "last_crawl" : format_crawl_time(index.crawl_times[end]) }
+        totals = index.totals(start, end)
+        for name in WINDOW_COUNTS + WINDOW_FRACTIONS:
+            response[name] = json_number(totals[name])
+        response["report"] = window_report(index, start, end)
+        return response
+
+    def figure(self, network, name, start_time=None, end_time=None, variant="annotated", figure_format="png"):
+        # (content type, bytes) of a figure of a network's totals over the time frame from
+        # start_time to end_time
+        analysis = self.analysis(network)
+        if variant not in FIGURE_VARIANTS:
+            raise ValueError("Unknown figure variant %s; pick one of %s" % (variant, ", ".join(FIGURE_VARIANTS)))
+        if figure_format not in FIGURE_FORMATS:
+            raise ValueError("Unknown figure format %s; pick one of %s" % (figure_format, ", ".join(FIGURE_FORMATS)))
+
+        (start_time, end_time) = (canonical_crawl_time(start_time), canonical_crawl_time(end_time))
+        key = (network, name, start_time, end_time, variant, figure_format)
+        return self.cached(self.figures, key, lambda: self.draw_figure(analysis, network, name, start_time, end_time, variant, figure_format),
+            self.figure_cache_size)
+
+    def draw_figure(self, analysis, network, name, start_time, end_time, variant, figure_format):
+        from .figures import figure_jobs, render_figure
+        frames = self.cached(self.frames, network, lambda: crawl_frames(analysis.totals, analysis.crawl_times))
+        worst_groups_df = None
+        if analysis.lifetimes is not None:
+            worst_groups_df = worst_groups_frame(self.cached(self.host_totals, (network, 0),
+                lambda: group_totals(analysis.lifetimes, analysis.num_crawls)))
+        migrations_df = None
+        if analysis.content_index is not None:
+            migrations_df = self.cached(self.migrations, network, lambda: migrations_frame(
+                content_migrations(analysis.content_index, analysis.lifetimes, analysis.num_crawls), analysis.crawl_times))
+
+        (style, content_type) = FIGURE_FORMATS[figure_format]
+        with self.figure_lock, tempfile.TemporaryDirectory(prefix="linkrot-figure-") as directory:
+            jobs = { job.name : job for job in figure_jobs(analysis.totals, analysis.crawl_times, network, directory, start_time, end_time,
+                self.dpi, self.usetex, frames=frames, worst_groups_df=worst_groups_df, migrations_df=migrations_df) }
+            if name not in jobs:
+                raise NotFound("Unknown figure %s; pick one of %s" % (name, ", ".join(jobs)))
+            job = jobs[name]
+            job.style = style
+            render_figure(job)
+
+            path = job.output_path + FIGURE_VARIANTS[variant] + os.path.splitext(job.output_files[0])[1]
+            if not os.path.exists(path):
+                raise NotFound("Figure %s has no %s variant" % (name, variant))
+            with open(path, "rb") as file:
+                return (content_type, file.read())
+
+### HTTP
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    # Routes GET requests to the server's AnalysisService
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, response):
+        self.send_body(status, "application/json", json.dumps(response).encode())
+
+    def do_GET(self):
+        service = self.server.service
+        url = urllib.parse.urlsplit(self.path)
+        parameters = urllib.parse.parse_qs(url.query)
+
+        def parameter(name, default=None, required=False):
+            if name not in parameters:
+                if required:
+                    raise ValueError("Missing parameter %s" % name)
+                return default
+            return parameters[name][-1]
+
+        def int_parameter(name, default):
+            try:
+                return int(parameter(name, default))
+            except ValueError:
+                raise ValueError("Parameter %s must be an integer" % name)
+
+        try:
+            if url.path == "/networks":
+                self.send_json(200, service.networks())
+            elif url.path == "/url":
+                self.send_json(200, service.url_timeline(parameter("network", required=True), parameter("url", required=True)))
+            elif url.path == "/hosts":
+                self.send_json(200, service.hosts(parameter("network", required=True), parameters.get("host", []),
+                    int_parameter("path_depth", 0), int_parameter("limit", 20)))
+            elif url.path == "/window":
+                self.send_json(200, service.window(parameter("network", required=True), parameter("start"), parameter("end")))
+            elif url.path == "/figure":
+                content_type, body = service.figure(parameter("network", required=True), parameter("name", required=True),
+                    parameter("start"), parameter("end"), parameter("variant", "annotated"), parameter("format", "png"))
+                self.send_body(200, content_type, body)
+            else:
+                self.send_json(404, { "error" : "Unknown path %s; use /networks, /url, /hosts, /window or /figure" % url.path })
+        except NotFound as error:
+            self.send_json(404, { "error" : str(error) })
+        except ValueError as error:
+            self.send_json(400, { "error" : str(error) })
+        except Exception as error:
+            # Keep serving, and tell the client rather than closing on it
+            self.log_error("%s failed: %r", self.path, error)
+            self.send_json(500, { "error" : "%s: %s" % (type(error).__name__, error) })
+
+def check_socket_path(socket_path):
+    # A Unix socket can only be bound to a free path; a socket left by an earlier server
+    # is removed, and anything else is not ours to remove
+    if os.path.lexists(socket_path) and not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+        raise ValueError("%s exists and is not a socket; remove it or pick another path" % socket_path)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, quiet=False):
+    # An HTTP server of service on host:port, or on the Unix socket socket_path. port 0
+    # picks a free port (server.server_address[1])
+    handler = ServiceRequestHandler
+    if quiet:
+        handler = type("QuietServiceRequestHandler", (ServiceRequestHandler,), { "log_message" : lambda self, *args: None })
+
+    if socket_path is not None:
+        check_socket_path(socket_path)
+        if os.path.lexists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, handler)
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+    server.service = service
+    return server
@@ -0,0 +1,176 @@
+# Merging query output split into shards (e.g. one tdbquery output per month, or the
+# by-network and by-activity queries of one network), each sorted by URL then crawl time.
+# The shards are merged with a heap in one pass, and rows of the same (URL, crawl) pair are
+# resolved by an explicit policy rather than by whichever was read last: content beats a
+# failed query, and of differing contents the later shard's is kept and the disagreement
+# reported
+
+import os
+import heapq
+import operator
+import itertools
+from array import array
+
+from .inputs import NO_CONTENT, content_is_missing, crawl_time_ms, format_crawl_time, is_header, read_input_lines
+from .observations import CrawlObservations
+
+class ShardConflicts:
+    # Rows of the same (URL, crawl) pair met while merging shards, by how they were resolved
+
+    def __init__(self, shard_paths):
+        self.shard_paths = shard_paths
+        self.num_duplicates = 0     # Same content, or both queries failed; one row kept
+        self.num_filled = 0         # A failed query and content; the content kept
+        self.disagreements = []     # (url, crawl time, kept content, kept shard, dropped content, dropped shard)
+
+    @property
+    def num_disagreements(self):
+        return len(self.disagreements)
+
+def shard_urls(path, shard):
+    # Yields (url, shard, crawl times, contents, lines, whether a crawl time repeats) of each
+    # URL of a shard, its rows in crawl time order, skipping header lines. Raises ValueError
+    # if the shard is not sorted by URL then crawl time
+    crawl_times = dict()    # { crawl time literal, with its "\n" : milliseconds }
+    (previous_url, previous_crawl_time) = (None, -1)
+    (url_crawl_times, url_contents, url_lines, repeats) = ([], [], [], False)
+    for (line_number, line) in enumerate(read_input_lines([path]), 1):
+        (url, content, crawl_literal) = line.split("\t")
+        crawl_time = crawl_times.get(crawl_literal)
+        if crawl_time is None:
+            if is_header(line):
+                continue
+            if crawl_literal.endswith("\n"):
+                crawl_time = crawl_times[crawl_literal] = crawl_time_ms(crawl_literal[:-1])
+            else:
+                # The last line of a file may not end in "\n"; rows from other shards follow it
+                crawl_time = crawl_time_ms(crawl_literal)
+                line += "\n"
+
+        if url != previous_url:
+            if previous_url is not None:
+                if url < previous_url:
+                    raise ValueError("%s is not sorted by URL at line %d (LC_ALL=C sort -t$'\\t' -k1,1 -k3,3 sorts it)" % (path, line_number))
+                yield (previous_url, shard, url_crawl_times, url_contents, url_lines, repeats)
+                (url_crawl_times, url_contents, url_lines, repeats) = ([], [], [], False)
+            previous_url = url
+        elif crawl_time <= previous_crawl_time:
+            if crawl_time < previous_crawl_time:
+                raise ValueError("%s is not sorted by crawl time at line %d (LC_ALL=C sort -t$'\\t' -k1,1 -k3,3 sorts it)" % (path, line_number))
+            repeats = True
+        previous_crawl_time = crawl_time
+        url_crawl_times.append(crawl_time)
+        url_contents.append(content)
+        url_lines.append(line)
+    if previous_url is not None:
+        yield (previous_url, shard, url_crawl_times, url_contents, url_lines, repeats)
+
+def resolve_duplicate(url, kept, row, conflicts):
+    # The row to keep of two (crawl time, shard, position, content, line) rows of the same
+    # (URL, crawl) pair, row written after kept
+    if content_is_missing(row[3]):
+        if not content_is_missing(kept[3]):
+            conflicts.num_filled += 1
+        else:
+            conflicts.num_duplicates += 1
+        return kept
+    if content_is_missing(kept[3]):
+        conflicts.num_filled += 1
+        return row
+    if row[3] == kept[3]:
+        conflicts.num_duplicates += 1
+        return kept
+    conflicts.disagreements.append((url, row[0], row[3], row[1], kept[3], kept[1]))
+    return row
+
+def merge_url_rows(url, shards, conflicts):
+    # (crawl times, contents, lines) of a URL's shard_urls() entries, one per crawl. Entries
+    # whose crawls do not overlap are concatenated; otherwise rows are sorted and resolved
+    shards = sorted(shards, key=lambda entry: (entry[2][0], entry[1]))
+    if not any(entry[5] for entry in shards) and all(shards[i][2][-1] < shards[i + 1][2][0] for i in range(len(shards) - 1)):
+        if len(shards) == 1:
+            return shards[0][2:5]
+        return tuple([value for entry in shards for value in entry[column]] for column in [2, 3, 4])
+
+    # Ties in crawl time go to the earlier shard, then the earlier line, so a pair's rows
+    # arrive in the order they were written
+    rows = sorted(row for entry in shards for row in zip(entry[2], itertools.repeat(entry[1]), itertools.count(), entry[3], entry[4]))
+    resolved = []
+    kept = rows[0]
+    for row in rows[1:]:
+        if row[0] == kept[0]:
+            kept = resolve_duplicate(url, kept, row, conflicts)
+        else:
+            resolved.append(kept)
+            kept = row
+    resolved.append(kept)
+    return [row[0] for row in resolved], [row[3] for row in resolved], [row[4] for row in resolved]
+
+def merge_shard_urls(shard_paths, conflicts):
+    # Yields (url, crawl times, contents, lines) of each URL of sorted shards, in URL order
+    # and one row per (URL, crawl) pair, recording how repeated pairs were resolved in
+    # conflicts (a ShardConflicts). The heap holds one entry per URL and shard, not per row
+    merged = heapq.merge(*[shard_urls(path, shard) for (shard, path) in enumerate(shard_paths)])
+    for (url, shards) in itertools.groupby(merged, key=operator.itemgetter(0)):
+        yield (url,) + tuple(merge_url_rows(url, shards, conflicts))
+
+def merge_shard_rows(shard_paths, conflicts=None):
+    # Yields the "url\tcontent\tcrawl_time\n" rows of sorted shards in URL then crawl time
+    # order, one per (URL, crawl) pair
+    if conflicts is None:
+        conflicts = ShardConflicts(shard_paths)
+    for (url, crawl_times, contents, lines) in merge_shard_urls(shard_paths, conflicts):
+        yield from lines
+
+def read_merged_observations(merged_urls):
+    # Finished CrawlObservations of merge_shard_urls(). Rows arrive parsed and grouped by
+    # URL, so each URL is interned once and no row is parsed twice
+    observations = CrawlObservations()
+    url_table = observations.url_table
+    content_table = observations.content_table
+    crawl_table = observations.crawl_table
+    content_ids = observations.content_ids
+    crawl_ids = observations.crawl_ids
+
+    for (url, crawl_times, contents, _) in merged_urls:
+        url_id = url_table[url] = len(url_table)
+        observations.url_ids.extend(array("i", [url_id]) * len(crawl_times))
+        for (crawl_time, content) in zip(crawl_times, contents):
+            if content_is_missing(content):
+                content_id = NO_CONTENT
+            else:
+                content_id = content_table.get(content)
+                if content_id is None:
+                    content_id = content_table[content] = len(content_table)
+
+            crawl_id = crawl_table.get(crawl_time)
+            if crawl_id is None:
+                crawl_id = crawl_table[crawl_time] = len(crawl_table)
+
+            content_ids.append(content_id)
+            crawl_ids.append(crawl_id)
+
+    observations.finish()
+    return observations
+
+def merge_report(conflicts):
+    num_repeated = conflicts.num_duplicates + conflicts.num_filled + conflicts.num_disagreements
+    report = ""
+    report += "Merged %d shards; %s rows repeated a (URL, crawl) pair of an earlier row:\n" % (len(conflicts.shard_paths), "{0:,}".format(num_repeated))
+    report += "\t%s with the same content, or both failed queries (kept once)\n" % "{0:,}".format(conflicts.num_duplicates)
+    report += "\t%s with content where the other was a failed query, or the reverse (content kept)\n" % "{0:,}".format(conflicts.num_filled)
+    report += "\t%s with different contents (the later row kept; see shard-conflicts.tsv)\n" % "{0:,}".format(conflicts.num_disagreements)
+    return report
+
+def write_merge_report(conflicts, output_directory):
+    # Writes shard-conflicts.tsv, one row per disagreement, and shard-merge.txt, and
+    # returns the text report
+    with open(os.path.join(output_directory, "shard-conflicts.tsv"), "w") as file:
+        file.write("url\tcrawl\tkept_content\tkept_shard\tdropped_content\tdropped_shard\n")
+        file.write("".join(["%s\t%s\t%s\t%s\t%s\t%s\n" % (url, format_crawl_time(crawl_time), kept_content, conflicts.shard_paths[kept_shard],
+            dropped_content, conflicts.shard_paths[dropped_shard]) for (url, crawl_time, kept_content, kept_shard, dropped_content, dropped_shard) in conflicts.disagreements]))
+
+    report = merge_report(conflicts)
+    with open(os.path.join(output_directory, "shard-merge.txt"), "w") as file:
+        file.write(report)
+    return report
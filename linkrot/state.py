@@ -0,0 +1,72 @@
+# Saving LifetimeColumns so that later crawls can be appended without the full history
+
+import os
+
+import numpy as np
+
+from .inputs import NOT_QUERIED, crawl_time_ms, format_crawl_time
+from .observations import write_string_table, read_string_table
+from .lifetimes import URL_COLUMNS, ContentLastSeen, LifetimeColumns
+
+ANALYSIS_STATE_ARRAYS = URL_COLUMNS + [
+    "revert_url_positions", "revert_distances", "status_totals", "content_first_crawl_positions",
+]
+
+def save_analysis_state(state_directory, lifetimes):
+    os.makedirs(state_directory, exist_ok=True)
+
+    write_string_table(os.path.join(state_directory, "urls.txt"), lifetimes.urls)
+    write_string_table(os.path.join(state_directory, "contents.txt"), lifetimes.content_strings)
+    np.save(os.path.join(state_directory, "crawl-times.npy"), np.array(lifetimes.crawl_times, dtype=np.int64))
+
+    arrays = { name : getattr(lifetimes, name) for name in ANALYSIS_STATE_ARRAYS }
+    (arrays["content_last_seen_keys"], arrays["content_last_seen_positions"]) = lifetimes.content_last_seen.entries()
+    np.savez(os.path.join(state_directory, "lifetimes.npz"), **arrays)
+
+def load_analysis_state(state_directory):
+    lifetimes = LifetimeColumns()
+    lifetimes.urls = read_string_table(os.path.join(state_directory, "urls.txt"))
+    lifetimes.content_strings = read_string_table(os.path.join(state_directory, "contents.txt"))
+    if os.path.exists(os.path.join(state_directory, "crawl-times.npy")):
+        lifetimes.crawl_times = np.load(os.path.join(state_directory, "crawl-times.npy")).tolist()
+    else:
+        # Saved before crawl times were kept in milliseconds
+        lifetimes.crawl_times = [crawl_time_ms(crawl) for crawl in read_string_table(os.path.join(state_directory, "crawl-times.txt"))]
+
+    with np.load(os.path.join(state_directory, "lifetimes.npz")) as arrays:
+        for name in ANALYSIS_STATE_ARRAYS:
+            setattr(lifetimes, name, arrays[name])
+        lifetimes.content_last_seen = ContentLastSeen(arrays["content_last_seen_keys"], arrays["content_last_seen_positions"])
+    return lifetimes
+
+def append_crawls(lifetimes, observations):
+    # Folds observations of crawls after the last analyzed crawl into lifetimes
+    if observations.crawl_times and lifetimes.crawl_times and observations.crawl_times[0] <= lifetimes.crawl_times[-1]:
+        raise ValueError("Appended crawl %s is not after the last analyzed crawl %s"
+            % (format_crawl_time(observations.crawl_times[0]), format_crawl_time(lifetimes.crawl_times[-1])))
+
+    def positions_in(strings, table):
+        # Positions of each string in table, appending the strings that are not in it
+        string_positions = { string : i for i, string in enumerate(table) }
+        positions = np.array([string_positions.setdefault(string, len(string_positions)) for string in strings], dtype=np.int32)
+        table.extend(list(string_positions)[len(table):])
+        return positions
+
+    num_urls = len(lifetimes.urls)
+    num_contents = len(lifetimes.content_strings)
+    url_positions = positions_in(observations.urls, lifetimes.urls)
+    content_positions = positions_in(observations.contents, lifetimes.content_strings)
+    lifetimes.add_urls(len(lifetimes.urls) - num_urls)
+    lifetimes.add_contents(len(lifetimes.content_strings) - num_contents)
+
+    # Only returned contents have positions; a crawl of failed queries may have none
+    content_ids = np.array(observations.content_ids, dtype=np.int32)
+    returned = content_ids >= 0
+    content_ids[returned] = content_positions[content_ids[returned]]
+    for i, crawl_time in enumerate(observations.crawl_times):
+        rows = np.asarray(observations.crawl_positions) == i
+        contents = np.full(len(lifetimes.urls), NOT_QUERIED, dtype=np.int32)
+        contents[url_positions[np.asarray(observations.url_ids)[rows]]] = content_ids[rows]
+
+        lifetimes.add_crawl(contents)
+        lifetimes.crawl_times.append(crawl_time)
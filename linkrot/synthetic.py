@@ -0,0 +1,117 @@
+# Synthetic crawl histories, written as the query output build-figures.py reads, for
+# benchmarking without real Preston exports. Each URL appears at some crawl, is queried at
+# every crawl until it is abandoned, and at each query may break, recover, change content
+# or revert to its previous content
+
+import numpy as np
+
+from .inputs import format_crawl_time, parse_crawl_time
+
+QUERY_OUTPUT_HEADER = "?dataset_url\t?dataset_content\t?crawl_date\n"
+
+DAY_MILLISECONDS = 24 * 60 * 60 * 1000
+
+class CrawlHistoryParameters:
+    # Probabilities are per URL per crawl
+
+    def __init__(self, num_urls=10000, num_crawls=24, break_probability=0.05, recover_probability=0.5,
+            change_probability=0.05, revert_probability=0.1, abandon_rate=0.02, initial_fraction=0.5,
+            start_time="2019-03-01T00:00:00.000Z", crawl_interval_days=30, seed=0):
+        self.num_urls = num_urls
+        self.num_crawls = num_crawls
+        self.break_probability = break_probability          # A responsive URL fails to respond
+        self.recover_probability = recover_probability      # An unresponsive URL responds again
+        self.change_probability = change_probability        # A responding URL returns other content
+        self.revert_probability = revert_probability        # A change goes back to the URL's previous content
+        self.abandon_rate = abandon_rate                    # A URL stops being queried for good
+        self.initial_fraction = initial_fraction            # URLs first queried in the first crawl; the rest appear uniformly later
+        self.start_time = start_time
+        self.crawl_interval_days = crawl_interval_days
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+def url_string(i):
+    return "<https://host%d.example.org/ipt/eml.do?r=ds%d>" % (i % 97, i)
+
+# Odd, so that multiplying by it modulo 2^256 maps content IDs to distinct digests
+CONTENT_DIGEST_MULTIPLIER = 0x6a09e667f3bcc908b2fb1366ea957d3e3adec17512775099da2f590b0667322b
+
+def content_string(content_id):
+    # A stand-in sha256, distinct for each content ID
+    return "<hash://sha256/%064x>" % (((content_id + 1) * CONTENT_DIGEST_MULTIPLIER) % (1 << 256))
+
+def missing_content_string(i):
+    return "<https://deeplinker.bio/.well-known/genid/%d>" % i
+
+def crawl_literal(milliseconds):
+    return "\"%s\"^^<http://www.w3.org/2001/XMLSchema#dateTime>" % format_crawl_time(milliseconds)
+
+def generate_crawl_history(parameters):
+    # Yields query output lines, header first, one crawl at a time
+    p = parameters
+    rng = np.random.default_rng(p.seed)
+    num_urls = p.num_urls
+
+    first_crawl = np.where(rng.random(num_urls) < p.initial_fraction, 0, rng.integers(0, p.num_crawls, num_urls))
+    abandoned = np.zeros(num_urls, dtype=bool)
+    alive = np.ones(num_urls, dtype=bool)
+    current_content = np.full(num_urls, -1, dtype=np.int64)
+    previous_content = np.full(num_urls, -1, dtype=np.int64)
+    num_content_ids = 0
+    num_missing = 0
+
+    urls = [url_string(i) for i in range(num_urls)]
+    start_time = parse_crawl_time(p.start_time)
+
+    yield QUERY_OUTPUT_HEADER
+    for i in range(p.num_crawls):
+        crawl = crawl_literal(start_time + int(i * p.crawl_interval_days * DAY_MILLISECONDS))
+
+        abandoned |= (first_crawl < i) & (rng.random(num_urls) < p.abandon_rate)
+        queried = (first_crawl <= i) & ~abandoned
+
+        draws = rng.random(num_urls)
+        responds = queried & np.where(alive, draws >= p.break_probability, draws < p.recover_probability)
+        breaks = queried & ~responds
+
+        # New URLs and URLs whose content changes to never-seen content get new content IDs
+        changes = responds & (current_content >= 0) & (rng.random(num_urls) < p.change_probability)
+        reverts = changes & (previous_content >= 0) & (rng.random(num_urls) < p.revert_probability)
+        new_content = (responds & (current_content < 0)) | (changes & ~reverts)
+
+        reverted_to = previous_content[reverts]
+        previous_content[changes] = current_content[changes]
+        current_content[reverts] = reverted_to
+        current_content[new_content] = np.arange(num_content_ids, num_content_ids + np.count_nonzero(new_content))
+        num_content_ids += int(np.count_nonzero(new_content))
+
+        alive[queried] = responds[queried]
+
+        lines = [
+            "%s\t%s\t%s\n" % (urls[url], content_string(content), crawl)
+            for (url, content) in zip(np.flatnonzero(responds).tolist(), current_content[responds].tolist())
+        ]
+        broken_urls = np.flatnonzero(breaks).tolist()
+        lines += [
+            "%s\t%s\t%s\n" % (urls[url], missing_content_string(num_missing + j), crawl)
+            for (j, url) in enumerate(broken_urls)
+        ]
+        num_missing += len(broken_urls)
+        yield from lines
+
+def rows_per_url(parameters, num_sample_urls=2000):
+    # Average number of rows each URL gets, from a small history with the same parameters
+    sample = CrawlHistoryParameters(**parameters.as_dict())
+    sample.num_urls = num_sample_urls
+    return (sum(1 for line in generate_crawl_history(sample)) - 1) / num_sample_urls
+
+def write_crawl_history(parameters, output_path):
+    # Writes a synthetic history to output_path and returns its number of rows
+    num_rows = -1
+    with open(output_path, "w") as file:
+        for line in generate_crawl_history(parameters):
+            file.write(line)
+            num_rows += 1
+    return num_rows
@@ -0,0 +1,220 @@
+# Per-crawl series and network-wide counts. Both engines keep every URL's positions and
+# counts in arrays, which lifetime_totals_from_columns reduces with bincount and sums;
+# LifetimeTotals.add totals one UrlLifetime at a time for the "external" mode, adding its
+# runs into a difference array of per-crawl status counts
+
+from collections import Counter
+
+import numpy as np
+
+from .inputs import content_is_missing
+from .lifetimes import Status
+
+class LifetimeTotals:
+    # Totals accumulated one UrlLifetime at a time
+
+    def __init__(self, num_crawls, count_contents=True):
+        self.num_crawls = num_crawls
+
+        self.crawl_status_totals = np.zeros((num_crawls, len(Status)), dtype=np.int64)
+        # Runs of each status starting at each crawl, less those that ended the crawl before
+        self.crawl_status_changes = np.zeros((num_crawls + 1, len(Status)), dtype=np.int64)
+        self.crawl_url_totals = [0] * num_crawls
+        self.crawl_content_totals = [0] * num_crawls
+        self.crawl_abandoned_totals = [0] * num_crawls
+        self.crawl_first_response_totals = [0] * num_crawls
+        self.crawl_first_break_totals = [0] * num_crawls
+        self.crawl_first_change_totals = [0] * num_crawls
+        self.crawl_first_unreliable_totals = [0] * num_crawls
+
+        self.total_num_urls = 0
+        self.total_num_resolves = 0
+        self.total_num_breaks = 0
+        self.total_num_contents = 0
+        self.total_num_content_changes = 0
+        self.max_num_content_changes = 0
+        self.total_num_reverts = 0
+
+        self.num_responsive = 0
+        self.num_stable = 0
+        self.num_reliable = 0
+        self.num_abandoned = 0
+        self.num_never_responded = 0
+
+        self.break_count_frequencies = Counter()
+        self.content_change_count_frequencies = Counter()
+        self.revert_distance_frequencies = Counter()
+
+        # Without count_contents, crawl_content_totals must be filled in by the caller
+        self.content_first_crawl_positions = dict() if count_contents else None
+
+    def add(self, lifetime):
+        num_crawls = self.num_crawls
+
+        changes = self.crawl_status_changes
+        for (status, content, start, length) in lifetime.runs:
+            changes[start, status.value] += 1
+            changes[start + length, status.value] -= 1
+
+        self.crawl_url_totals[lifetime.first_crawl_position] += 1
+
+        self.total_num_urls += 1
+        self.total_num_resolves += lifetime.num_resolves
+        self.total_num_breaks += lifetime.num_breaks
+        self.total_num_contents += lifetime.num_contents
+        self.total_num_content_changes += lifetime.num_content_changes
+        self.max_num_content_changes += lifetime.num_resolves - 1
+        self.total_num_reverts += lifetime.num_reverts
+
+        self.break_count_frequencies[lifetime.num_breaks] += 1
+        self.content_change_count_frequencies[lifetime.num_content_changes] += 1
+        self.revert_distance_frequencies.update(lifetime.revert_distances)
+
+        if lifetime.num_breaks == 0:
+            self.num_responsive += 1
+
+        if lifetime.num_contents == 1:
+            self.num_stable += 1
+
+        if lifetime.num_breaks == 0 and lifetime.num_contents == 1:
+            self.num_reliable += 1
+
+        # Every status other than UNKNOWN and the unresponsive ones counts as a resolve
+        if lifetime.num_resolves == 0:
+            self.num_never_responded += 1
+
+        first_unreliable = num_crawls
+        if lifetime.first_response_position is not None:
+            self.crawl_first_response_totals[lifetime.first_response_position] += 1
+
+        if lifetime.first_break_position is not None:
+            self.crawl_first_break_totals[lifetime.first_break_position] += 1
+            first_unreliable = lifetime.first_break_position
+
+        if lifetime.first_change_position is not None:
+            self.crawl_first_change_totals[lifetime.first_change_position] += 1
+            first_unreliable = min(lifetime.first_change_position, first_unreliable)
+
+        if first_unreliable < num_crawls:
+            self.crawl_first_unreliable_totals[first_unreliable] += 1
+
+        # If the URL stopped being queried, it was abandoned at the crawl after its last query
+        if lifetime.last_crawl_position < num_crawls - 1:
+            self.crawl_abandoned_totals[lifetime.last_crawl_position + 1] += 1
+            self.num_abandoned += 1
+
+        if self.content_first_crawl_positions is not None:
+            for (status, content, start, length) in lifetime.runs:
+                # Unqueried runs hold None, which is not a content
+                if content is not None and not content_is_missing(content):
+                    current_first = self.content_first_crawl_positions.get(content, num_crawls)
+                    self.content_first_crawl_positions[content] = min(start, current_first)
+
+    def finish(self):
+        self.crawl_status_totals = np.cumsum(self.crawl_status_changes[:-1], axis=0)
+        if self.content_first_crawl_positions is not None:
+            for i in self.content_first_crawl_positions.values():
+                self.crawl_content_totals[i] += 1
+
+    @property
+    def num_responded(self):
+        return self.total_num_urls - self.num_never_responded
+
+    @property
+    def num_unreliable(self):
+        return self.total_num_urls - self.num_reliable
+
+    @property
+    def num_unstable(self):
+        return self.total_num_urls - self.num_stable
+
+    @property
+    def num_unresponsive(self):
+        return self.total_num_urls - self.num_responsive
+
+def value_frequencies(values):
+    return Counter(dict(zip(*[x.tolist() for x in np.unique(values, return_counts=True)])))
+
+def lifetime_totals_from_columns(columns, num_crawls):
+    totals = LifetimeTotals(num_crawls, count_contents=False)
+
+    def count_positions(positions):
+        return np.bincount(positions[positions >= 0], minlength=num_crawls).tolist()
+
+    first_unreliable_positions = np.where(columns.first_break_position >= 0, columns.first_break_position, num_crawls)
+    first_unreliable_positions = np.where(columns.first_change_position >= 0, np.minimum(columns.first_change_position, first_unreliable_positions), first_unreliable_positions)
+    abandoned_positions = np.where(columns.last_crawl_position < num_crawls - 1, columns.last_crawl_position + 1, -1)
+
+    totals.crawl_status_totals = columns.status_totals
+    totals.crawl_url_totals = count_positions(columns.first_crawl_position)
+    totals.crawl_content_totals = count_positions(columns.content_first_crawl_positions)
+    totals.crawl_abandoned_totals = count_positions(abandoned_positions)
+    totals.crawl_first_response_totals = count_positions(columns.first_response_position)
+    totals.crawl_first_break_totals = count_positions(columns.first_break_position)
+    totals.crawl_first_change_totals = count_positions(columns.first_change_position)
+    totals.crawl_first_unreliable_totals = count_positions(np.where(first_unreliable_positions < num_crawls, first_unreliable_positions, -1))
+
+    totals.total_num_urls = columns.num_urls
+    totals.total_num_resolves = int(columns.num_resolves.sum())
+    totals.total_num_breaks = int(columns.num_breaks.sum())
+    totals.total_num_contents = int(columns.num_contents.sum())
+    totals.total_num_content_changes = int(columns.num_content_changes.sum())
+    totals.max_num_content_changes = int((columns.num_resolves - 1).sum())
+    totals.total_num_reverts = int(columns.num_reverts.sum())
+
+    totals.num_responsive = int(np.count_nonzero(columns.num_breaks == 0))
+    totals.num_stable = int(np.count_nonzero(columns.num_contents == 1))
+    totals.num_reliable = int(np.count_nonzero((columns.num_breaks == 0) & (columns.num_contents == 1)))
+    totals.num_abandoned = int(np.count_nonzero(abandoned_positions >= 0))
+    totals.num_never_responded = int(np.count_nonzero(columns.num_resolves == 0))
+
+    totals.break_count_frequencies = value_frequencies(columns.num_breaks)
+    totals.content_change_count_frequencies = value_frequencies(columns.num_content_changes)
+    totals.revert_distance_frequencies = value_frequencies(columns.revert_distances)
+    return totals
+
+### Per-crawl data frames, indexed by crawl time. pandas is only imported when these are built
+
+def crawl_time_index(crawl_times):
+    import pandas as pd
+    return pd.to_datetime(np.array(crawl_times, dtype=np.int64), unit="ms")
+
+def crawl_status_totals_frame(totals, crawl_times):
+    # Number of URLs with each Status (columns) at each crawl
+    import pandas as pd
+    return pd.DataFrame(totals.crawl_status_totals, index=crawl_time_index(crawl_times), columns=list(Status))
+
+# crawl_totals_frame columns: (new per crawl, running total) of each LifetimeTotals series
+CRAWL_TOTALS_SERIES = [
+    ("New URLs", "Total URLs", "crawl_url_totals"),
+    ("New Contents", "Total Contents", "crawl_content_totals"),
+    ("Abandoned", "Total Abandoned", "crawl_abandoned_totals"),
+    ("First Response", "Total Responded", "crawl_first_response_totals"),
+    ("First Break", "Total Intermittent", "crawl_first_break_totals"),
+    ("First Change", "Total Unstable", "crawl_first_change_totals"),
+    ("First Unreliable", "Total Unreliable", "crawl_first_unreliable_totals"),
+]
+
+def crawl_totals_columns(totals):
+    # { crawl_totals_frame column : array }, without pandas
+    columns = dict()
+    for (new_name, total_name, series) in CRAWL_TOTALS_SERIES:
+        columns[new_name] = np.asarray(getattr(totals, series), dtype=np.int64)
+    for (new_name, total_name, series) in CRAWL_TOTALS_SERIES:
+        columns[total_name] = np.cumsum(columns[new_name])
+
+    # Crawls before any URL was queried or responded are NaN
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns["Percent Responsive"] = 1 - columns["Total Intermittent"] / columns["Total URLs"]
+        columns["Percent Stable"] = 1 - columns["Total Unstable"] / columns["Total Responded"]
+        columns["Percent Reliable"] = 1 - columns["Total Unreliable"] / columns["Total URLs"]
+    return columns
+
+def crawl_totals_frame(totals, crawl_times):
+    # New, running total and percentage series of URLs and contents at each crawl
+    import pandas as pd
+    return pd.DataFrame(crawl_totals_columns(totals), index=crawl_time_index(crawl_times))
+
+def crawl_frames(totals, crawl_times):
+    # (crawl_status_totals_df, crawl_totals_df)
+    return crawl_status_totals_frame(totals, crawl_times), crawl_totals_frame(totals, crawl_times)
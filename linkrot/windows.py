@@ -0,0 +1,227 @@
+# Report metrics of any window of crawls, from an index built once per run. A window
+# [a, b] (crawl positions) counts the queries made in its crawls, still classified against
+# each URL's whole history: a URL is unresponsive in it if it failed to respond to one of
+# them, unstable if two of its responses in the window differ, and unreliable if either.
+#
+# Each such count is "the number of URLs with some item x >= a and y <= b", over items
+# taken from the lifetimes' runs: a run of crawls [s, e] is the item (e, s) (the window
+# holds one of its crawls), and a change between responses at r and p is the item (r, p)
+# (the window holds both). Within a URL, items are ordered so that both x and y only grow;
+# the items a window counts are then consecutive, so counting every item and taking away
+# every adjacent pair of items the window both counts leaves one per URL. Items and pairs
+# go into a crawls x crawls table whose suffix-prefix sums answer any window in O(1)
+
+import bisect
+
+import numpy as np
+
+from .lifetimes import Status
+from .inputs import format_crawl_time, parse_crawl_time
+
+RESPONDED_STATUSES = [Status.FIRST_CONTENT.value, Status.SAME_CONTENT.value, Status.CHANGED_CONTENT.value, Status.OLD_CONTENT.value]
+MISSING_STATUSES = [Status.BECAME_UNRESPONSIVE.value, Status.STILL_UNRESPONSIVE.value]
+CHANGE_STATUSES = [Status.CHANGED_CONTENT.value, Status.OLD_CONTENT.value]
+
+# WindowIndex.totals() columns, in the order of rolling-windows.tsv
+WINDOW_COUNTS = [
+    "num_crawls", "num_urls", "num_new_urls", "num_abandoned", "num_contents", "num_new_contents", "num_responded",
+    "num_unresponsive", "num_unstable", "num_unreliable", "num_resolves", "num_breaks", "num_content_changes", "num_reverts",
+]
+WINDOW_FRACTIONS = ["percent_responsive", "percent_stable", "percent_reliable", "break_rate", "change_rate", "revert_rate"]
+
+def dominance_table(groups, xs, ys, num_crawls):
+    # table[a, b] = number of groups with some item x >= a and y <= b. Items are sorted by
+    # group, and within a group neither x nor y ever shrinks. The table takes 4 bytes per
+    # pair of crawls, and counts up to 2^31 - 1 items
+    if len(xs) > np.iinfo(np.int32).max:
+        raise ValueError("Cannot count %d items in a table of 32-bit counts" % len(xs))
+    # Rows run from the last x to the first, so that the sums over x are prefix sums too;
+    # the counts of each cell are added in without a crawls x crawls temporary
+    rows = num_crawls - 1 - xs.astype(np.int64)
+    table = np.zeros(num_crawls * num_crawls, dtype=np.int32)
+    (cells, counts) = np.unique(rows * num_crawls + ys, return_counts=True)
+    table[cells] = counts
+    pairs = np.flatnonzero(groups[1:] == groups[:-1])
+    (cells, counts) = np.unique(rows[pairs] * num_crawls + ys[pairs + 1], return_counts=True)
+    table[cells] -= counts.astype(np.int32)
+
+    table = table.reshape(num_crawls, num_crawls)
+    np.cumsum(table, axis=0, out=table)
+    np.cumsum(table, axis=1, out=table)
+    return table[::-1]
+
+def run_items(url_positions, starts, lengths):
+    # The (URL, x, y) items of runs: the window holds one of the run's crawls
+    return url_positions, starts + lengths - 1, starts
+
+def change_items(url_positions, statuses, starts, lengths, change_statuses):
+    # The (URL, x, y) items of changes (runs with a status of change_statuses): the window
+    # holds the change and the response before it. Also whether a missing query lies
+    # between the two, which makes the item redundant next to that query's run item
+    run_positions = np.arange(len(statuses))
+
+    def last_before(mask):
+        # Position of the last run before each run matching mask, or -1
+        last = np.maximum.accumulate(np.where(mask, run_positions, -1))
+        return np.concatenate([[-1], last[:-1]])
+
+    changes = np.flatnonzero(np.isin(statuses, change_statuses))
+    # A change always follows a response of the same URL
+    previous_responses = last_before(np.isin(statuses, RESPONDED_STATUSES))[changes]
+    previous_missing = last_before(np.isin(statuses, MISSING_STATUSES))[changes]
+
+    response_ends = starts[previous_responses] + lengths[previous_responses] - 1
+    return (url_positions[changes], response_ends, starts[changes]), previous_missing > previous_responses
+
+def merged_content_items(content_ids, starts, lengths):
+    # The (content, x, y) items of the crawls each content was returned in, overlapping
+    # runs of different URLs merged
+    returned = content_ids >= 0
+    (content_ids, starts, ends) = (content_ids[returned], starts[returned], starts[returned] + lengths[returned] - 1)
+    order = np.lexsort((starts, content_ids))
+    (content_ids, starts, ends) = (content_ids[order], starts[order], ends[order])
+    if len(content_ids) == 0:
+        return content_ids, ends, starts
+
+    # Running maximum end within each content, kept apart by a per-content offset
+    offset = content_ids.astype(np.int64) * (int(ends.max()) + 2)
+    running_ends = np.maximum.accumulate(ends + offset) - offset
+    heads = np.ones(len(content_ids), dtype=bool)
+    heads[1:] = (content_ids[1:] != content_ids[:-1]) | (starts[1:] > running_ends[:-1])
+    heads = np.flatnonzero(heads)
+    merged_ends = running_ends[np.append(heads[1:], len(content_ids)) - 1]
+    return content_ids[heads], merged_ends, starts[heads]
+
+class WindowIndex:
+    # Per-crawl prefix sums of a network's totals and the dominance tables of its runs
+
+    def __init__(self, crawl_times, prefix_sums, tables):
+        self.crawl_times = crawl_times
+        self.prefix_sums = prefix_sums  # { name : running sums, starting at 0 }
+        self.tables = tables            # { name : dominance_table }
+
+    @property
+    def num_crawls(self):
+        return len(self.crawl_times)
+
+    def crawl_range(self, start_time=None, end_time=None):
+        # (a, b) positions of the first and last crawls from start_time to end_time (crawl
+        # time literals or milliseconds; None for the first or last crawl)
+        if isinstance(start_time, str):
+            start_time = parse_crawl_time(start_time)
+        if isinstance(end_time, str):
+            end_time = parse_crawl_time(end_time)
+        a = 0 if start_time is None else bisect.bisect_left(self.crawl_times, start_time)
+        b = self.num_crawls - 1 if end_time is None else bisect.bisect_right(self.crawl_times, end_time) - 1
+        if a > b:
+            raise ValueError("No crawls between %s and %s" % (
+                "the first crawl" if start_time is None else format_crawl_time(start_time),
+                "the last crawl" if end_time is None else format_crawl_time(end_time)))
+        return a, b
+
+    def totals(self, starts, ends):
+        # { WINDOW_COUNTS or WINDOW_FRACTIONS name : value } of the windows of crawls
+        # starts[i] through ends[i], as arrays (or scalars for scalar starts and ends)
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+        if np.any(starts > ends) or np.any(starts < 0) or np.any(ends >= self.num_crawls):
+            raise ValueError("Windows must run forward within the %d crawls" % self.num_crawls)
+
+        def window_sum(name):
+            return self.prefix_sums[name][ends + 1] - self.prefix_sums[name][starts]
+
+        totals = { name : self.tables[name][starts, ends].astype(np.int64) for name in self.tables }
+        totals["num_crawls"] = ends - starts + 1
+        for name in ["num_new_urls", "num_abandoned", "num_new_contents", "num_resolves", "num_breaks"]:
+            totals[name] = window_sum(name)
+
+        # A URL could change at each of its responses in the window but the first. (report.txt
+        # also takes one away for each URL that never responded)
+        max_num_content_changes = totals["num_resolves"] - totals["num_responded"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            totals["percent_responsive"] = 1 - totals["num_unresponsive"] / totals["num_urls"]
+            totals["percent_stable"] = 1 - totals["num_unstable"] / totals["num_responded"]
+            totals["percent_reliable"] = 1 - totals["num_unreliable"] / totals["num_urls"]
+            totals["break_rate"] = totals["num_breaks"] / (totals["num_resolves"] + totals["num_breaks"])
+            totals["change_rate"] = totals["num_content_changes"] / max_num_content_changes
+            totals["revert_rate"] = totals["num_reverts"] / max_num_content_changes
+        return { name : totals[name] for name in WINDOW_COUNTS + WINDOW_FRACTIONS }
+
+    def running_frame(self, start, end):
+        # crawl_totals_df's percentages and running totals over crawls start through end,
+        # each row the window from start to its crawl
+        import pandas as pd
+        from .totals import crawl_time_index
+        ends = np.arange(start, end + 1)
+        totals = self.totals(np.full(len(ends), start), ends)
+        return pd.DataFrame({
+            "Total URLs" : totals["num_urls"],
+            "Total Contents" : totals["num_contents"],
+            "Percent Responsive" : totals["percent_responsive"],
+            "Percent Stable" : totals["percent_stable"],
+            "Percent Reliable" : totals["percent_reliable"],
+        }, index=crawl_time_index(self.crawl_times[start:end + 1]))
+
+    def rolling_windows(self, window_ms):
+        # (starts, ends) of the window of crawls within window_ms before each crawl
+        crawl_times = np.asarray(self.crawl_times, dtype=np.int64)
+        return np.searchsorted(crawl_times, crawl_times - window_ms, side="left"), np.arange(self.num_crawls)
+
+def build_window_index(lifetimes, totals, crawl_times):
+    # WindowIndex of the runs of a LifetimeStore or LifetimeMatrix and its LifetimeTotals
+    num_crawls = len(crawl_times)
+
+    def prefix_sum(values):
+        return np.concatenate([[0], np.cumsum(values, dtype=np.int64)])
+
+    status_totals = np.asarray(totals.crawl_status_totals)
+    prefix_sums = {
+        "num_new_urls" : prefix_sum(totals.crawl_url_totals),
+        "num_abandoned" : prefix_sum(totals.crawl_abandoned_totals),
+        "num_new_contents" : prefix_sum(totals.crawl_content_totals),
+        "num_resolves" : prefix_sum(status_totals[:, RESPONDED_STATUSES].sum(axis=1)),
+        "num_breaks" : prefix_sum(status_totals[:, Status.BECAME_UNRESPONSIVE.value]),
+    }
+
+    (url_positions, statuses, content_ids, starts, lengths) = lifetimes.runs()
+
+    def runs_table(status_values):
+        runs = np.flatnonzero(np.isin(statuses, status_values))
+        return dominance_table(*run_items(url_positions[runs], starts[runs], lengths[runs]), num_crawls)
+
+    (changes, redundant) = change_items(url_positions, statuses, starts, lengths, CHANGE_STATUSES)
+    (reverts, _) = change_items(url_positions, statuses, starts, lengths, [Status.OLD_CONTENT.value])
+
+    # A URL is unreliable in a window holding a missing query or a change. Changes with a
+    # missing query between them and the response before are left out: a window holding
+    # the change holds the missing query too, and leaving them out keeps x and y growing
+    missing_runs = np.flatnonzero(np.isin(statuses, MISSING_STATUSES))
+    missing = run_items(url_positions[missing_runs], starts[missing_runs], lengths[missing_runs])
+    unreliable = [np.concatenate([missing[i], changes[i][~redundant]]) for i in range(3)]
+    order = np.lexsort((unreliable[1], unreliable[0]))
+
+    def distinct(items):
+        # Count every item, not every URL with one
+        return (np.arange(len(items[0])),) + tuple(items[1:])
+
+    tables = {
+        "num_urls" : runs_table([status.value for status in Status if status != Status.UNKNOWN]),
+        "num_responded" : runs_table(RESPONDED_STATUSES),
+        "num_unresponsive" : runs_table(MISSING_STATUSES),
+        "num_unstable" : dominance_table(*changes, num_crawls),
+        "num_unreliable" : dominance_table(*[items[order] for items in unreliable], num_crawls),
+        "num_contents" : dominance_table(*merged_content_items(content_ids, starts, lengths), num_crawls),
+        "num_content_changes" : dominance_table(*distinct(changes), num_crawls),
+        "num_reverts" : dominance_table(*distinct(reverts), num_crawls),
+    }
+    return WindowIndex(list(crawl_times), prefix_sums, tables)
+
+def write_window_table(index, starts, ends, file):
+    # Writes one TSV row per window: its first and last crawl times, then its totals
+    totals = index.totals(starts, ends)
+    file.write("\t".join(["start_crawl", "end_crawl"] + WINDOW_COUNTS + WINDOW_FRACTIONS) + "\n")
+    for i in range(len(starts)):
+        file.write("\t".join(
+            [format_crawl_time(index.crawl_times[starts[i]]), format_crawl_time(index.crawl_times[ends[i]])]
+            + ["%d" % totals[name][i] for name in WINDOW_COUNTS]
+            + ["%.4f" % totals[name][i] for name in WINDOW_FRACTIONS]) + "\n")
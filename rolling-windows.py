@@ -0,0 +1,50 @@
+# Usage:
+#   python rolling-windows.py --input network.tsv.bz2 --window-days 182 > windows.tsv
+#   python rolling-windows.py --nquads --query-shape idigbio --input prov.nq.bz2 --output windows.tsv
+#
+# Reads a network's rows once, builds its lifetimes and a WindowIndex, and writes one TSV
+# row per crawl with report.txt's numbers over the window of crawls from --window-days
+# before it up to it: URLs queried, new and abandoned, distinct and new contents, URLs
+# unresponsive, unstable and unreliable in the window, and the percentages and rates.
+# Windows are answered from the index, without rebuilding any lifetime.
+
+import sys
+import argparse
+
+import linkrot
+
+parser = argparse.ArgumentParser(description="Write report.txt's numbers over a rolling window of crawls, one TSV row per crawl.")
+parser.add_argument("-i", "--input", dest="input_paths", action="append", default=[], metavar="PATH",
+    help="read rows from PATH (repeatable) instead of stdin")
+parser.add_argument("--nquads", action="store_true",
+    help="inputs are Preston provenance logs rather than query output")
+parser.add_argument("--query-shape", choices=list(linkrot.NQUADS_QUERY_SHAPES),
+    help="with --nquads, which select-*-by-activity.rq query to follow")
+parser.add_argument("--engine", choices=linkrot.LIFETIME_ENGINES, default="loop",
+    help="lifetime engine (default: loop)")
+parser.add_argument("--window-days", type=float, default=182, metavar="DAYS",
+    help="length of each window, ending at its crawl (default: 182)")
+parser.add_argument("-o", "--output", metavar="PATH",
+    help="write the TSV to PATH instead of stdout")
+args = parser.parse_args()
+if args.nquads and args.query_shape is None:
+    parser.error("--nquads needs --query-shape")
+if args.window_days < 0:
+    parser.error("--window-days cannot be negative")
+
+analysis = linkrot.analyze(
+    args.input_paths,
+    ingest_mode="stream",
+    lifetime_engine=args.engine,
+    input_format="nquads" if args.nquads else "tsv",
+    query_shape=args.query_shape,
+)
+index = linkrot.build_window_index(analysis.lifetimes, analysis.totals, analysis.crawl_times)
+starts, ends = index.rolling_windows(round(args.window_days * 24 * 60 * 60 * 1000))
+
+output = open(args.output, "w") if args.output else sys.stdout
+try:
+    linkrot.write_window_table(index, starts, ends, output)
+finally:
+    if args.output:
+        output.close()
@@ -0,0 +1,184 @@
+# Usage:
+#   python run-benchmarks.py --scales 10k,100k,1M --output benchmark.json
+#   python run-benchmarks.py --baseline previous-benchmark.json
+#
+# Generates synthetic crawl histories of about each given number of rows (see
+# generate-crawl-history.py) and times ingest, lifetime building, aggregation and figure
+# rendering separately for each ingest mode and lifetime engine. Each configuration runs
+# in its own process so its peak memory can be recorded. Results are written as JSON;
+# with --baseline, stages that got slower than an earlier run are reported and the exit
+# status is 1.
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import resource
+import importlib
+import tempfile
+import subprocess
+import multiprocessing
+
+import numpy as np
+
+import linkrot
+from linkrot.analysis import build_lifetime_store
+from linkrot.synthetic import CrawlHistoryParameters, rows_per_url, write_crawl_history
+
+SCALES = "10k,100k,1M"
+CONFIGURATIONS = ["dict/loop", "stream/loop", "stream/matrix"]
+STAGES = ["ingest", "lifetimes", "aggregation", "rendering"]
+
+# Stages faster than this are too noisy to compare against a baseline
+MIN_COMPARED_SECONDS = 0.05
+
+SCALE_UNITS = { "" : 1, "K" : 10 ** 3, "M" : 10 ** 6, "G" : 10 ** 9 }
+
+def parse_scale(text):
+    # "10k", "1.5M" or a number of rows
+    text = text.strip().upper()
+    unit = text[-1:] if text[-1:] in SCALE_UNITS else ""
+    return int(float(text[:len(text) - len(unit)]) * SCALE_UNITS[unit])
+
+def run_configuration(task):
+    # Times each stage of one configuration on one input. Runs in a fresh process
+    (input_path, configuration, render, usetex) = task
+    (ingest_mode, lifetime_engine) = configuration.split("/")
+    seconds = dict()
+
+    # Imports are not part of any stage
+    importlib.import_module("pandas")
+    if render:
+        importlib.import_module("matplotlib.pyplot")
+
+    def stage(name, start):
+        seconds[name] = round(time.perf_counter() - start, 4)
+        return time.perf_counter()
+
+    start = time.perf_counter()
+    if ingest_mode == "dict":
+        all_url_queries, crawl_times = linkrot.read_url_queries(linkrot.read_input_rows([input_path]))
+    else:
+        observations = linkrot.read_observations(linkrot.read_input_rows([input_path]))
+        crawl_times = observations.crawl_times
+    start = stage("ingest", start)
+
+    if lifetime_engine == "matrix" and ingest_mode == "dict":
+        lifetime_matrix = linkrot.build_lifetime_matrix(all_url_queries, crawl_times)
+    elif lifetime_engine == "matrix":
+        lifetime_matrix = linkrot.build_lifetime_matrix_from_observations(observations)
+    elif ingest_mode == "dict":
+        lifetime_store = build_lifetime_store(
+            ((url, all_url_queries[url]) for url in all_url_queries), list(all_url_queries), crawl_times)
+    else:
+        lifetime_store = build_lifetime_store(observations.url_queries(), observations.urls, crawl_times)
+    start = stage("lifetimes", start)
+
+    lifetime_totals = linkrot.lifetime_totals_from_columns(lifetime_matrix if lifetime_engine == "matrix" else lifetime_store, len(crawl_times))
+    frames = linkrot.crawl_frames(lifetime_totals, crawl_times)
+    start = stage("aggregation", start)
+
+    if render:
+        with tempfile.TemporaryDirectory(prefix="linkrot-benchmark-") as output_directory:
+            linkrot.build_figures(lifetime_totals, crawl_times, "Benchmark", output_directory, usetex=usetex,
+                status_counts_per_crawl=True, status_counts_over_time=True, unstable_histogram=True, unavailable_histogram=True,
+                frames=frames)
+        start = stage("rendering", start)
+
+    return {
+        "configuration" : configuration,
+        "num_urls" : lifetime_totals.total_num_urls,
+        "num_crawls" : len(crawl_times),
+        "seconds" : seconds,
+        "peak_memory_mb" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_to_baseline(results, baseline, tolerance):
+    # Prints each stage's time relative to the baseline and returns the number of stages
+    # more than tolerance slower
+    baseline_results = { (result["scale"], result["configuration"]) : result for result in baseline["results"] }
+    num_regressions = 0
+    for result in results:
+        baseline_result = baseline_results.get((result["scale"], result["configuration"]))
+        if baseline_result is None:
+            continue
+        for stage in STAGES:
+            seconds = result["seconds"].get(stage)
+            baseline_seconds = baseline_result["seconds"].get(stage)
+            if seconds is None or baseline_seconds is None or baseline_seconds < MIN_COMPARED_SECONDS:
+                continue
+            ratio = seconds / baseline_seconds
+            regressed = ratio > 1 + tolerance
+            num_regressions += regressed
+            print("%-6s %-14s %-12s %8.3fs -> %8.3fs  %5.2fx%s"
+                % (result["scale"], result["configuration"], stage, baseline_seconds, seconds, ratio, "  SLOWER" if regressed else ""))
+    return num_regressions
+
+parser = argparse.ArgumentParser(description="Time each stage of the analysis on synthetic crawl histories.")
+parser.add_argument("--scales", default=SCALES, metavar="ROWS,...",
+    help="approximate numbers of rows to benchmark, e.g. 10k,100k,1M,10M (default: %s)" % SCALES)
+parser.add_argument("--configurations", default=",".join(CONFIGURATIONS), metavar="MODE/ENGINE,...",
+    help="ingest mode/lifetime engine pairs to run (default: %s)" % ",".join(CONFIGURATIONS))
+parser.add_argument("--crawls", dest="num_crawls", type=int, default=CrawlHistoryParameters().num_crawls, metavar="N")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--no-render", action="store_true", help="skip the figure rendering stage")
+parser.add_argument("--latex", action="store_true", help="typeset figure text with LaTeX when rendering")
+parser.add_argument("--output", default="benchmark.json", metavar="PATH", help="where to write the JSON results")
+parser.add_argument("--baseline", metavar="PATH", help="JSON results of an earlier run to compare against")
+parser.add_argument("--tolerance", type=float, default=0.25,
+    help="with --baseline, the fraction by which a stage may be slower before it counts as a regression")
+args = parser.parse_args()
+
+parameters = CrawlHistoryParameters(num_crawls=args.num_crawls, seed=args.seed)
+url_rows = rows_per_url(parameters)
+
+results = []
+with tempfile.TemporaryDirectory(prefix="linkrot-benchmark-") as input_directory:
+    for scale in args.scales.split(","):
+        parameters.num_urls = max(1, int(parse_scale(scale) / url_rows))
+        input_path = os.path.join(input_directory, "synthetic-%s.tsv" % scale)
+        num_rows = write_crawl_history(parameters, input_path)
+        print("%s: %d rows, %d URLs, %d crawls" % (scale, num_rows, parameters.num_urls, parameters.num_crawls))
+
+        for configuration in args.configurations.split(","):
+            # A new process for each configuration, so that peak memory is its own
+            with multiprocessing.get_context("fork").Pool(1, maxtasksperchild=1) as pool:
+                result = pool.apply(run_configuration, [(input_path, configuration, not args.no_render, args.latex)])
+            result["scale"] = scale
+            result["num_rows"] = num_rows
+            results.append(result)
+            print("\t%-14s %s  peak %d MB" % (configuration,
+                "  ".join("%s %.3fs" % (stage, result["seconds"][stage]) for stage in STAGES if stage in result["seconds"]),
+                result["peak_memory_mb"]))
+
+        os.remove(input_path)
+
+benchmark = {
+    "created" : datetime.datetime.now().isoformat(timespec="seconds"),
+    "commit" : git_commit(),
+    "python" : platform.python_version(),
+    "numpy" : np.__version__,
+    "platform" : platform.platform(),
+    "num_cpus" : os.cpu_count(),
+    "parameters" : { name : value for (name, value) in parameters.as_dict().items() if name != "num_urls" },
+    "results" : results,
+}
+with open(args.output, "w") as file:
+    json.dump(benchmark, file, indent=1)
+print("Wrote %s" % args.output)
+
+if args.baseline:
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+    if compare_to_baseline(results, baseline, args.tolerance) > 0:
+        sys.exit(1)
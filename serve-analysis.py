@@ -0,0 +1,84 @@
+# Usage:
+#   python serve-analysis.py --network iDigBio=idigbio.tsv.bz2 --network GBIF=gbif.tsv.bz2 --port 8470
+#   python serve-analysis.py --nquads --network iDigBio=prov.nq.bz2 --socket /tmp/linkrot.sock
+#
+# Reads each network's rows once, keeps their lifetimes in memory, and answers JSON queries
+# over HTTP until interrupted (see linkrot/service.py for every endpoint), e.g.
+#   curl -G localhost:8470/url --data-urlencode network=iDigBio --data-urlencode 'url=<https://...>'
+#   curl -G localhost:8470/hosts --data-urlencode network=iDigBio --data-urlencode host=ipt.example.org
+#   curl 'localhost:8470/window?network=iDigBio&start=2019-09-01T00:00:00Z&end=2020-01-01T00:00:00Z'
+#   curl 'localhost:8470/figure?network=iDigBio&name=reliability-over-time&start=2019-09-01T00:00:00Z' > reliability.png
+#   curl --unix-socket /tmp/linkrot.sock localhost/networks
+# Each query's indexes are built the first time it is asked about a network; figures are
+# drawn on demand and the last --figure-cache-size kept.
+
+import argparse
+
+import linkrot
+
+parser = argparse.ArgumentParser(description="Serve queries about networks' lifetimes, kept in memory, as JSON over HTTP.")
+parser.add_argument("-n", "--network", dest="networks", action="append", default=[], metavar="NAME=PATH",
+    help="read network NAME's rows from PATH (repeatable, also to give a network several inputs)")
+parser.add_argument("--nquads", action="store_true",
+    help="inputs are Preston provenance logs rather than query output")
+parser.add_argument("--query-shape", choices=list(linkrot.NQUADS_QUERY_SHAPES),
+    help="with --nquads, which select-*-by-activity.rq query to follow (default: the network's name, lowercased)")
+parser.add_argument("--engine", choices=linkrot.LIFETIME_ENGINES, default="loop",
+    help="lifetime engine (default: loop)")
+parser.add_argument("--no-content-index", action="store_true",
+    help="skip indexing contents, and so the content-migrations figure")
+parser.add_argument("--host", default="127.0.0.1",
+    help="address to listen on (default: 127.0.0.1)")
+parser.add_argument("--port", type=int, default=linkrot.DEFAULT_PORT,
+    help="port to listen on (default: %d)" % linkrot.DEFAULT_PORT)
+parser.add_argument("--socket", metavar="PATH",
+    help="listen on the Unix socket PATH instead of a port")
+parser.add_argument("--figure-cache-size", type=int, default=64, metavar="N",
+    help="number of drawn figures to keep (default: 64)")
+parser.add_argument("--dpi", type=int, default=150,
+    help="resolution of drawn figures (default: 150)")
+parser.add_argument("--usetex", action="store_true",
+    help="typeset pdf figures with LaTeX, as build-figures.py does")
+parser.add_argument("--quiet", action="store_true",
+    help="do not log each request")
+args = parser.parse_args()
+
+network_inputs = dict()
+for network in args.networks:
+    name, separator, path = network.partition("=")
+    if not separator or not name or not path:
+        parser.error("--network takes NAME=PATH, not %s" % network)
+    network_inputs.setdefault(name, []).append(path)
+if not network_inputs:
+    parser.error("give at least one --network")
+query_shapes = None
+if args.nquads:
+    query_shapes = { network : args.query_shape or network.lower() for network in network_inputs }
+    for (network, query_shape) in query_shapes.items():
+        if query_shape not in linkrot.NQUADS_QUERY_SHAPES:
+            parser.error("%s has no query shape of its own; give --query-shape" % network)
+if args.socket is not None:
+    # Before reading any rows, which may take a while
+    try:
+        linkrot.check_socket_path(args.socket)
+    except ValueError as error:
+        parser.error(str(error))
+if args.figure_cache_size < 0:
+    parser.error("--figure-cache-size cannot be negative")
+
+batch = linkrot.analyze_networks(
+    network_inputs,
+    lifetime_engine=args.engine,
+    input_format="nquads" if args.nquads else "tsv",
+    query_shapes=query_shapes,
+    index_contents=not args.no_content_index,
+)
+service = linkrot.AnalysisService(batch.analyses, figure_cache_size=args.figure_cache_size, dpi=args.dpi, usetex=args.usetex)
+server = linkrot.make_server(service, args.host, args.port, args.socket, quiet=args.quiet)
+print("Serving %s on %s" % (", ".join(network_inputs), args.socket or "http://%s:%d" % server.server_address[:2]), flush=True)
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    server.server_close()
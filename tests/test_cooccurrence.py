@@ -0,0 +1,52 @@
+# Duplicate clusters: URLs linked, directly or through other URLs, by content they share
+
+import time
+import unittest
+
+import numpy as np
+
+from linkrot.cooccurrence import build_content_index, duplicate_clusters
+
+def content_index(url_contents, num_contents):
+    # ContentIndex of (URL position, content ID) pairs, each returned in one crawl
+    (url_positions, content_ids) = (np.array(column, dtype=np.int32) for column in zip(*url_contents))
+    ones = np.ones(len(url_positions), dtype=np.int32)
+    return build_content_index(url_positions, content_ids, np.zeros(len(url_positions), dtype=np.int32), ones, num_contents)
+
+def brute_force_clusters(url_contents, num_urls):
+    labels = list(range(num_urls))
+    changed = True
+    while changed:
+        changed = False
+        for (url, content) in url_contents:
+            for (other_url, other_content) in url_contents:
+                if content == other_content and labels[other_url] < labels[url]:
+                    labels[url] = labels[other_url]
+                    changed = True
+    return labels
+
+class DuplicateClustersTest(unittest.TestCase):
+
+    def test_clusters(self):
+        # URLs 0, 3 and 5 share contents through 3; 1 and 4 share one; 2 and 6 share none
+        url_contents = [(0, 0), (3, 0), (3, 1), (5, 1), (4, 2), (1, 2), (2, 3), (6, 4), (5, 5)]
+        (url_labels, content_labels) = duplicate_clusters(content_index(url_contents, 7), 7)
+        self.assertEqual(url_labels.tolist(), brute_force_clusters(url_contents, 7))
+        self.assertEqual(url_labels.tolist(), [0, 1, 2, 0, 1, 0, 6])
+        self.assertEqual(content_labels.tolist(), [0, 0, 1, 2, 6, 0, -1])
+
+    def test_long_chain(self):
+        # URL i shares content i with URL i + 1, numbered so that labels zig-zag along the
+        # chain: each round of label propagation would only move the smallest label one link
+        num_urls = 100000
+        order = np.concatenate([np.arange(0, num_urls, 2), np.arange(num_urls - 1 - num_urls % 2, 0, -2)])
+        url_contents = [(int(order[i + j]), i) for i in range(num_urls - 1) for j in (0, 1)]
+
+        start = time.perf_counter()
+        (url_labels, content_labels) = duplicate_clusters(content_index(url_contents, num_urls - 1), num_urls)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertTrue(np.all(url_labels == 0))
+        self.assertTrue(np.all(content_labels == 0))
+
+if __name__ == "__main__":
+    unittest.main()
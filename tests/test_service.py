@@ -0,0 +1,154 @@
+# The analysis service over HTTP: each endpoint's answer, and the status of each kind of error
+
+import os
+import json
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import linkrot
+
+HEADER = "?dataset_url\t?dataset_content\t?crawl_date\n"
+
+def row(url, content, month):
+    return "<https://host%d.example.org/ipt/eml.do?r=ds%d>\t%s\t\"2019-%02d-01T00:00:00.000Z\"^^<http://www.w3.org/2001/XMLSchema#dateTime>\n" % (
+        url % 3, url, content, month)
+
+def content(i):
+    return "<hash://sha256/%064x>" % i
+
+def failed(i):
+    return "<https://deeplinker.bio/.well-known/genid/%d>" % i
+
+# Eight URLs over six monthly crawls: changes, breaks, and two URLs sharing a content
+ROWS = [
+    row(url, failed(url * 10 + month) if (url + month) % 4 == 0 else content(1 if url in (6, 7) else url * 10 + month // 3), month)
+    for url in range(8) for month in range(1, 7)
+]
+
+class ServiceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.directory.name, "rows.tsv")
+        with open(path, "w") as file:
+            file.write(HEADER + "".join(ROWS))
+        cls.analysis = linkrot.analyze_networks({ "Test" : [path] }, index_contents=True).analyses["Test"]
+        cls.service = linkrot.AnalysisService({ "Test" : cls.analysis }, figure_cache_size=2, dpi=50)
+        cls.server = linkrot.make_server(cls.service, port=0, quiet=True)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.directory.cleanup()
+
+    def get(self, path, **parameters):
+        # (status, content type, body) of a GET of path
+        url = "http://127.0.0.1:%d%s?%s" % (self.server.server_address[1], path, urllib.parse.urlencode(parameters, doseq=True))
+        try:
+            with urllib.request.urlopen(url) as response:
+                return (response.status, response.headers["Content-Type"], response.read())
+        except urllib.error.HTTPError as error:
+            return (error.code, error.headers["Content-Type"], error.read())
+
+    def get_json(self, path, expected_status=200, **parameters):
+        (status, content_type, body) = self.get(path, **parameters)
+        self.assertEqual((status, content_type), (expected_status, "application/json"), body)
+        return json.loads(body)
+
+    def test_networks(self):
+        (network,) = self.get_json("/networks")["networks"]
+        self.assertEqual(network["network"], "Test")
+        self.assertEqual(network["num_urls"], 8)
+        self.assertEqual(network["num_crawls"], 6)
+        self.assertEqual((network["first_crawl"], network["last_crawl"]), ("2019-01-01T00:00:00.000Z", "2019-06-01T00:00:00.000Z"))
+
+    def test_url(self):
+        url = self.analysis.lifetimes.urls[3]
+        timeline = self.get_json("/url", network="Test", url=url)
+        self.assertEqual(timeline["url"], url)
+        self.assertEqual(sum(run["num_crawls"] for run in timeline["runs"]), 6)
+        self.assertEqual(timeline["runs"][0]["first_crawl"], "2019-01-01T00:00:00.000Z")
+
+    def test_hosts(self):
+        hosts = self.get_json("/hosts", network="Test", limit=2)["hosts"]
+        self.assertEqual(len(hosts), 2)
+        response = self.get_json("/hosts", network="Test", host=["host0.example.org", "host1.example.org"])
+        self.assertEqual(response["total"]["host"], "host0.example.org+host1.example.org")
+        self.assertEqual(response["total"]["num_urls"], sum(host["num_urls"] for host in response["hosts"]))
+
+    def test_window(self):
+        window = self.get_json("/window", network="Test", start="2019-02-01T00:00:00Z", end="2019-04-01T00:00:00Z")
+        self.assertEqual((window["first_crawl"], window["last_crawl"]), ("2019-02-01T00:00:00.000Z", "2019-04-01T00:00:00.000Z"))
+        self.assertIn("report", window)
+        whole = self.get_json("/window", network="Test")
+        self.assertEqual(whole["last_crawl"], "2019-06-01T00:00:00.000Z")
+        error = self.get_json("/window", 400, network="Test", start="2030-01-01T00:00:00Z")["error"]
+        self.assertEqual(error, "No crawls between 2030-01-01T00:00:00.000Z and the last crawl")
+
+    def test_figure(self):
+        (status, content_type, png) = self.get("/figure", network="Test", name="reliability-over-time")
+        self.assertEqual((status, content_type), (200, "image/png"))
+        self.assertTrue(png.startswith(b"\x89PNG"))
+        self.assertEqual(self.get("/figure", network="Test", name="reliability-over-time")[2], png)
+
+        (status, content_type, pdf) = self.get("/figure", network="Test", name="reliability-over-time", format="pdf", variant="bare")
+        self.assertEqual((status, content_type), (200, "application/pdf"))
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+    def test_bad_arguments(self):
+        for (path, parameters) in [
+            ("/hosts", { "network" : "Test", "limit" : -1 }),
+            ("/hosts", { "network" : "Test", "path_depth" : -1 }),
+            ("/hosts", { "network" : "Test", "limit" : "many" }),
+            ("/window", { "network" : "Test", "start" : "garbage" }),
+            ("/window", { "network" : "Test", "start" : "2030-01-01T00:00:00Z" }),
+            ("/url", { "network" : "Test" }),
+            ("/figure", { "network" : "Test", "name" : "reliability-over-time", "format" : "gif" }),
+        ]:
+            self.assertIn("error", self.get_json(path, 400, **parameters), (path, parameters))
+
+    def test_not_found(self):
+        for (path, parameters) in [
+            ("/networks/all", {}),
+            ("/window", { "network" : "Unknown" }),
+            ("/url", { "network" : "Test", "url" : "<https://nowhere.example.org/>" }),
+            ("/hosts", { "network" : "Test", "host" : "nowhere.example.org" }),
+            ("/figure", { "network" : "Test", "name" : "no-such-figure" }),
+        ]:
+            self.assertIn("error", self.get_json(path, 404, **parameters), (path, parameters))
+
+    def test_server_error(self):
+        # A failure that is not the client's keeps the server up
+        service = linkrot.AnalysisService({ "Test" : self.analysis })
+        service.networks = lambda: {}["networks"]
+        server = linkrot.make_server(service, port=0, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = "http://127.0.0.1:%d/networks" % server.server_address[1]
+            for _ in range(2):
+                with self.assertRaises(urllib.error.HTTPError) as context:
+                    urllib.request.urlopen(url)
+                self.assertEqual(context.exception.code, 500)
+                self.assertEqual(json.loads(context.exception.read())["error"], "KeyError: 'networks'")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_socket_path(self):
+        path = os.path.join(self.directory.name, "not-a-socket")
+        with open(path, "w") as file:
+            file.write("kept")
+        with self.assertRaises(ValueError):
+            linkrot.make_server(self.service, socket_path=path)
+        with open(path) as file:
+            self.assertEqual(file.read(), "kept")
+
+if __name__ == "__main__":
+    unittest.main()
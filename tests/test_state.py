@@ -0,0 +1,67 @@
+# Appending crawls to a saved analysis totals the same as analyzing the whole history
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import linkrot
+
+HEADER = "?dataset_url\t?dataset_content\t?crawl_date\n"
+
+def row(url, content, day):
+    return "<https://host%d.example.org/ipt/eml.do?r=ds%d>\t%s\t\"2019-01-%02dT00:00:00.000Z\"^^<http://www.w3.org/2001/XMLSchema#dateTime>\n" % (
+        url % 3, url, content, day)
+
+def content(i):
+    return "<hash://sha256/%064x>" % i
+
+def failed(i):
+    return "<https://deeplinker.bio/.well-known/genid/%d>" % i
+
+# Six URLs over four crawls: changes, a revert, breaks and a URL first seen late
+HISTORY = [
+    row(url, failed(url * 10 + day) if (url + day) % 5 == 0 else content(url * 10 + (day % 2 if url == 2 else day // 3)), day)
+    for url in range(6) for day in range(1, 5) if not (url == 5 and day < 3)
+]
+
+class AppendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, rows):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as file:
+            file.write(HEADER + "".join(rows))
+        return path
+
+    def check_append(self, appended_rows, num_workers=1):
+        history_path = self.write("history.tsv", HISTORY)
+        appended_path = self.write("appended.tsv", appended_rows)
+        state_directory = os.path.join(self.directory.name, "analysis-state")
+
+        linkrot.analyze([history_path], "stream", "matrix", num_workers=num_workers, state_directory=state_directory)
+        appended = linkrot.analyze([appended_path], "stream", "matrix", state_directory=state_directory, append=True)
+        full = linkrot.analyze([self.write("full.tsv", HISTORY + appended_rows)], "stream", "matrix")
+
+        self.assertEqual(appended.crawl_times, full.crawl_times)
+        self.assertEqual(linkrot.text_report(appended.totals), linkrot.text_report(full.totals))
+        self.assertEqual(np.asarray(appended.totals.crawl_status_totals).tolist(), np.asarray(full.totals.crawl_status_totals).tolist())
+
+    def test_append_crawl(self):
+        self.check_append([row(url, content(url * 10 + 7), 6) for url in range(7)])
+
+    def test_append_crawl_of_failed_queries(self):
+        # The appended crawl returned no contents at all
+        self.check_append([row(0, failed(1), 6), row(3, failed(2), 6)])
+
+    def test_append_to_state_saved_by_workers(self):
+        self.check_append([row(0, failed(1), 6)], num_workers=2)
+
+if __name__ == "__main__":
+    unittest.main()